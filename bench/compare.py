@@ -0,0 +1,87 @@
+"""Compare a benchmark run with a baseline and fail on regressions.
+
+    python -m bench.compare bench/baseline.json bench/results/latest.json [--tolerance 0.15]
+
+A configuration regresses when throughput drops, or p95/p99 latency or peak
+RSS rises, by more than the tolerance. Latency also has to move by more than
+``--min-latency-ms`` to count, so sub-millisecond jitter does not fail the
+check. Any new errors fail as well. Per-scenario p95 is printed for context
+but only checked with ``--scenarios``.
+"""
+import argparse
+import json
+import sys
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def _check(label, base, cur, tolerance, higher_is_better, floor=0.0):
+    if not base:
+        return None
+    change = (cur - base) / base
+    worse = -change if higher_is_better else change
+    if worse > tolerance and abs(cur - base) > floor:
+        return f'{label}: {base} -> {cur} ({change:+.1%})'
+    return None
+
+
+def compare(baseline, current, tolerance=0.15, min_latency_ms=2.0, scenarios=False):
+    """``(regressions, lines)`` for every configuration present in both runs."""
+    regressions, lines = [], []
+    for name, base in sorted(baseline['runs'].items()):
+        cur = current['runs'].get(name)
+        if cur is None or 'skipped' in base or 'skipped' in cur:
+            lines.append(f'{name}: not comparable (missing or skipped)')
+            continue
+        checks = [
+            _check('throughput_rps', base['throughput_rps'], cur['throughput_rps'], tolerance, True),
+            _check('p95_ms', base['latency_ms']['p95'], cur['latency_ms']['p95'], tolerance, False, min_latency_ms),
+            _check('p99_ms', base['latency_ms']['p99'], cur['latency_ms']['p99'], tolerance, False, min_latency_ms),
+            _check('peak_rss_mb', base['rss']['peak_total_mb'], cur['rss']['peak_total_mb'], tolerance, False),
+        ]
+        if cur['errors'] > base['errors']:
+            checks.append(f"errors: {base['errors']} -> {cur['errors']}")
+        detail = []
+        for scenario, sbase in sorted(base.get('scenarios', {}).items()):
+            scur = cur.get('scenarios', {}).get(scenario)
+            if scur is None:
+                continue
+            p95 = (sbase['latency_ms']['p95'], scur['latency_ms']['p95'])
+            detail.append(f'  {scenario:<18} p95 {p95[0]} -> {p95[1]} ms')
+            if scenarios:
+                checks.append(_check(f'{scenario}.p95_ms', *p95, tolerance, False, min_latency_ms))
+        failed = [c for c in checks if c]
+        lines.append(f"{name}: {'REGRESSED' if failed else 'ok'} "
+                     f"({base['throughput_rps']} -> {cur['throughput_rps']} req/s, "
+                     f"p95 {base['latency_ms']['p95']} -> {cur['latency_ms']['p95']} ms, "
+                     f"peak rss {base['rss']['peak_total_mb']} -> {cur['rss']['peak_total_mb']} MB)")
+        lines.extend(detail)
+        regressions.extend(f'{name} {c}' for c in failed)
+    return regressions, lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.compare')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative change (default 0.15)')
+    parser.add_argument('--min-latency-ms', type=float, default=2.0,
+                        help='Ignore latency changes smaller than this (default 2 ms)')
+    parser.add_argument('--scenarios', action='store_true', help='Also fail on per-scenario p95 regressions')
+    args = parser.parse_args(argv)
+
+    regressions, lines = compare(_load(args.baseline), _load(args.current), args.tolerance,
+                                 args.min_latency_ms, args.scenarios)
+    print('\n'.join(lines))
+    if regressions:
+        print('\nRegressions:\n  ' + '\n  '.join(regressions))
+        return 1
+    print('\nNo regressions.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
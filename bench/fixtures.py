@@ -0,0 +1,101 @@
+"""Seed data and request payloads for the benchmarks (deterministic per seed)."""
+import io
+import os
+import random
+
+from bench.sqlite_shim import connect, create_database
+
+STATES_CROPS = {
+    'TN': ('rice', 'banana', 'sugarcane', 'turmeric'),
+    'KA': ('ragi', 'maize', 'coffee', 'arecanut'),
+    'AP': ('chilli', 'cotton', 'groundnut', 'rice'),
+    'MH': ('onion', 'soybean', 'cotton', 'grapes'),
+}
+PASSWORD = 'bench-password'
+CHAT_QUESTIONS = (
+    'How do I get rid of aphids on chilli?',
+    'What is the price of rice in Tamil Nadu today?',
+    'When should I irrigate wheat?',
+    'neem ka tel kaise use kare',
+    'My soil is acidic, what should I add?',
+    'Will it rain tomorrow in Madurai?',
+    'How much urea for one acre of maize?',
+    'Spider mites on tomato leaves, what to spray?',
+)
+
+
+def user_email(i):
+    return f'farmer{i}@bench.local'
+
+
+def seed(db_path, schema_path, users=200, markets=12, days=90, alerts_per_user=3,
+         bcrypt_rounds=10, seed_value=7):
+    """Create the database and fill users, prices and alerts; returns row counts."""
+    import bcrypt
+
+    rnd = random.Random(seed_value)
+    create_database(db_path, schema_path)
+    conn = connect(database=db_path)
+    cursor = conn.cursor()
+    # One hash shared by all users; verify cost is what the benchmark measures
+    pw_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(bcrypt_rounds)).decode()
+    cursor.executemany(
+        'INSERT INTO users (name, email, mobile, password, preferred_language, latitude, longitude,'
+        ' tile_row, tile_col) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)',
+        [(f'Farmer {i}', user_email(i), f'98{i:08d}', pw_hash, rnd.choice(('en', 'ta', 'hi', 'te')),
+          lat, lon, round(lat / 0.1), round(lon / 0.1))
+         for i in range(users)
+         for lat, lon in [(round(rnd.uniform(8.0, 20.0), 5), round(rnd.uniform(74.0, 84.0), 5))]])
+
+    prices = []
+    for state, crops in STATES_CROPS.items():
+        for crop in crops:
+            base = rnd.uniform(1500, 9000)
+            for m in range(markets):
+                for d in range(days):
+                    modal = round(base * rnd.uniform(0.85, 1.15), 2)
+                    prices.append((state, crop, f'{state} Mandi {m:02d}', '', round(modal * 0.9, 2),
+                                   round(modal * 1.1, 2), modal, f'-{d} days'))
+    cursor.executemany(
+        'INSERT INTO market_prices (state, crop_name, market, variety, min_price, max_price,'
+        " modal_price, arrival_date) VALUES (%s, %s, %s, %s, %s, %s, %s, date('now', %s))", prices)
+
+    alerts = [(u + 1, rnd.choice(('heavy_rain', 'heat', 'high_wind')), 'Bench alert', 'moderate')
+              for u in range(users) for _ in range(alerts_per_user)]
+    cursor.executemany(
+        'INSERT INTO weather_alerts (user_id, alert_type, description, severity) VALUES (%s, %s, %s, %s)',
+        alerts)
+    cursor.close()
+    conn.close()
+    return {'users': users, 'market_prices': len(prices), 'weather_alerts': len(alerts)}
+
+
+def leaf_images(source, count=24, size=(1024, 768), quality=85, seed_value=7):
+    """Distinct JPEG payloads cut from a real photo, so uploads do not dedupe."""
+    from PIL import Image, ImageEnhance
+
+    rnd = random.Random(seed_value)
+    out = []
+    with Image.open(source) as photo:
+        photo = photo.convert('RGB')
+        for _ in range(count):
+            w = rnd.randint(size[0], min(photo.width, size[0] * 2))
+            h = int(w * size[1] / size[0])
+            x = rnd.randint(0, photo.width - w)
+            y = rnd.randint(0, photo.height - h)
+            img = photo.crop((x, y, x + w, y + h)).resize(size)
+            img = ImageEnhance.Color(img).enhance(rnd.uniform(0.6, 1.4))
+            buf = io.BytesIO()
+            img.save(buf, format='JPEG', quality=quality)
+            out.append(buf.getvalue())
+    return out
+
+
+def load_images(directory):
+    """Real field photos from ``directory`` (jpg/png), if the caller has some."""
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+    payloads = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as fh:
+            payloads.append(fh.read())
+    return payloads
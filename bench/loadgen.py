@@ -0,0 +1,236 @@
+"""Closed-loop load generator: virtual users on keep-alive connections.
+
+Each virtual user logs in once, then repeatedly picks a scenario by weight,
+sends it, and records the latency. Responses of 2xx/304 count as successes;
+anything else, and connection errors, are errors.
+"""
+import http.client
+import json
+import random
+import threading
+import time
+import uuid
+
+from bench.fixtures import CHAT_QUESTIONS, PASSWORD, STATES_CROPS, user_email
+
+# name: (weight, builder) - builders return (method, path, body, headers)
+SCENARIOS = {}
+
+
+def scenario(name, weight):
+    def register(fn):
+        SCENARIOS[name] = (weight, fn)
+        return fn
+    return register
+
+
+def _json(method, path, payload, headers=None):
+    return method, path, json.dumps(payload).encode(), dict(headers or {}, **{'Content-Type': 'application/json'})
+
+
+@scenario('login', 5)
+def _login(vu):
+    return _json('POST', '/api/login', {'email': vu.email, 'password': PASSWORD})
+
+
+@scenario('profile', 12)
+def _profile(vu):
+    return 'GET', '/api/profile', None, vu.auth
+
+
+@scenario('market_prices', 22)
+def _prices(vu):
+    state = vu.rnd.choice(list(STATES_CROPS))
+    crop = vu.rnd.choice(STATES_CROPS[state])
+    path = f'/api/market/prices?state={state}&crop={crop}'
+    headers = dict(vu.auth)
+    etag = vu.etags.get(path)
+    if etag and vu.rnd.random() < 0.5:
+        headers['If-None-Match'] = etag  # a browser revalidating its copy
+    return 'GET', path, None, headers
+
+
+@scenario('market_history', 5)
+def _history(vu):
+    state = vu.rnd.choice(list(STATES_CROPS))
+    crop = vu.rnd.choice(STATES_CROPS[state])
+    window = vu.rnd.choice((30, 90, 180))
+    return 'GET', f'/api/market/prices/history?state={state}&crop={crop}&window={window}', None, vu.auth
+
+
+@scenario('pest_detect', 5)
+def _pest(vu):
+    image = vu.rnd.choice(vu.images)
+    return 'POST', '/api/pest/detect', image, dict(vu.auth, **{'Content-Type': 'image/jpeg'})
+
+
+@scenario('soil_test', 15)
+def _soil(vu):
+    r = vu.rnd
+    return _json('POST', '/api/soil-test', {
+        'ph': round(r.uniform(4.5, 8.5), 2), 'nitrogen': round(r.uniform(0, 400), 1),
+        'phosphorus': round(r.uniform(0, 60), 1), 'potassium': round(r.uniform(50, 400), 1),
+        'organic_matter': round(r.uniform(0.2, 3), 2), 'lang': r.choice(('en', 'ta', 'hi')),
+    }, vu.auth)
+
+
+@scenario('weather_current', 14)
+def _weather(vu):
+    lat, lon = round(vu.rnd.uniform(8, 20), 3), round(vu.rnd.uniform(74, 84), 3)
+    return 'GET', f'/api/weather/current?lat={lat}&lon={lon}', None, vu.auth
+
+
+@scenario('weather_forecast', 6)
+def _forecast(vu):
+    lat, lon = round(vu.rnd.uniform(8, 20), 3), round(vu.rnd.uniform(74, 84), 3)
+    return 'GET', f'/api/weather/forecast?lat={lat}&lon={lon}', None, vu.auth
+
+
+@scenario('chatbot', 10)
+def _chat(vu):
+    message = vu.rnd.choice(CHAT_QUESTIONS)
+    if vu.rnd.random() < 0.3:
+        message = f'{message} ({uuid.UUID(int=vu.rnd.getrandbits(128)).hex[:6]})'  # cache miss
+    return _json('POST', '/api/chatbot', {'message': message}, vu.auth)
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, index, host, port, images, results, stop_at, record_after, think_ms=0, seed=0):
+        super().__init__(name=f'vu-{index}', daemon=True)
+        self.host, self.port = host, port
+        self.email = user_email(index)
+        self.images = images
+        self.results = results
+        self.stop_at = stop_at
+        self.record_after = record_after
+        self.think = think_ms / 1000
+        self.rnd = random.Random(seed * 1000 + index)
+        self.auth = {}
+        self.etags = {}
+        self.conn = None
+        names = list(SCENARIOS)
+        self._names = names
+        self._weights = [SCENARIOS[n][0] for n in names]
+
+    def _send(self, method, path, body, headers):
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                resp = self.conn.getresponse()
+                data = resp.read()
+                return resp.status, resp.getheader('ETag'), data
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def login(self):
+        status, _, data = self._send(*_login(self))
+        if status != 200:
+            raise RuntimeError(f'{self.email}: login failed with {status}: {data[:200]!r}')
+        token = json.loads(data)['data']['access_token']
+        self.auth = {'Authorization': f'Bearer {token}'}
+
+    def run(self):
+        try:
+            self.login()
+        except Exception as e:
+            self.results.error('login', repr(e))
+            return
+        while True:
+            now = time.monotonic()
+            if now >= self.stop_at:
+                break
+            name = self.rnd.choices(self._names, self._weights)[0]
+            method, path, body, headers = SCENARIOS[name][1](self)
+            started = time.perf_counter()
+            try:
+                status, etag, _ = self._send(method, path, body, headers)
+            except Exception as e:
+                if now >= self.record_after:
+                    self.results.error(name, repr(e))
+                continue
+            elapsed = time.perf_counter() - started
+            if name == 'market_prices' and etag:
+                self.etags[path] = etag
+            if now >= self.record_after:
+                self.results.add(name, elapsed, status)
+            if self.think:
+                time.sleep(self.think)
+        if self.conn is not None:
+            self.conn.close()
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+        self.error_samples = []
+
+    def add(self, name, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            counts = self.statuses.setdefault(name, {})
+            counts[status] = counts.get(status, 0) + 1
+            if not (200 <= status < 300 or status == 304):
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def error(self, name, detail):
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            if len(self.error_samples) < 20:
+                self.error_samples.append(f'{name}: {detail}')
+
+    @staticmethod
+    def _summary(samples, errors, seconds):
+        ordered = sorted(samples)
+        return {
+            'requests': len(ordered),
+            'errors': errors,
+            'throughput_rps': round(len(ordered) / seconds, 2) if seconds else 0.0,
+            'latency_ms': {
+                'mean': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+                'p50': round(_percentile(ordered, 0.50) * 1000, 3),
+                'p95': round(_percentile(ordered, 0.95) * 1000, 3),
+                'p99': round(_percentile(ordered, 0.99) * 1000, 3),
+                'max': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+            },
+        }
+
+    def summary(self, seconds):
+        with self._lock:
+            everything = [s for samples in self.latencies.values() for s in samples]
+            out = self._summary(everything, sum(self.errors.values()), seconds)
+            out['scenarios'] = {
+                name: dict(self._summary(samples, self.errors.get(name, 0), seconds),
+                           statuses={str(k): v for k, v in sorted(self.statuses.get(name, {}).items())})
+                for name, samples in sorted(self.latencies.items())
+            }
+            out['error_samples'] = list(self.error_samples)
+        return out
+
+
+def run_load(host, port, images, users=16, duration=30.0, warmup=5.0, think_ms=0, seed=0):
+    """Drive ``users`` virtual users for ``warmup + duration`` seconds."""
+    results = Results()
+    start = time.monotonic()
+    record_after = start + warmup
+    stop_at = record_after + duration
+    vus = [VirtualUser(i, host, port, images, results, stop_at, record_after, think_ms, seed)
+           for i in range(users)]
+    for vu in vus:
+        vu.start()
+    for vu in vus:
+        vu.join()
+    return results.summary(duration)
@@ -0,0 +1,262 @@
+"""Benchmark the app under gunicorn with local stand-ins for every dependency.
+
+    python -m bench.run                                  # default worker matrix
+    python -m bench.run --configs gthread:2x4,sync:4 --duration 60
+    python -m bench.run --save-baseline                  # write bench/baseline.json (local, untracked)
+    python -m bench.compare bench/baseline.json bench/results/latest.json
+
+Each configuration starts a fresh gunicorn (``app:create_app()``). It runs
+against a seeded SQLite database via ``bench.sqlite_shim``, the stub weather
+provider, the placeholder chat model and the dummy pest model. The mixed
+workload in ``bench.loadgen`` then runs against it. Reported per
+configuration: throughput, p50/p95/p99 latency (overall and per scenario), and
+the summed RSS of the master and its workers.
+
+Configurations are ``<worker class>:<workers>[x<threads>]``. gevent runs are
+skipped when gevent is not installed.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from bench.fixtures import leaf_images, load_images, seed
+from bench.loadgen import SCENARIOS, run_load
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIGS = 'sync:2,gthread:2x4,gthread:4x4,gevent:2'
+BCRYPT_ROUNDS = 10
+
+
+def parse_config(text):
+    kind, _, shape = text.partition(':')
+    workers, _, threads = (shape or '1').partition('x')
+    return {'name': text.replace(':', '-'), 'worker_class': kind,
+            'workers': int(workers), 'threads': int(threads or 1)}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    kids = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as fh:
+                    if int(fh.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        kids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return kids
+
+
+def _rss_kb(pid, field='VmRSS'):
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            for line in fh:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler(threading.Thread):
+    """Peak summed RSS of gunicorn and its workers while the load runs."""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self.last = {}
+        self._done = threading.Event()
+
+    def sample(self):
+        workers = _children(self.pid)
+        per = {pid: _rss_kb(pid) for pid in workers}
+        total = _rss_kb(self.pid) + sum(per.values())
+        self.peak_kb = max(self.peak_kb, total)
+        self.last = {'master_kb': _rss_kb(self.pid), 'workers_kb': sorted(per.values()), 'total_kb': total}
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        if not self.last:
+            self.sample()
+        return {
+            'total_mb': round(self.last['total_kb'] / 1024, 1),
+            'peak_total_mb': round(self.peak_kb / 1024, 1),
+            'master_mb': round(self.last['master_kb'] / 1024, 1),
+            'per_worker_mb': [round(kb / 1024, 1) for kb in self.last['workers_kb']],
+        }
+
+
+def app_env(workdir, db_path):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': ROOT + os.pathsep + env.get('PYTHONPATH', ''),
+        'MYSQL_CONNECTOR': 'bench.sqlite_shim:connect',
+        'MYSQL_DB': db_path,
+        'BCRYPT_ROUNDS': str(BCRYPT_ROUNDS),
+        'WEATHER_PROVIDER': 'stub',
+        'JWT_SECRET_KEY': 'bench-jwt-secret',
+        'SECRET_KEY': 'bench-secret',
+        'PEST_UPLOAD_DIR': os.path.join(workdir, 'uploads'),
+        'PEST_JOB_DIR': os.path.join(workdir, 'jobs'),
+        'WRITE_BEHIND_JOURNAL_DIR': os.path.join(workdir, 'journal'),
+        'KNOWLEDGE_INDEX_DIR': os.path.join(workdir, 'index'),
+        'CHAT_CACHE_FILE': '',
+        'PROFILE_TOKEN': '',
+    })
+    env.pop('PEST_MODEL_PATH', None)  # the dummy model keeps runs comparable
+    return env
+
+
+def start_server(config, port, env, log_path):
+    cmd = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+           '--workers', str(config['workers']), '--worker-class', config['worker_class'],
+           '--threads', str(config['threads']), '--log-level', 'warning',
+           '--error-logfile', log_path, 'app:create_app()']
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with {proc.returncode}; see {log_path}')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/health/startup', timeout=2) as resp:
+                if resp.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'gunicorn did not become ready; see {log_path}')
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_config(config, args, env, images, workdir):
+    if config['worker_class'] == 'gevent':
+        try:
+            import gevent  # noqa: F401
+        except ImportError:
+            return {'skipped': 'gevent is not installed'}
+    port = _free_port()
+    log_path = os.path.join(workdir, f"{config['name']}.log")
+    proc = start_server(config, port, env, log_path)
+    try:
+        sampler = RssSampler(proc.pid)
+        sampler.start()
+        result = run_load('127.0.0.1', port, images, users=args.users, duration=args.duration,
+                          warmup=args.warmup, think_ms=args.think_ms, seed=args.seed)
+        result['rss'] = sampler.stop()
+    finally:
+        stop_server(proc)
+    result['config'] = config
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.run')
+    parser.add_argument('--configs', default=DEFAULT_CONFIGS,
+                        help=f'Comma-separated worker configurations (default {DEFAULT_CONFIGS})')
+    parser.add_argument('--users', type=int, default=16, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds per configuration')
+    parser.add_argument('--warmup', type=float, default=5, help='Unmeasured seconds before each run')
+    parser.add_argument('--think-ms', type=float, default=0, help='Pause between a user\'s requests')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--images', help='Directory of real field photos to upload instead of crops of look3.jpg')
+    parser.add_argument('--out', default=os.path.join(ROOT, 'bench', 'results', 'latest.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='Also write bench/baseline.json')
+    parser.add_argument('--keep', action='store_true', help='Keep the working directory (DB, logs)')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='agri-bench-')
+    db_path = os.path.join(workdir, 'bench.sqlite3')
+    counts = seed(db_path, os.path.join(ROOT, 'schema.sql'), users=max(200, args.users),
+                  bcrypt_rounds=BCRYPT_ROUNDS, seed_value=args.seed)
+    images = load_images(args.images) if args.images else leaf_images(
+        os.path.join(ROOT, 'static', 'look3.jpg'), seed_value=args.seed)
+    env = app_env(workdir, db_path)
+
+    report = {
+        'meta': {
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'git': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'users': args.users,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'think_ms': args.think_ms,
+            'seed': args.seed,
+            'seeded': counts,
+            'images': len(images),
+            'scenario_weights': {name: weight for name, (weight, _) in SCENARIOS.items()},
+        },
+        'runs': {},
+    }
+    try:
+        for text in args.configs.split(','):
+            config = parse_config(text.strip())
+            print(f"-> {config['name']}", file=sys.stderr, flush=True)
+            result = run_config(config, args, env, images, workdir)
+            report['runs'][config['name']] = result
+            if 'skipped' in result:
+                print(f"   skipped: {result['skipped']}", file=sys.stderr)
+            else:
+                lat = result['latency_ms']
+                print(f"   {result['throughput_rps']} req/s  p50 {lat['p50']} ms  p95 {lat['p95']} ms  "
+                      f"p99 {lat['p99']} ms  errors {result['errors']}  rss {result['rss']['total_mb']} MB",
+                      file=sys.stderr)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f'working directory: {workdir}', file=sys.stderr)
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+    if args.save_baseline:
+        shutil.copyfile(args.out, os.path.join(ROOT, 'bench', 'baseline.json'))
+    print(args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""SQLite stand-in for ``mysql.connector`` used by the benchmarks.
+
+Point the app at it with ``MYSQL_CONNECTOR=bench.sqlite_shim:connect`` and
+``MYSQL_DB=<path to .sqlite3>``. Statements are rewritten from the MySQL
+dialect the app uses: ``%s`` placeholders, ``NOW()``/``CURRENT_DATE`` minus
+``INTERVAL n UNIT``, and ``TO_DAYS``. Connections run in WAL mode so readers
+and the write-behind flusher do not block each other.
+
+Not covered: ``ON DUPLICATE KEY UPDATE`` and temporary tables, which only the
+ingest and alert fan-out jobs use. Those jobs are not part of the benchmark.
+"""
+import datetime
+import os
+import re
+import sqlite3
+import threading
+
+_INTERVAL_RE = re.compile(
+    r'\b(NOW\(\)|CURRENT_TIMESTAMP|CURRENT_DATE)\s*-\s*INTERVAL\s+(\?|\d+)\s+(DAY|HOUR|MINUTE|SECOND)S?\b', re.I)
+_TO_DAYS_RE = re.compile(r'\bTO_DAYS\(([^()]+)\)', re.I)
+_NOW_RE = re.compile(r'\bNOW\(\)', re.I)
+
+_translated = {}
+_lock = threading.Lock()
+
+
+def _interval(match):
+    base, amount, unit = match.groups()
+    func = 'date' if base.upper() == 'CURRENT_DATE' else 'datetime'
+    return f"{func}('now', '-' || {amount} || ' {unit.lower()}s')"
+
+
+def translate(sql):
+    """MySQL statement -> SQLite statement (memoized)."""
+    out = _translated.get(sql)
+    if out is None:
+        out = sql.replace('%s', '?')
+        out = _INTERVAL_RE.sub(_interval, out)
+        out = _TO_DAYS_RE.sub(r'CAST(julianday(\1) - 1721059.5 AS INTEGER)', out)
+        out = _NOW_RE.sub('CURRENT_TIMESTAMP', out)
+        with _lock:
+            _translated[sql] = out
+    return out
+
+
+def _adapt(params):
+    return tuple(str(p) if isinstance(p, (datetime.date, datetime.datetime)) else p
+                 for p in params or ())
+
+
+class Cursor:
+    def __init__(self, conn, dictionary=False):
+        self._conn = conn
+        self._cur = conn._db.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, operation, params=None):
+        self._cur.execute(translate(operation), _adapt(params))
+        return None
+
+    def executemany(self, operation, seq_params):
+        sql = translate(operation)
+        rows = [_adapt(p) for p in seq_params]
+        if self._conn._db.in_transaction:
+            self._cur.executemany(sql, rows)
+        else:
+            # One transaction per batch, like a single multi-row INSERT in MySQL
+            self._cur.execute('BEGIN')
+            try:
+                self._cur.executemany(sql, rows)
+                self._cur.execute('COMMIT')
+            except Exception:
+                self._cur.execute('ROLLBACK')
+                raise
+        return None
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {d[0]: v for d, v in zip(self._cur.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def fetchmany(self, size=1):
+        return [self._row(r) for r in self._cur.fetchmany(size)]
+
+    def __iter__(self):
+        return (self._row(r) for r in self._cur)
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self):
+        self._cur.close()
+
+
+class Connection:
+    def __init__(self, path, autocommit=True):
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                   isolation_level=None,
+                                   detect_types=sqlite3.PARSE_DECLTYPES)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._autocommit = True
+        self.autocommit = autocommit
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if not value and self._autocommit:
+            self._db.execute('BEGIN')
+        elif value and self._db.in_transaction:
+            self._db.execute('COMMIT')
+        self._autocommit = bool(value)
+
+    def cursor(self, dictionary=False, **_):
+        return Cursor(self, dictionary)
+
+    def commit(self):
+        if self._db.in_transaction:
+            self._db.execute('COMMIT')
+        if not self._autocommit:
+            self._db.execute('BEGIN')
+
+    def rollback(self):
+        if self._db.in_transaction:
+            self._db.execute('ROLLBACK')
+        if not self._autocommit:
+            self._db.execute('BEGIN')
+
+    def ping(self, reconnect=False):
+        self._db.execute('SELECT 1')
+
+    def close(self):
+        self._db.close()
+
+
+def connect(database=None, autocommit=True, **_):
+    """``mysql.connector.connect`` signature; ``database`` is the SQLite file."""
+    return Connection(database or os.environ.get('BENCH_SQLITE_PATH', 'bench.sqlite3'), autocommit)
+
+
+# --------- Schema ---------
+_STATEMENT_SKIP = re.compile(r'^\s*(CREATE\s+DATABASE|USE\s)', re.I)
+
+
+def schema_from_mysql(text):
+    """Translate ``schema.sql`` into SQLite DDL statements."""
+    text = re.sub(r'--[^\n]*', '', text)
+    statements = []
+    for stmt in text.split(';'):
+        if not stmt.strip() or _STATEMENT_SKIP.match(stmt):
+            continue
+        stmt = re.sub(r'\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT', stmt, flags=re.I)
+        stmt = re.sub(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', '', stmt, flags=re.I)
+        stmt = re.sub(r'\bUNIQUE\s+KEY\s+\w+\s*\(', 'UNIQUE (', stmt, flags=re.I)
+        stmt = re.sub(r',\s*(?:KEY|INDEX)\s+\w+\s*\([^)]*\)', '', stmt, flags=re.I)
+        stmt = re.sub(r'^\s*CREATE\s+TABLE\s+(?!IF)', 'CREATE TABLE IF NOT EXISTS ', stmt, flags=re.I)
+        stmt = re.sub(r'^\s*CREATE\s+INDEX\s+(?!IF)', 'CREATE INDEX IF NOT EXISTS ', stmt, flags=re.I)
+        statements.append(stmt.strip())
+    return statements
+
+
+def create_database(path, schema_path):
+    if os.path.exists(path):
+        os.remove(path)
+    with open(schema_path, encoding='utf-8') as fh:
+        statements = schema_from_mysql(fh.read())
+    conn = Connection(path)
+    try:
+        for stmt in statements:
+            conn._db.execute(stmt)
+    finally:
+        conn.close()
@@ -0,0 +1,24 @@
+# Loaded automatically by gunicorn from the working directory.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+
+def on_starting(server):
+    # Tune the bcrypt cost once, before forking, so all workers share it
+    from config import Config
+    from utils.passwords import tune_once
+
+    server.log.info('bcrypt cost: %d', tune_once(vars(Config)))
+
+
+def post_worker_init(worker):
+    # Warm the DB pool, hasher and model in the background so the worker can
+    # take requests right away instead of paying for them on the first hit.
+    import threading
+    from app import warm_up
+
+    threading.Thread(target=warm_up, args=(worker.wsgi,), name='warm-up', daemon=True).start()
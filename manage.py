@@ -0,0 +1,97 @@
+"""Management commands: ``python manage.py <command> --help``."""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from flask import Flask
+
+from config import Config
+
+
+def _app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    return app
+
+
+def ingest_prices(args):
+    from utils.ingest import ingest_file
+    from routes.market import invalidate_prices
+
+    app = _app()
+    with app.app_context():
+        stats = ingest_file(args.path, batch_size=args.batch_size,
+                            checkpoint=args.checkpoint, dry_run=args.dry_run)
+        if stats['upserted'] and not args.dry_run:
+            invalidate_prices()
+    print(json.dumps(stats))
+
+
+def weather_alerts(args):
+    from utils.alerts import run_alert_fanout
+
+    app = _app()
+    with app.app_context():
+        stats = run_alert_fanout(app.config, dedupe_hours=args.dedupe_hours,
+                                 horizon_days=args.horizon_days)
+    print(json.dumps(stats))
+
+
+def reindex_knowledge(args):
+    from utils.knowledge import get_knowledge_base
+
+    app = _app()
+    app.root_path = os.path.dirname(os.path.abspath(__file__))
+    print(json.dumps(get_knowledge_base(app.config, app.root_path).reindex()))
+
+
+def build_assets(args):
+    from utils.assets import build, default_out_dir, duplicate_includes
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    duplicates = duplicate_includes(os.path.join(root, 'templates'))
+    for template, assets in duplicates.items():
+        print(f'{template}: included more than once: {", ".join(assets)}', file=sys.stderr)
+    manifest = build(os.path.join(root, 'static'), args.out or Config.ASSETS_DIR or default_out_dir(root))
+    print(json.dumps({'files': len(manifest['files']), 'images': len(manifest['images']),
+                      'duplicate_includes': duplicates}))
+    return 1 if duplicates and not args.allow_duplicates else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='manage.py')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('ingest-prices', help='Bulk load a mandi price dump into market_prices')
+    p.add_argument('path', help='CSV, JSON or JSON Lines file (optionally .gz)')
+    p.add_argument('--batch-size', type=int, default=5000)
+    p.add_argument('--checkpoint', help='File used to resume an interrupted load')
+    p.add_argument('--dry-run', action='store_true', help='Parse and validate only')
+    p.set_defaults(func=ingest_prices)
+
+    p = sub.add_parser('weather-alerts', help='Evaluate alert rules per weather tile and notify users')
+    p.add_argument('--dedupe-hours', type=int, default=12,
+                   help='Skip users who already have the same alert type in this window')
+    p.add_argument('--horizon-days', type=int, default=2, help='Forecast days to evaluate')
+    p.set_defaults(func=weather_alerts)
+
+    p = sub.add_parser('reindex-knowledge',
+                       help='Rebuild the chatbot knowledge index (only changed sources are re-read)')
+    p.set_defaults(func=reindex_knowledge)
+
+    p = sub.add_parser('build-assets',
+                       help='Minify, fingerprint and precompress static files; fails on duplicate includes')
+    p.add_argument('--out', help='Output directory (default ASSETS_DIR or static/dist)')
+    p.add_argument('--allow-duplicates', action='store_true',
+                   help='Do not fail when a template includes the same asset twice')
+    p.set_defaults(func=build_assets)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,28 @@
+-- Bring an existing market_prices table in line with the columns queried by
+-- routes/market.py and used by the bulk ingester (utils/ingest.py).
+USE agri_db;
+
+ALTER TABLE market_prices
+    ADD COLUMN state VARCHAR(10) NOT NULL DEFAULT '' AFTER id,
+    ADD COLUMN market VARCHAR(100) NOT NULL DEFAULT '' AFTER crop_name,
+    ADD COLUMN variety VARCHAR(100) NOT NULL DEFAULT '' AFTER market,
+    ADD COLUMN min_price DECIMAL(10,2) NOT NULL DEFAULT 0 AFTER variety,
+    ADD COLUMN max_price DECIMAL(10,2) NOT NULL DEFAULT 0 AFTER min_price,
+    ADD COLUMN modal_price DECIMAL(10,2) NOT NULL DEFAULT 0 AFTER max_price,
+    ADD COLUMN arrival_date DATE NOT NULL DEFAULT (CURRENT_DATE) AFTER unit,
+    MODIFY COLUMN unit VARCHAR(50) NOT NULL DEFAULT 'quintal';
+
+-- Carry hand-entered rows over to the new columns before dropping the old ones
+UPDATE market_prices
+SET market = COALESCE(market_location, ''),
+    min_price = price_per_unit,
+    max_price = price_per_unit,
+    modal_price = price_per_unit,
+    arrival_date = DATE(last_updated);
+
+ALTER TABLE market_prices
+    DROP COLUMN price_per_unit,
+    DROP COLUMN market_location,
+    ADD UNIQUE KEY uq_market_prices_row (state, crop_name, market, variety, arrival_date);
+
+CREATE INDEX idx_market_prices_state_crop_market ON market_prices(state, crop_name, market);
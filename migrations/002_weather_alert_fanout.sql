@@ -0,0 +1,17 @@
+-- Farm locations for weather alert fan-out (utils/alerts.py). tile_row and
+-- tile_col are the WEATHER_TILE_DEG grid cell, stored so alerts can be joined
+-- to users per tile; recompute them if WEATHER_TILE_DEG changes.
+USE agri_db;
+
+ALTER TABLE users
+    ADD COLUMN latitude DECIMAL(8,5) AFTER preferred_language,
+    ADD COLUMN longitude DECIMAL(8,5) AFTER latitude,
+    ADD COLUMN tile_row INT AFTER longitude,
+    ADD COLUMN tile_col INT AFTER tile_row;
+
+CREATE INDEX idx_users_tile ON users(tile_row, tile_col);
+
+-- Serves both the per-user alert lookup and the fan-out dedupe check; it
+-- also covers the foreign key, so the single-column index can go.
+CREATE INDEX idx_weather_alerts_user_date ON weather_alerts(user_id, alert_date);
+DROP INDEX idx_weather_alerts_user_id ON weather_alerts;
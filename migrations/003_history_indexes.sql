@@ -0,0 +1,16 @@
+-- Keyset-paginated history (utils/history.py): replace the user_id-only
+-- indexes with (user_id, timestamp). With the implicit primary key suffix they
+-- serve "WHERE user_id = ? AND (ts, id) < cursor ORDER BY ts DESC, id DESC"
+-- from the index alone. Each new index is created before the old one is
+-- dropped, so the foreign key always has an index.
+-- weather_alerts already has idx_weather_alerts_user_date (002).
+USE agri_db;
+
+CREATE INDEX idx_chat_history_user_created ON chat_history(user_id, created_at);
+DROP INDEX idx_chat_history_user_id ON chat_history;
+
+CREATE INDEX idx_soil_tests_user_date ON soil_tests(user_id, test_date);
+DROP INDEX idx_soil_tests_user_id ON soil_tests;
+
+CREATE INDEX idx_pest_detections_user_detected ON pest_detections(user_id, detected_at);
+DROP INDEX idx_pest_detections_user_id ON pest_detections;
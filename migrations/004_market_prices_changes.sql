@@ -0,0 +1,7 @@
+-- Delta sync (utils/sync.py) reads the market_prices rows of a state/crop
+-- changed since a client's cursor: WHERE state = ? AND crop_name = ?
+-- AND (last_updated, id) > cursor ORDER BY last_updated, id. This index turns
+-- that into a range scan instead of reading every row of the pair.
+USE agri_db;
+
+CREATE INDEX idx_market_prices_changes ON market_prices(state, crop_name, last_updated);
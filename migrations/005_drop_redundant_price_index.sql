@@ -0,0 +1,6 @@
+-- uq_market_prices_row (state, crop_name, market, variety, arrival_date)
+-- already serves every lookup idx_market_prices_state_crop_market did, so the
+-- extra index (added in 001) only costs writes during ingest.
+USE agri_db;
+
+DROP INDEX idx_market_prices_state_crop_market ON market_prices;
@@ -0,0 +1,14 @@
+-- Delta sync (utils/sync.py) used to send only market_prices rows older than
+-- a fixed settle window, and ingest rolled back batches that ran longer than
+-- that. Instead, each ingest run is recorded here before it writes, and sync
+-- reads rows stamped before the oldest run still in flight started.
+USE agri_db;
+
+CREATE TABLE IF NOT EXISTS ingest_runs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    source VARCHAR(255) NOT NULL,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL DEFAULT NULL,
+    KEY idx_ingest_runs_open (finished_at, heartbeat_at)
+);
@@ -0,0 +1,50 @@
+import mimetypes
+
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+from utils.assets import get_assets
+
+# Served from the site root (not API_PREFIX): built files live at /assets/...
+assets_bp = Blueprint('assets', __name__)
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+_SUFFIX = {'br': '.br', 'gzip': '.gz'}
+
+
+@assets_bp.route('/assets/<path:filename>', methods=['GET'])
+def asset(filename):
+    """A built file. Names carry a content hash, so responses never change."""
+    assets = get_assets(current_app.config, current_app.root_path)
+    if not assets.is_served(filename):
+        abort(404)
+    encoding = next((e for e in assets.encodings(filename) if request.accept_encodings[e]), None)
+    resp = send_from_directory(assets.out_dir, filename + _SUFFIX.get(encoding, ''),
+                               mimetype=mimetypes.guess_type(filename)[0],
+                               max_age=31536000, conditional=True)
+    if encoding:
+        resp.headers['Content-Encoding'] = encoding
+    if assets.encodings(filename):
+        resp.headers['Vary'] = 'Accept-Encoding'
+    resp.headers['Cache-Control'] = IMMUTABLE
+    return resp
+
+
+def asset_url_for(endpoint, **values):
+    """``url_for`` that points static files at their hashed build when there is one."""
+    if endpoint == 'static':
+        built = get_assets(current_app.config, current_app.root_path).built(values.get('filename'))
+        if built:
+            values['filename'] = built
+            return url_for('assets.asset', **values)
+    return url_for(endpoint, **values)
+
+
+def srcset(filename, fmt):
+    """``srcset`` value for the resized ``fmt`` copies of an image ('' if none)."""
+    assets = get_assets(current_app.config, current_app.root_path)
+    return ', '.join(f"{url_for('assets.asset', filename=built)} {width}w"
+                     for width, built in assets.variants(filename, fmt))
+
+
+@assets_bp.app_context_processor
+def assets_context():
+    return {'url_for': asset_url_for, 'srcset': srcset}
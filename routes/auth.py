@@ -1,8 +1,11 @@
 from flask import Blueprint, request, current_app
-from flask_bcrypt import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from utils.db import get_conn
+from mysql.connector import errors as db_errors
+from utils.db import db_cursor
 from utils.helpers import json_response, validate_required_fields
+from utils.passwords import get_hasher
+from utils.users import get_user_store
+from utils.weather import tile_for
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -20,29 +23,29 @@ def register():
     mobile = payload.get('mobile', '')
     preferred_language = payload.get('preferred_language', 'en')
 
-    # Hash password
-    pw_hash = generate_password_hash(password).decode('utf-8')
-
-    conn = get_conn()
     try:
-        cursor = conn.cursor(dictionary=True)
-        # check unique email
-        cursor.execute('SELECT id FROM users WHERE email = %s', (email,))
-        if cursor.fetchone():
-            return json_response('error', 'Email already registered', {}, 400)
-
-        cursor.execute(
-            'INSERT INTO users (name, email, mobile, password, preferred_language) VALUES (%s, %s, %s, %s, %s)',
-            (name, email, mobile, pw_hash, preferred_language)
-        )
-        conn.commit()
+        # check unique email; no connection is held while hashing below
+        with db_cursor() as cursor:
+            cursor.execute('SELECT id FROM users WHERE email = %s', (email,))
+            if cursor.fetchone():
+                return json_response('error', 'Email already registered', {}, 400)
+
+        pw_hash = get_hasher(current_app.config).hash(password)
+
+        with db_cursor(commit=True) as cursor:
+            cursor.execute(
+                'INSERT INTO users (name, email, mobile, password, preferred_language) VALUES (%s, %s, %s, %s, %s)',
+                (name, email, mobile, pw_hash, preferred_language)
+            )
+        # Forget any cached "unknown email" answer, in every worker
+        get_user_store(current_app.config).invalidate(email=email)
         return json_response('success', 'User registered', {}, 201)
+    except db_errors.IntegrityError:
+        # Lost a race with a concurrent registration for the same email
+        return json_response('error', 'Email already registered', {}, 400)
     except Exception as e:
         current_app.logger.exception('Register error')
         return json_response('error', 'Registration failed', {'error': str(e)}, 500)
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @auth_bp.route('/login', methods=['POST'])
@@ -55,26 +58,47 @@ def login():
     email = payload['email'].strip().lower()
     password = payload['password']
 
-    conn = get_conn()
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute('SELECT id, password, name FROM users WHERE email = %s', (email,))
-        user = cursor.fetchone()
-        if not user:
+        users = get_user_store(current_app.config)
+        user = users.get_credentials(email)
+        hasher = get_hasher(current_app.config)
+        if not hasher.verify(user['password'] if user else None, password):
             return json_response('error', 'Invalid credentials', {}, 401)
 
-        hashed = user['password']
-        if not check_password_hash(hashed, password):
-            return json_response('error', 'Invalid credentials', {}, 401)
+        # Re-hash at the current cost while the plaintext is at hand
+        new_hash = hasher.upgrade(user['password'], password)
+        if new_hash:
+            users.update(user['id'], {'password': new_hash})
 
         access_token = create_access_token(identity={'id': user['id'], 'email': email})
         return json_response('success', 'Login successful', {'access_token': access_token})
     except Exception as e:
         current_app.logger.exception('Login error')
         return json_response('error', 'Login failed', {'error': str(e)}, 500)
-    finally:
-        cursor.close()
-        conn.close()
+
+
+PROFILE_FIELDS = ('id', 'name', 'email', 'mobile', 'preferred_language', 'latitude', 'longitude')
+
+
+def _profile(user):
+    out = {k: user.get(k) for k in PROFILE_FIELDS}
+    for k in ('latitude', 'longitude'):
+        if out[k] is not None:
+            out[k] = float(out[k])
+    return out
+
+
+def _location_fields(payload):
+    """Farm location plus its weather tile, used by the alert fan-out."""
+    if 'latitude' not in payload and 'longitude' not in payload:
+        return {}
+    if payload.get('latitude') is None and payload.get('longitude') is None:
+        return {'latitude': None, 'longitude': None, 'tile_row': None, 'tile_col': None}
+    lat, lon = float(payload['latitude']), float(payload['longitude'])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('lat/lon out of range')
+    row, col = tile_for(lat, lon, current_app.config.get('WEATHER_TILE_DEG', 0.1))
+    return {'latitude': lat, 'longitude': lon, 'tile_row': row, 'tile_col': col}
 
 
 @auth_bp.route('/profile', methods=['GET'])
@@ -82,17 +106,41 @@ def login():
 def profile():
     ident = get_jwt_identity()
     user_id = ident.get('id')
-    conn = get_conn()
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute('SELECT id, name, email, mobile, preferred_language FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
+        user = get_user_store(current_app.config).get_by_id(user_id)
         if not user:
             return json_response('error', 'User not found', {}, 404)
-        return json_response('success', 'Profile fetched', {'user': user})
+        return json_response('success', 'Profile fetched', {'user': _profile(user)})
     except Exception as e:
         current_app.logger.exception('Profile error')
         return json_response('error', 'Failed to fetch profile', {'error': str(e)}, 500)
-    finally:
-        cursor.close()
-        conn.close()
+
+
+@auth_bp.route('/profile', methods=['PATCH', 'PUT'])
+@jwt_required()
+def update_profile():
+    user_id = get_jwt_identity().get('id')
+    payload = request.get_json() or {}
+    fields = {k: payload[k] for k in ('name', 'mobile', 'preferred_language') if k in payload}
+    try:
+        fields.update(_location_fields(payload))
+    except (KeyError, TypeError, ValueError):
+        return json_response('error', 'latitude and longitude must be valid coordinates', {}, 400)
+    if not fields:
+        return json_response('error', 'Nothing to update', {}, 400)
+    try:
+        users = get_user_store(current_app.config)
+        users.update(user_id, fields)
+        user = users.get_by_id(user_id)
+        if not user:
+            return json_response('error', 'User not found', {}, 404)
+        return json_response('success', 'Profile updated', {'user': _profile(user)})
+    except Exception as e:
+        current_app.logger.exception('Profile update error')
+        return json_response('error', 'Failed to update profile', {'error': str(e)}, 500)
+
+
+@auth_bp.route('/auth/hash-stats', methods=['GET'])
+@jwt_required()
+def hash_stats():
+    return json_response('success', 'Password hashing stats', {'hashing': get_hasher(current_app.config).stats()})
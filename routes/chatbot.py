@@ -1,5 +1,13 @@
+import time
+
 from flask import Blueprint, request, current_app
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from utils.chat import PlaceholderModel, choose_model, remember, sse_response, wants_stream
+from utils.chat import counters as chat_counters
+from utils.chat_cache import get_response_cache
 from utils.helpers import json_response, validate_required_fields
+from utils.knowledge import get_knowledge_base
+from utils.writebehind import record
 
 chatbot_bp = Blueprint('chatbot', __name__)
 
@@ -12,6 +20,52 @@ def chatbot():
         return json_response('error', f'Missing fields: {missing}', {}, 400)
 
     message = payload['message']
-    # Placeholder: Echo-style AI response
-    reply = f"You said: {message}. (This is a placeholder response from the chatbot.)"
-    return json_response('success', 'Reply generated', {'reply': reply})
+    if not isinstance(message, str) or not message.strip():
+        return json_response('error', 'message must be a non-empty string', {}, 400)
+    cfg, root = current_app.config, current_app.root_path
+    scope = 'chatbot:placeholder'
+    # Cached reply, then the local knowledge base, then the placeholder model
+    model = choose_model(message, cfg, root, lambda: PlaceholderModel(
+        'You said: {prompt}. (This is a placeholder response from the chatbot.)',
+        cfg.get('CHAT_STREAM_DELAY_MS', 0)), scope)
+    sources = getattr(model, 'sources', [])
+    user_id = get_jwt_identity().get('id') if verify_jwt_in_request(optional=True) else None
+
+    def save(reply):
+        remember(message, model, reply, cfg, root, scope)
+        if user_id is not None:
+            record('chat_history', (user_id, message, reply))
+
+    cached = getattr(model, 'cached', False)
+    if wants_stream(payload):
+        return sse_response(model.stream(message), on_done=save,
+                            extra={'sources': sources, 'cached': cached})
+    reply = model.reply(message)
+    save(reply)
+    return json_response('success', 'Reply generated', {'reply': reply, 'sources': sources, 'cached': cached})
+
+
+@chatbot_bp.route('/chatbot/stats', methods=['GET'])
+def chatbot_stats():
+    cfg, root = current_app.config, current_app.root_path
+    return json_response('success', 'Chatbot stats', {
+        'response_cache': get_response_cache(cfg, root).stats(),
+        'streams': chat_counters.stats(),
+        'knowledge': get_knowledge_base(cfg, root).stats(),
+    })
+
+
+@chatbot_bp.route('/knowledge/search', methods=['GET'])
+def knowledge_search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return json_response('error', 'Missing query parameter q', {}, 400)
+    k = min(max(request.args.get('k', 5, type=int), 1), 20)
+    kb = get_knowledge_base(current_app.config, current_app.root_path)
+    started = time.perf_counter()
+    hits = kb.search(query, k)
+    return json_response('success', 'Search results', {
+        'results': hits,
+        'took_ms': round((time.perf_counter() - started) * 1000, 3),
+        'index': kb.stats(),
+    })
@@ -0,0 +1,46 @@
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from utils.helpers import json_response
+from utils.history import DEFAULT_LIMIT, STREAMS, InvalidPage, activity, clamp_limit, history
+
+history_bp = Blueprint('history', __name__)
+
+
+def _limit():
+    return clamp_limit(request.args.get('limit', DEFAULT_LIMIT))
+
+
+@history_bp.route('/history', methods=['GET'])
+@jwt_required()
+def activity_feed():
+    """All of the user's history, newest first. ``?kinds=pest,soil`` narrows it;
+    pass ``next_cursor`` back as ``?cursor=`` for the next page."""
+    user_id = get_jwt_identity().get('id')
+    kinds = request.args.get('kinds')
+    kinds = [k.strip() for k in kinds.split(',')] if kinds else None
+    if kinds and not set(kinds) <= set(STREAMS):
+        return json_response('error', f'kinds must be among {list(STREAMS)}', {}, 400)
+    try:
+        page = activity(user_id, kinds, request.args.get('cursor'), _limit())
+    except InvalidPage as e:
+        return json_response('error', str(e), {}, 400)
+    except Exception as e:
+        current_app.logger.exception('Activity feed error')
+        return json_response('error', 'Failed to fetch history', {'error': str(e)}, 500)
+    return json_response('success', 'History fetched', page)
+
+
+@history_bp.route('/history/<kind>', methods=['GET'])
+@jwt_required()
+def kind_history(kind):
+    if kind not in STREAMS:
+        return json_response('error', f'Unknown history: {kind}', {}, 404)
+    user_id = get_jwt_identity().get('id')
+    try:
+        page = history(user_id, kind, request.args.get('cursor'), _limit())
+    except InvalidPage as e:
+        return json_response('error', str(e), {}, 400)
+    except Exception as e:
+        current_app.logger.exception('History error')
+        return json_response('error', 'Failed to fetch history', {'error': str(e)}, 500)
+    return json_response('success', 'History fetched', page)
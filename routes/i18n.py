@@ -0,0 +1,78 @@
+from flask import Blueprint, Response, current_app, request
+from utils.helpers import json_response
+from utils.i18n import get_bundles, get_catalogues, page_for_endpoint
+from utils.serialization import encoded_etag
+
+# Served from the site root (not API_PREFIX) so pages can fetch /i18n/...
+i18n_bp = Blueprint('i18n', __name__)
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _encoding(bundle):
+    accepted = request.accept_encodings
+    if bundle.br is not None and accepted['br']:
+        return 'br', bundle.br
+    if accepted['gzip']:
+        return 'gzip', bundle.gzip
+    return None, bundle.body
+
+
+@i18n_bp.route('/i18n/<lang>/<page>.json', methods=['GET'])
+def bundle(lang, page):
+    """Per-page translations. With ``?v=<etag>`` the response is cacheable
+    forever; without it, browsers revalidate with If-None-Match."""
+    catalogues = get_catalogues(current_app.root_path)
+    bundles = get_bundles(current_app.config, current_app.root_path)
+    found = bundles.get(catalogues.resolve(lang), page)
+    if found is None:
+        return json_response('error', f'Unknown page: {page}', {}, 404)
+
+    cache_control = IMMUTABLE if request.args.get('v') == found.etag else 'public, no-cache'
+    encoding, body = _encoding(found)
+    etag = encoded_etag(found.etag, encoding)
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype='application/json')
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = cache_control
+    resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
+
+
+def _page_language(catalogues):
+    """The language a page is rendered in: the cookie script.js sets, else Accept-Language."""
+    return catalogues.resolve(request.cookies.get('preferred_lang')
+                              or catalogues.negotiate(request.accept_languages))
+
+
+@i18n_bp.app_context_processor
+def i18n_context():
+    """``i18n`` (config for script.js) and ``t(key, default)`` for every template.
+
+    With I18N_SERVER_RENDER on, ``t`` returns the translation and the bundle is
+    inlined so the first paint is already translated; otherwise ``t`` returns
+    ``default`` and the browser translates after loading the bundle.
+    """
+    catalogues = get_catalogues(current_app.root_path)
+    bundles = get_bundles(current_app.config, current_app.root_path)
+    page = page_for_endpoint(request.endpoint)
+    lang = _page_language(catalogues)
+    config = {'lang': lang, 'page': page, 'versions': bundles.versions(page)}
+    data = {}
+    if current_app.config.get('I18N_SERVER_RENDER', True):
+        data = bundles.get(lang, page).data
+        config.update(rendered=lang, inline=data)
+
+    def t(key, default=None):
+        node = data
+        for part in key.split('.'):
+            node = node.get(part) if isinstance(node, dict) else None
+        if isinstance(node, str):
+            return node
+        return default if default is not None else key
+
+    return {'i18n': config, 't': t}
@@ -1,7 +1,14 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
 from flask import Blueprint, current_app, request
 from flask_jwt_extended import jwt_required
 from utils.helpers import json_response
-from utils.db import get_conn
+from utils.db import db_cursor
+from utils.cache import make_cache
 
 market_bp = Blueprint('market', __name__)
 
@@ -27,45 +34,148 @@ MOCK_DATA = {
     }
 }
 
+_price_cache = None
+_history_cache = None
+
+
+def _stamp_path(name):
+    # Shared by the gunicorn workers and manage.py, which run from the same root
+    return os.path.join(current_app.config.get('CACHE_STAMP_DIR') or
+                        os.path.join(current_app.root_path, 'cache'), f'{name}.gen')
+
+
+def get_price_cache():
+    global _price_cache
+    if _price_cache is None:
+        _price_cache = make_cache('market_prices', current_app.config,
+                                  'PRICE_CACHE_SIZE', 'PRICE_CACHE_TTL',
+                                  maxsize=2048, ttl=900, stamp_path=_stamp_path('market_prices'))
+    return _price_cache
+
+
+def get_history_cache():
+    global _history_cache
+    if _history_cache is None:
+        _history_cache = make_cache('market_history', current_app.config,
+                                    'HISTORY_CACHE_SIZE', 'HISTORY_CACHE_TTL',
+                                    maxsize=256, ttl=3600, stamp_path=_stamp_path('market_history'))
+    return _history_cache
+
+
+def invalidate_prices(state=None, crop=None):
+    """Drop cached prices after an ingest; everything when no key is given.
+
+    A full invalidation reaches every worker through the shared (Redis)
+    backend, or without one through the caches' stamp files, which hits only
+    ``stat`` and never the DB pool.
+    """
+    cache = get_price_cache()
+    if state is None or crop is None:
+        cache.invalidate()
+    else:
+        cache.invalidate((state, crop))
+    # History entries are keyed by window too, so drop them all
+    get_history_cache().invalidate()
+
+
+def _fetch_prices(state, crop):
+    """Latest arrival per market and variety; both halves use uq_market_prices_row."""
+    with db_cursor(dictionary=True) as cursor:
+        cursor.execute('''
+            SELECT p.market, p.variety, p.min_price, p.max_price, p.modal_price, p.arrival_date
+            FROM market_prices p
+            JOIN (
+                SELECT market, variety, MAX(arrival_date) AS arrival_date
+                FROM market_prices
+                WHERE state = %s AND crop_name = %s
+                GROUP BY market, variety
+            ) latest
+              ON p.market = latest.market AND p.variety = latest.variety
+             AND p.arrival_date = latest.arrival_date
+            WHERE p.state = %s AND p.crop_name = %s
+            ORDER BY p.market, p.variety
+        ''', (state, crop, state, crop))
+        return cursor.fetchall()
+
+
+def _etag_for(rows):
+    body = json.dumps(rows, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(body).hexdigest()
+
+
 @market_bp.route('/market/prices', methods=['GET'])
 @jwt_required()
 def get_prices():
     state = request.args.get('state', 'TN')
     crop = request.args.get('crop', 'rice')
+    cache = get_price_cache()
+    key = (state, crop)
 
-    try:
-        conn = get_conn()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Try to fetch from DB first
+    cached = cache.get_entry(key)
+    if cached is None:
+        try:
+            rows = _fetch_prices(state, crop)
+            # If no data in DB, use mock data
+            if not rows:
+                rows = MOCK_DATA.get(state, {}).get(crop, [])
+            cached = cache.set(key, {'rows': rows, 'etag': _etag_for(rows)}), time.time()
+        except Exception:
+            current_app.logger.exception('Error fetching market prices')
+            # Fallback to mock data on error; not cached so the DB is retried
+            rows = MOCK_DATA.get(state, {}).get(crop, [])
+            return json_response('success', 'Prices fetched (mock)', {'prices': rows})
+
+    entry, stored_at = cached
+    resp, _ = json_response('success', 'Prices fetched successfully', {'prices': entry['rows']})
+    resp.set_etag(entry['etag'])
+    resp.last_modified = datetime.fromtimestamp(int(stored_at), tz=timezone.utc)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+
+@market_bp.route('/market/prices/cache', methods=['GET'])
+@jwt_required()
+def price_cache_stats():
+    return json_response('success', 'Cache stats', {'cache': get_price_cache().stats()})
+
+
+def _fetch_history(state, crop, window):
+    with db_cursor() as cursor:
         cursor.execute('''
-            SELECT market, variety, min_price, max_price, modal_price 
-            FROM market_prices 
+            SELECT market, TO_DAYS(arrival_date), min_price, max_price, modal_price
+            FROM market_prices
             WHERE state = %s AND crop_name = %s
-            ORDER BY market
-        ''', (state, crop))
-        
-        rows = cursor.fetchall()
-        
-        # If no data in DB, use mock data
-        if not rows:
-            state_data = MOCK_DATA.get(state, {})
-            rows = state_data.get(crop, [])
-            
-        return json_response('success', 'Prices fetched successfully', {'prices': rows})
-
-    except Exception as e:
-        current_app.logger.exception('Error fetching market prices')
-        # Fallback to mock data on error
-        try:
-            rows = MOCK_DATA[state][crop]
-        except KeyError:
-            rows = []
-        return json_response('success', 'Prices fetched (mock)', {'prices': rows})
-        
-    finally:
+              AND arrival_date >= CURRENT_DATE - INTERVAL %s DAY
+        ''', (state, crop, window))
+        return cursor.fetchall()
+
+
+@market_bp.route('/market/prices/history', methods=['GET'])
+@jwt_required()
+def get_price_history():
+    state = request.args.get('state', 'TN')
+    crop = request.args.get('crop', 'rice')
+    try:
+        window = min(max(int(request.args.get('window', 90)), 7), 365)
+    except ValueError:
+        return json_response('error', 'window must be a number of days', {}, 400)
+
+    cache = get_history_cache()
+    key = (state, crop, window)
+    entry = cache.get(key)
+    if entry is None:
         try:
-            cursor.close()
-            conn.close()
-        except Exception:
-            pass
+            rows = _fetch_history(state, crop, window)
+        except Exception as e:
+            current_app.logger.exception('Error fetching price history')
+            return json_response('error', 'Failed to fetch price history', {'error': str(e)}, 500)
+        # NumPy is only loaded once someone asks for history
+        from utils.price_stats import price_history
+
+        columns = list(zip(*rows)) if rows else [(), (), (), (), ()]
+        entry = cache.set(key, {'history': price_history(*columns)})
+
+    data = {'state': state, 'crop': crop, 'window': window}
+    data.update(entry['history'])
+    return json_response('success', 'Price history fetched', data)
@@ -0,0 +1,32 @@
+import hmac
+
+from flask import Blueprint, Response, current_app, request
+from utils.helpers import json_response
+from utils.metrics import render
+
+# Served from the site root (not API_PREFIX), where Prometheus looks by default
+metrics_bp = Blueprint('metrics', __name__)
+
+LOOPBACK = ('127.0.0.1', '::1')
+
+
+def _local_request():
+    # A reverse proxy (Render, nginx) adds X-Forwarded-For, so a proxied
+    # request is never taken for a local one
+    return request.remote_addr in LOOPBACK and 'X-Forwarded-For' not in request.headers
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape target.
+
+    With METRICS_TOKEN set, scrapes need ``Authorization: Bearer <token>``.
+    Without it, only direct requests from this host are served.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return json_response('error', 'Unauthorized', {}, 401)
+    elif not _local_request():
+        return json_response('error', 'Set METRICS_TOKEN to scrape /metrics remotely', {}, 403)
+    return Response(render(), mimetype='text/plain; version=0.0.4')
@@ -1,10 +1,17 @@
-from flask import Blueprint, request, current_app
+import json
+import time
+
+from flask import Blueprint, Response, request, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from utils.helpers import json_response
-from utils.db import get_conn
+from utils.writebehind import record
+from utils.storage import (UploadError, multipart_chunks, normalized_copy, store_bytes, store_chunks,
+                           store_stream)
+from utils.jobs import QueueFull, get_job_queue, then
 import base64
+import binascii
 import os
-from datetime import datetime
+import queue
 
 pest_bp = Blueprint('pest', __name__)
 
@@ -41,62 +48,208 @@ MOCK_PESTS = {
     }
 }
 
+def _upload_root():
+    return current_app.config.get('PEST_UPLOAD_DIR') or os.path.join(current_app.root_path, 'uploads')
+
+
+def _receive_image():
+    """Store the uploaded photo and return its storage info.
+
+    Accepts a multipart ``image`` field, a raw ``image/*`` request body, or the
+    legacy JSON body with a base64 ``image`` string.
+    """
+    max_bytes = current_app.config.get('PEST_UPLOAD_MAX_BYTES', 8 * 1024 * 1024)
+    # Reject oversized uploads from the declared length before reading anything
+    if request.content_length and request.content_length > max_bytes * 4 // 3 + 1024:
+        raise UploadError(f'Image exceeds {max_bytes // 1024} KB limit', 413)
+    root = _upload_root()
+
+    if request.mimetype.startswith('image/'):
+        return store_stream(request.stream, root, max_bytes)
+    if request.mimetype == 'multipart/form-data':
+        boundary = request.mimetype_params.get('boundary')
+        if not boundary:
+            raise UploadError('Malformed multipart body')
+        # Parsed from the raw stream; request.files would spool the whole body first
+        return store_chunks(multipart_chunks(request.stream, boundary, 'image'), root, max_bytes)
+
+    payload = request.get_json(silent=True) or {}
+    if 'image' not in payload:
+        raise UploadError('No image provided')
+    try:
+        image_data = base64.b64decode(payload['image'])
+    except (binascii.Error, TypeError, ValueError):
+        raise UploadError('Invalid image data')
+    return store_bytes(image_data, root, max_bytes)
+
+
+def _classify(stored):
+    # Imported on first use so the model stack stays off the cold-start path
+    from utils.inference import get_engine, load_image
+
+    cfg = current_app.config
+    size = cfg.get('PEST_MODEL_INPUT', 224)
+    path = os.path.join(_upload_root(), stored.get('normalized') or stored['path'])
+    return get_engine(cfg).classify(load_image(path, size), cfg.get('PEST_INFERENCE_TIMEOUT', 10))
+
+
+def _pest_result(predictions):
+    """Map top-k (label, probability) pairs onto the recommendation catalogue."""
+    label, prob = predictions[0]
+    pest_info = dict(MOCK_PESTS[label])
+    pest_info['confidence'] = round(prob * 100)
+    pest_info['candidates'] = [
+        {'name': MOCK_PESTS[l]['name'], 'confidence': round(p * 100)} for l, p in predictions
+    ]
+    return pest_info
+
+
+def _save_detection(user_id, image_path, pest_info):
+    # Buffered and written in batches off the request path
+    record('pest_detections', (
+        user_id,
+        image_path,
+        pest_info['name'],
+        pest_info['confidence'],
+        '\n'.join(pest_info['recommendations'])
+    ))
+
+
+def _job_queue():
+    return get_job_queue(current_app.config, os.path.join(_upload_root(), 'jobs'))
+
+
+def _job_config():
+    """Config subset shipped to job processes, which have no app context."""
+    keys = ('PEST_MODEL_INPUT', 'PEST_INFERENCE_SIZE')
+    return {k: current_app.config.get(k) for k in keys if current_app.config.get(k) is not None}
+
+
+def _submit_job(user_id, stored):
+    from utils.inference import get_engine, prepare_file
+
+    app = current_app._get_current_object()
+
+    def finish(predictions):
+        pest_info = _pest_result(predictions)
+        with app.app_context():
+            _save_detection(user_id, stored['path'], pest_info)
+        return {'pest': pest_info, 'image': {'sha256': stored['sha256'], 'duplicate': stored['duplicate']}}
+
+    def on_done(image):
+        # The pool only decodes; this worker's batcher classifies, so jobs
+        # share batches with each other and with synchronous requests
+        try:
+            return then(get_engine(app.config).submit(image), finish)
+        except queue.Full:
+            raise RuntimeError('Detection service busy, try again shortly')
+
+    try:
+        job = _job_queue().submit(prepare_file, (_upload_root(), stored['path'], _job_config()),
+                                  owner=user_id, on_done=on_done)
+    except QueueFull:
+        resp, code = json_response('error', 'Too many pending detections, retry later', {}, 429)
+        resp.headers['Retry-After'] = str(current_app.config.get('PEST_JOB_RETRY_AFTER', 5))
+        return resp, code
+    return json_response('success', 'Detection queued', {'job_id': job['id'], 'status': job['status']}, 202)
+
+
 @pest_bp.route('/pest/detect', methods=['POST'])
 @jwt_required()
 def pest_detect():
     user_id = get_jwt_identity().get('id')
-    payload = request.get_json() or {}
-    
-    if 'image' not in payload:
-        return json_response('error', 'No image provided', {}, 400)
-        
+
     try:
-        # Decode base64 image
-        image_data = base64.b64decode(payload['image'])
-        
-        # In production: Save image to a proper storage service
-        # For demo: Save to uploads folder with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        upload_dir = os.path.join(current_app.root_path, 'uploads')
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        image_path = os.path.join(upload_dir, f'pest_{user_id}_{timestamp}.png')
-        with open(image_path, 'wb') as f:
-            f.write(image_data)
-            
-        # In production: Call ML model for detection
-        # For demo: Return random mock result
-        import random
-        pest_type = random.choice(['aphids', 'spider_mites', 'no_pest'])
-        pest_info = MOCK_PESTS[pest_type]
-        
-        # Save detection result to database
-        conn = get_conn()
+        stored = _receive_image()
+    except UploadError as e:
+        return json_response('error', e.message, {}, e.code)
+
+    if request.args.get('async') in ('1', 'true'):
+        return _submit_job(user_id, stored)
+
+    try:
+        # Downscaled copy is what the model will consume
+        stored['normalized'] = normalized_copy(
+            _upload_root(), stored['path'],
+            current_app.config.get('PEST_INFERENCE_SIZE', 512))
+
         try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO pest_detections 
-                (user_id, image_path, pest_name, confidence_score, recommendations)
-                VALUES (%s, %s, %s, %s, %s)
-            ''', (
-                user_id,
-                os.path.basename(image_path),
-                pest_info['name'],
-                pest_info['confidence'],
-                '\n'.join(pest_info['recommendations'])
-            ))
-            conn.commit()
-        finally:
-            cursor.close()
-            conn.close()
-            
+            predictions = _classify(stored)
+        except queue.Full:
+            return json_response('error', 'Detection service busy, try again shortly', {}, 503)
+        pest_info = _pest_result(predictions)
+
+        _save_detection(user_id, stored['path'], pest_info)
+
         return json_response(
             'success',
             f"Detected {pest_info['name']} with {pest_info['confidence']}% confidence",
-            {'pest': pest_info}
+            {'pest': pest_info, 'image': {'sha256': stored['sha256'], 'duplicate': stored['duplicate']}}
         )
-        
+
     except Exception as e:
         current_app.logger.exception('Pest detection error')
         return json_response('error', 'Failed to process image', {'error': str(e)}, 500)
 
+
+@pest_bp.route('/pest/engine/stats', methods=['GET'])
+@jwt_required()
+def engine_stats():
+    from utils.inference import get_engine
+
+    return json_response('success', 'Engine stats', {'engine': get_engine(current_app.config).stats()})
+
+
+def _public_job(job):
+    return {k: job.get(k) for k in ('id', 'status', 'created_at', 'started_at', 'finished_at',
+                                    'result', 'error')}
+
+
+@pest_bp.route('/pest/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def pest_job(job_id):
+    job = _job_queue().get(job_id)
+    if not job or job['owner'] != get_jwt_identity().get('id'):
+        return json_response('error', 'Job not found', {}, 404)
+    return json_response('success', f"Job {job['status']}", {'job': _public_job(job)})
+
+
+@pest_bp.route('/pest/jobs/<job_id>/events', methods=['GET'])
+@jwt_required()
+def pest_job_events(job_id):
+    jobs = _job_queue()
+    job = jobs.get(job_id)
+    if not job or job['owner'] != get_jwt_identity().get('id'):
+        return json_response('error', 'Job not found', {}, 404)
+    cfg = current_app.config
+    if job['status'] not in ('done', 'failed') and not jobs.open_stream():
+        # Every open stream holds a request thread; send the client to polling
+        resp, code = json_response('error', 'Too many open job streams, poll the job instead',
+                                   {'job': _public_job(job)}, 429)
+        resp.headers['Retry-After'] = str(cfg.get('PEST_JOB_RETRY_AFTER', 5))
+        return resp, code
+    interval = cfg.get('PEST_JOB_POLL_INTERVAL', 0.25)
+    timeout = cfg.get('PEST_JOB_STREAM_TIMEOUT', 20)
+
+    def events(job):
+        deadline = time.monotonic() + timeout
+        last_status = None
+        while True:
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: {last_status}\ndata: {json.dumps(_public_job(job))}\n\n"
+            if last_status in ('done', 'failed'):
+                return
+            if time.monotonic() > deadline:
+                # EventSource reconnects after ``retry`` ms and resumes from the file
+                yield 'retry: 1000\n\n'
+                return
+            time.sleep(interval)
+            job = jobs.get(job_id) or job
+
+    resp = Response(stream_with_context(events(job)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if job['status'] not in ('done', 'failed'):
+        # Runs when the server closes the response, even if it never started
+        resp.call_on_close(jobs.close_stream)
+    return resp
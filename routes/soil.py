@@ -1,9 +1,45 @@
-from flask import Blueprint, request
+import csv
+import time
+
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
 from utils.helpers import json_response, validate_required_fields
+from utils.i18n import get_catalogues
+from utils.soil_rules import get_soil_rules
+from utils.users import get_user_store
+from utils.writebehind import record, record_many
 
 soil_bp = Blueprint('soil', __name__)
 
 
+def _user_id():
+    """Signed-in user's id, or None; history is kept only for signed-in users."""
+    if verify_jwt_in_request(optional=True):
+        return get_jwt_identity().get('id')
+    return None
+
+
+def _language(payload, user_id):
+    """Explicit ``lang``, else the user's preferred_language, else Accept-Language."""
+    catalogues = get_catalogues(current_app.root_path)
+    lang = payload.get('lang') or request.args.get('lang')
+    if not lang and user_id is not None:
+        try:
+            user = get_user_store(current_app.config).get_by_id(user_id)
+            lang = user.get('preferred_language') if user else None
+        except Exception:
+            current_app.logger.exception('Could not look up preferred language')
+    if not lang:
+        lang = catalogues.negotiate(request.accept_languages)
+    return catalogues.resolve(lang)
+
+
+def _scope(payload):
+    crop = payload.get('crop') or request.args.get('crop')
+    state = payload.get('state') or request.args.get('state')
+    return crop, state
+
+
 @soil_bp.route('/soil-test', methods=['POST'])
 def soil_test():
     payload = request.get_json() or {}
@@ -11,31 +47,106 @@ def soil_test():
     if missing:
         return json_response('error', f'Missing fields: {missing}', {}, 400)
 
-    ph = float(payload['ph'])
-    n = float(payload['nitrogen'])
-    p = float(payload['phosphorus'])
-    k = float(payload['potassium'])
-
-    recommendations = []
-    if ph < 5.5:
-        recommendations.append('Soil is acidic: consider liming to increase pH')
-    elif ph > 7.5:
-        recommendations.append('Soil is alkaline: consider sulfur or organic matter to lower pH')
-    else:
-        recommendations.append('Soil pH is within optimal range')
-
-    if n < 10:
-        recommendations.append('Nitrogen is low: apply nitrogen-rich fertilizer')
-    if p < 10:
-        recommendations.append('Phosphorus is low: apply phosphorus fertilizer')
-    if k < 100:
-        recommendations.append('Potassium is low: apply potassium fertilizer')
+    from utils.soil_batch import parse_sample
+
+    try:
+        values = parse_sample(payload)
+    except ValueError as e:
+        return json_response('error', str(e), {}, 400)
+    ph, n, p, k = (values[field] for field in ('ph', 'nitrogen', 'phosphorus', 'potassium'))
+    organic_matter, moisture = values['organic_matter'], values['moisture_content']
+
+    rules = get_soil_rules(current_app.config, current_app.root_path).current()
+    crop, state = _scope(payload)
+    keys = rules.evaluate({'ph': ph, 'nitrogen': n, 'phosphorus': p, 'potassium': k,
+                           'organic_matter': organic_matter, 'moisture_content': moisture},
+                          crop, state)
+
+    catalogues = get_catalogues(current_app.root_path)
+    user_id = _user_id()
+    lang = _language(payload, user_id)
+    recommendations = [catalogues.translate(key, lang) for key in keys]
+
+    if user_id is not None:
+        # Stored in English so history reads the same whatever the UI language
+        record('soil_tests', (
+            user_id, ph, n, p, k, organic_matter, moisture,
+            '\n'.join(catalogues.translate(key) for key in keys),
+        ))
 
     data = {
         'ph': ph,
         'n': n,
         'p': p,
         'k': k,
-        'recommendations': recommendations
+        'recommendations': recommendations,
+        'advice_keys': keys,
+        'language': lang,
+        'rules_version': rules.version,
     }
     return json_response('success', 'Soil test processed', data)
+
+
+@soil_bp.route('/soil-test/batch', methods=['POST'])
+def soil_test_batch():
+    """Evaluate many samples at once: a JSON array (or ``{"samples": [...]}``),
+    a ``text/csv`` body, or a multipart ``file`` upload."""
+    from utils.soil_batch import (
+        BatchError, evaluate, problem, read_csv, rows_for_storage, summarize, to_columns, validity
+    )
+
+    started = time.perf_counter()
+    max_samples = current_app.config.get('SOIL_BATCH_MAX_SAMPLES', 50000)
+    options = {}
+    try:
+        if request.mimetype in ('text/csv', 'application/csv'):
+            records = read_csv(request.stream)
+        elif 'file' in request.files:
+            records = read_csv(request.files['file'].stream)
+            options = request.form
+        else:
+            records = request.get_json(silent=True)
+            if isinstance(records, dict):
+                options = records
+                records = records.get('samples')
+            if not isinstance(records, list):
+                return json_response('error', 'Send a JSON array of samples or a CSV file', {}, 400)
+        sample_ids, columns, errors = to_columns(records, max_samples)
+    except (BatchError, UnicodeDecodeError, csv.Error) as e:
+        return json_response('error', 'Invalid batch', {'error': str(e)}, 400)
+    if not sample_ids:
+        return json_response('error', 'No samples in batch', {}, 400)
+
+    rules = get_soil_rules(current_app.config, current_app.root_path).current()
+    crop, state = _scope(options)
+    valid, missing, outside = validity(columns, errors)
+    valid, inverse, combos = evaluate(columns, rules, crop, state, valid)
+
+    catalogues = get_catalogues(current_app.root_path)
+    user_id = _user_id()
+    lang = _language(options, user_id)
+    texts = {key: catalogues.translate(key, lang) for key in rules.advice_keys}
+    localized = [[texts[key] for key in combo] for combo in combos]
+
+    results = []
+    for i, (sample_id, combo) in enumerate(zip(sample_ids, inverse.tolist())):
+        item = {'sample_id': sample_id, 'recommendations': localized[combo]}
+        if not valid[i]:
+            item['error'] = errors[i] or problem(missing, outside, i)
+        results.append(item)
+
+    stored = 0
+    if user_id is not None:
+        english = ['\n'.join(catalogues.translate(key) for key in combo) for combo in combos]
+        rows = rows_for_storage(user_id, columns, valid, inverse, english)
+        record_many('soil_tests', rows)
+        stored = len(rows)
+
+    summary = summarize(columns, valid, inverse, combos, texts)
+    summary.update({
+        'queued_for_storage': stored,
+        'language': lang,
+        'rules_version': rules.version,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+    return json_response('success', 'Soil batch processed', {'summary': summary, 'results': results})
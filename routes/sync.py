@@ -0,0 +1,101 @@
+from flask import Blueprint, Response, current_app, request
+from flask_jwt_extended import jwt_required
+from utils import serialization
+from utils.helpers import json_response
+from utils.i18n import get_bundles, get_catalogues
+from utils.sync import InvalidSync, sync_forecast, sync_i18n, sync_prices
+from utils.weather import get_weather_service
+
+sync_bp = Blueprint('sync', __name__)
+
+MAX_PRICE_SUBSCRIPTIONS = 50
+
+
+def _wants_msgpack():
+    if serialization.msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match(['application/json', serialization.MSGPACK_MIMETYPE])
+    return best == serialization.MSGPACK_MIMETYPE
+
+
+def _payload():
+    if request.mimetype == serialization.MSGPACK_MIMETYPE:
+        if serialization.msgpack is None:
+            raise InvalidSync('MessagePack is not available; send JSON')
+        try:
+            return serialization.unpackb(request.get_data())
+        except Exception as e:
+            raise InvalidSync('Invalid MessagePack body') from e
+    return request.get_json(silent=True)
+
+
+def _reply(status, message, data, code=200):
+    if _wants_msgpack():
+        body = serialization.packb({'status': status, 'message': message, 'data': data})
+        return Response(body, status=code, mimetype=serialization.MSGPACK_MIMETYPE)
+    return json_response(status, message, data, code)
+
+
+def _section(payload, name):
+    value = payload.get(name)
+    if value is not None and not isinstance(value, dict):
+        raise InvalidSync(f'{name} must be an object')
+    return value
+
+
+@sync_bp.route('/sync', methods=['POST'])
+@jwt_required()
+def sync():
+    """Everything that changed since the client's cursors, in one reply.
+
+    Body: ``{"prices": {"TN:rice": cursor|null, ...},
+    "forecast": {"lat": .., "lon": .., "cursor": ..},
+    "i18n": {"lang": "ta", "pages": {"soil": etag|null, ...}}}``; every
+    section is optional. A section that fails is reported under ``errors``
+    and the client keeps its old cursors for it.
+    """
+    cfg = current_app.config
+    try:
+        payload = _payload()
+        if not isinstance(payload, dict):
+            raise InvalidSync('Send a JSON (or MessagePack) object')
+        prices = _section(payload, 'prices')
+        forecast = _section(payload, 'forecast')
+        i18n = _section(payload, 'i18n')
+        if prices and len(prices) > MAX_PRICE_SUBSCRIPTIONS:
+            raise InvalidSync(f'At most {MAX_PRICE_SUBSCRIPTIONS} price subscriptions per sync')
+        if forecast is not None:
+            try:
+                lat, lon = float(forecast['lat']), float(forecast['lon'])
+            except (KeyError, TypeError, ValueError):
+                raise InvalidSync('forecast needs numeric lat and lon')
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise InvalidSync('lat/lon out of range')
+        if i18n is not None and not isinstance(i18n.get('pages') or {}, dict):
+            raise InvalidSync('i18n.pages must be an object')
+    except InvalidSync as e:
+        return _reply('error', str(e), {}, 400)
+
+    data, errors = {}, {}
+    if prices:
+        try:
+            data['prices'] = sync_prices(prices, cfg.get('SYNC_MAX_ROWS', 5000),
+                                         cfg.get('INGEST_RUN_STALE_MINUTES', 60))
+        except InvalidSync as e:
+            return _reply('error', str(e), {}, 400)
+        except Exception as e:
+            current_app.logger.exception('Price sync failed')
+            errors['prices'] = str(e)
+    if forecast is not None:
+        try:
+            data['forecast'] = sync_forecast(get_weather_service(cfg), lat, lon, forecast.get('cursor'))
+        except Exception as e:
+            current_app.logger.exception('Forecast sync failed')
+            errors['forecast'] = str(e)
+    if i18n is not None:
+        root = current_app.root_path
+        data['i18n'] = sync_i18n(get_catalogues(root), get_bundles(cfg, root),
+                                 i18n.get('lang'), i18n.get('pages') or {})
+    if errors:
+        data['errors'] = errors
+    return _reply('success', 'Synced', data)
@@ -1,40 +1,68 @@
-from flask import Blueprint, current_app
-from flask_jwt_extended import jwt_required
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from utils.helpers import json_response
+from utils.weather import get_weather_service
 import datetime
 
 weather_bp = Blueprint('weather', __name__)
 
 
+def _location():
+    cfg = current_app.config
+    lat = float(request.args.get('lat', cfg.get('WEATHER_DEFAULT_LAT', 13.08)))
+    lon = float(request.args.get('lon', cfg.get('WEATHER_DEFAULT_LON', 80.27)))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('lat/lon out of range')
+    return lat, lon
+
+
 @weather_bp.route('/weather/current', methods=['GET'])
 @jwt_required()
 def current_weather():
-    # Mock current weather data; replace with real API calls later
-    now = datetime.datetime.utcnow().isoformat() + 'Z'
-    data = {
-        'location': 'Demo Farm',
-        'timestamp': now,
-        'temperature': 28 + (datetime.datetime.utcnow().second % 8),
-        'humidity': 60 + (datetime.datetime.utcnow().second % 20),
-        'wind_speed': 5 + (datetime.datetime.utcnow().second % 15),
-        'alerts': []
-    }
+    user_id = (get_jwt_identity() or {}).get('id')
+    try:
+        lat, lon = _location()
+    except ValueError:
+        return json_response('error', 'Invalid lat/lon', {}, 400)
+    try:
+        current, fetched_at, tile = get_weather_service(current_app.config).get('current', lat, lon)
+    except Exception as e:
+        current_app.logger.exception('Weather provider error')
+        return json_response('error', 'Weather unavailable', {'error': str(e)}, 502)
+
+    try:
+        from utils.alerts import recent_alerts
+        alerts = [dict(a, alert_date=a['alert_date'].isoformat()) for a in recent_alerts(user_id)]
+    except Exception:
+        current_app.logger.exception('Weather alert lookup failed')
+        alerts = []
+
+    data = dict(current)
+    data.update({
+        'location': request.args.get('location', 'Demo Farm'),
+        'tile': list(tile),
+        'timestamp': datetime.datetime.utcfromtimestamp(fetched_at).isoformat() + 'Z',
+        'alerts': alerts
+    })
     return json_response('success', 'Weather fetched', {'weather': data})
 
 
 @weather_bp.route('/weather/forecast', methods=['GET'])
 @jwt_required()
 def weather_forecast():
-    # Mock 5-day forecast
-    base = datetime.date.today()
-    forecast = []
-    for i in range(5):
-        day = base + datetime.timedelta(days=i)
-        forecast.append({
-            'date': day.isoformat(),
-            'temperature': 25 + (i * 1.5),
-            'humidity': 60 + i,
-            'wind_speed': 5 + i,
-            'conditions': ['Sunny', 'Partly Cloudy', 'Cloudy', 'Rainy', 'Thunderstorms'][i % 5]
-        })
+    try:
+        lat, lon = _location()
+    except ValueError:
+        return json_response('error', 'Invalid lat/lon', {}, 400)
+    try:
+        forecast, fetched_at, _ = get_weather_service(current_app.config).get('forecast', lat, lon)
+    except Exception as e:
+        current_app.logger.exception('Weather provider error')
+        return json_response('error', 'Forecast unavailable', {'error': str(e)}, 502)
     return json_response('success', 'Forecast fetched', {'forecast': forecast})
+
+
+@weather_bp.route('/weather/stats', methods=['GET'])
+@jwt_required()
+def weather_stats():
+    return json_response('success', 'Weather stats', {'weather': get_weather_service(current_app.config).stats()})
@@ -10,6 +10,10 @@ CREATE TABLE IF NOT EXISTS users (
     mobile VARCHAR(20),
     password VARCHAR(255) NOT NULL,
     preferred_language VARCHAR(10) DEFAULT 'en',
+    latitude DECIMAL(8,5),
+    longitude DECIMAL(8,5),
+    tile_row INT,
+    tile_col INT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
@@ -39,14 +43,31 @@ CREATE TABLE IF NOT EXISTS soil_tests (
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
--- Market prices table
+-- Market prices table (one row per market, variety and arrival date)
 CREATE TABLE IF NOT EXISTS market_prices (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    state VARCHAR(10) NOT NULL,
     crop_name VARCHAR(100) NOT NULL,
-    price_per_unit DECIMAL(10,2) NOT NULL,
-    unit VARCHAR(50) NOT NULL,
-    market_location VARCHAR(100),
-    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    market VARCHAR(100) NOT NULL,
+    variety VARCHAR(100) NOT NULL DEFAULT '',
+    min_price DECIMAL(10,2) NOT NULL,
+    max_price DECIMAL(10,2) NOT NULL,
+    modal_price DECIMAL(10,2) NOT NULL,
+    unit VARCHAR(50) NOT NULL DEFAULT 'quintal',
+    arrival_date DATE NOT NULL,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_market_prices_row (state, crop_name, market, variety, arrival_date)
+);
+
+-- Price ingest runs (utils/ingest.py). Delta sync only sends market_prices
+-- rows stamped before the oldest unfinished run started
+CREATE TABLE IF NOT EXISTS ingest_runs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    source VARCHAR(255) NOT NULL,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL DEFAULT NULL,
+    KEY idx_ingest_runs_open (finished_at, heartbeat_at)
 );
 
 -- Pest detection history
@@ -74,7 +95,13 @@ CREATE TABLE IF NOT EXISTS weather_alerts (
 
 -- Add indexes
 CREATE INDEX idx_users_email ON users(email);
-CREATE INDEX idx_chat_history_user_id ON chat_history(user_id);
-CREATE INDEX idx_soil_tests_user_id ON soil_tests(user_id);
-CREATE INDEX idx_pest_detections_user_id ON pest_detections(user_id);
-CREATE INDEX idx_weather_alerts_user_id ON weather_alerts(user_id);
\ No newline at end of file
+-- History pages (utils/history.py) seek on (user_id, timestamp, id). InnoDB
+-- stores the primary key in every secondary index, so these cover the page-key
+-- query (SELECT id, timestamp ...) and the foreign key
+CREATE INDEX idx_chat_history_user_created ON chat_history(user_id, created_at);
+CREATE INDEX idx_soil_tests_user_date ON soil_tests(user_id, test_date);
+CREATE INDEX idx_pest_detections_user_detected ON pest_detections(user_id, detected_at);
+CREATE INDEX idx_weather_alerts_user_date ON weather_alerts(user_id, alert_date);
+CREATE INDEX idx_users_tile ON users(tile_row, tile_col);
+-- Changelog for delta sync (utils/sync.py): rows of one state/crop by last_updated
+CREATE INDEX idx_market_prices_changes ON market_prices(state, crop_name, last_updated);
@@ -15,6 +15,18 @@ function debouncedTranslate() {
   }, 100);
 }
 const languageCache = {};
+// Set by the server (routes/i18n.py): page, per-language bundle versions and,
+// when the page was rendered translated, that language's bundle
+const i18nConfig = window.I18N || {};
+if (i18nConfig.inline) {
+  languageCache[i18nConfig.rendered] = i18nConfig.inline;
+}
+
+// Per-page bundle; the version makes it cacheable forever
+function bundleUrl(lang) {
+  const version = (i18nConfig.versions || {})[lang];
+  return `/i18n/${lang}/${i18nConfig.page || "all"}.json` + (version ? `?v=${version}` : "");
+}
 // Special handling for dynamic content
 function handleDynamicContentTranslation() {
   // Translate after fetching market prices
@@ -47,11 +59,11 @@ async function loadLanguage(lang) {
     // Use cached translation if available
     if (!languageCache[lang]) {
       try {
-        const response = await fetch(`./lang/${lang}.json`);
+        const response = await fetch(bundleUrl(lang));
         if (!response.ok) {
-          console.warn(`Failed to load ${lang}.json, falling back to English`);
+          console.warn(`Failed to load ${lang} translations, falling back to English`);
           lang = 'en';
-          const enResponse = await fetch('./lang/en.json');
+          const enResponse = await fetch(bundleUrl('en'));
           if (!enResponse.ok) throw new Error('Failed to load fallback language');
           languageCache[lang] = await enResponse.json();
         } else {
@@ -134,9 +146,17 @@ function setupLanguageSelector() {
     selector.addEventListener("change", handleLanguageChange);
   });
 
+  // Keep the cookie in step so the server renders the next page in this language
+  document.cookie = `preferred_lang=${savedLang}; path=/; max-age=${60*60*24*365}`;
+
+  // Skip the initial DOM pass when the server already rendered this language
+  const alreadyRendered = i18nConfig.rendered === savedLang;
+
   // Initial translation after a slight delay to ensure DOM is ready
   setTimeout(() => {
-    loadLanguage(savedLang).catch(e => console.error('Initial translation failed:', e));
+    if (!alreadyRendered) {
+      loadLanguage(savedLang).catch(e => console.error('Initial translation failed:', e));
+    }
     
     // Reload dynamic content if needed
     if (typeof fetchPrices === 'function') {
@@ -156,7 +176,9 @@ function setupLanguageSelector() {
   }, 100);
 
   // Load the saved language when page loads
-  loadLanguage(savedLang);
+  if (!alreadyRendered) {
+    loadLanguage(savedLang);
+  }
 }
 
 function handleLanguageChange(event) {
@@ -173,6 +195,62 @@ function handleLanguageChange(event) {
   loadLanguage(lang);
 }
 
+// Post a chat message and stream the reply (Server-Sent Events over fetch).
+// onToken(text, soFar) runs per chunk; resolves with the full reply. Abort
+// `signal` to cancel, which also stops generation on the server. Falls back
+// to the one-shot JSON reply when the browser or server can't stream.
+async function streamChat(url, body, onToken, signal) {
+  const canStream = window.ReadableStream && window.TextDecoder;
+  const res = await fetch(url, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "Accept": canStream ? "text/event-stream" : "application/json"
+    },
+    body: JSON.stringify(Object.assign({}, body, { stream: !!canStream })),
+    signal
+  });
+  const type = res.headers.get("Content-Type") || "";
+  if (!canStream || !res.body || !type.includes("text/event-stream")) {
+    const data = await res.json();
+    const reply = data.reply || (data.data && data.data.reply) || data.message || "";
+    onToken(reply, reply);
+    return reply;
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let reply = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) >= 0) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      let event = "message";
+      let data = "";
+      block.split("\n").forEach(line => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if (!data) continue;
+      const payload = JSON.parse(data);
+      if (event === "token") {
+        reply += payload.text;
+        onToken(payload.text, reply);
+      } else if (event === "done") {
+        return payload.reply;
+      } else if (event === "error") {
+        throw new Error(payload.message || "Stream failed");
+      }
+    }
+  }
+  return reply;
+}
+
 // Get username from PHP session
 function getUserName() {
   const welcomeText = document.querySelector('[data-key="home.welcome"]');
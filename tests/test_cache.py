@@ -0,0 +1,25 @@
+from utils.cache import FileStamp, TTLCache
+
+
+def test_stamp_invalidation_reaches_other_processes(tmp_path):
+    path = str(tmp_path / 'prices.gen')
+    worker = TTLCache('stamp_worker', stamp=FileStamp(path))
+    worker.set(('TN', 'rice'), 'old')
+    assert worker.get(('TN', 'rice')) == 'old'
+
+    # manage.py builds its own cache over the same stamp file
+    TTLCache('stamp_ingest', stamp=FileStamp(path)).invalidate()
+    assert worker.get(('TN', 'rice')) is None
+
+    worker.set(('TN', 'rice'), 'new')
+    assert worker.get(('TN', 'rice')) == 'new'
+
+
+def test_stamp_is_not_bumped_for_single_keys(tmp_path):
+    stamp = FileStamp(str(tmp_path / 'prices.gen'))
+    cache = TTLCache('stamp_single', stamp=stamp)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.invalidate('a')
+    assert stamp.generation() == 0
+    assert cache.get('a') is None and cache.get('b') == 2
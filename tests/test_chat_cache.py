@@ -0,0 +1,19 @@
+import pytest
+
+from utils.chat_cache import normalize_query
+
+
+@pytest.mark.parametrize('a, b', [
+    ('neem oil dose for 100 litres', 'neem oil dose for 10 litres'),
+    ('neem oil dose for 100 litres', 'neem oil dose for 1000 litres'),
+    ('urea 22 kg per acre', 'urea 2 kg per acre'),
+    ('spray every 11 days', 'spray every 1 days'),
+])
+def test_different_quantities_get_different_keys(a, b):
+    assert normalize_query(a)[0] != normalize_query(b)[0]
+
+
+def test_spelling_variants_share_a_key():
+    assert normalize_query('baarish kab hogi')[0] == normalize_query('barish kab hogi')[0]
+    assert normalize_query('neem oil dose for 100 litres')[0] == \
+        normalize_query('Neem oil dose for 100 litres?')[0]
@@ -0,0 +1,102 @@
+import contextlib
+import datetime
+import os
+import random
+
+import pytest
+
+from bench import sqlite_shim
+from utils import history
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER = 1
+START = datetime.datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """SQLite copy of schema.sql with one user's rows in every stream. Few
+    distinct timestamps, so many rows tie within and across streams."""
+    path = str(tmp_path / 'history.sqlite3')
+    sqlite_shim.create_database(path, os.path.join(ROOT, 'schema.sql'))
+    conn = sqlite_shim.connect(path)
+    rng = random.Random(3)
+    cursor = conn.cursor()
+    for user_id in (USER, 2):
+        cursor.execute('INSERT INTO users (id, name, email, password) VALUES (%s, %s, %s, %s)',
+                       (user_id, 'u', f'u{user_id}@example.com', 'x'))
+    # Shuffled so ids are not in timestamp order
+    rows = [(kind, user_id, START + datetime.timedelta(minutes=rng.randrange(40)))
+            for kind in history.STREAMS for user_id in (USER, USER, USER, 2) for _ in range(60)]
+    rng.shuffle(rows)
+    for kind, user_id, at in rows:
+        stream = history.STREAMS[kind]
+        extra = ('image_path',) if kind == 'pest' else ()
+        columns = ('user_id', stream.ts) + stream.columns + extra
+        values = ((user_id, at) + tuple('r' if c == 'recommendations' else 1 for c in stream.columns)
+                  + ('leaf.jpg',) * len(extra))
+        cursor.execute(f"INSERT INTO {stream.table} ({', '.join(columns)}) "
+                       f"VALUES ({', '.join(['%s'] * len(columns))})", values)
+    conn.commit()
+
+    @contextlib.contextmanager
+    def db_cursor(dictionary=False, commit=False):
+        cur = conn.cursor(dictionary=dictionary)
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+    monkeypatch.setattr(history, 'db_cursor', db_cursor)
+    yield conn
+    conn.close()
+
+
+def _expected(conn, kinds):
+    """Every (kind, id) of the user in feed order, by sorting all rows in Python."""
+    keys = []
+    cursor = conn.cursor()
+    for kind in kinds:
+        stream = history.STREAMS[kind]
+        cursor.execute(f'SELECT id, {stream.ts} FROM {stream.table} WHERE user_id = %s', (USER,))
+        keys += [(at, -history._RANK[kind], row_id, kind) for row_id, at in cursor.fetchall()]
+    keys.sort(reverse=True)
+    return [(kind, row_id) for _, _, row_id, kind in keys]
+
+
+def _walk(fetch, limit):
+    seen, token, pages = [], None, 0
+    while True:
+        page = fetch(token, limit)
+        assert len(page['items']) <= limit
+        seen += [(item['kind'], item['id']) for item in page['items']]
+        pages += 1
+        assert pages <= 2000, 'cursor does not advance'
+        token = page['next_cursor']
+        if token is None:
+            return seen, pages
+
+
+@pytest.mark.parametrize('limit', [1, 7, 20, 100])
+def test_activity_pages_match_brute_force(db, limit):
+    seen, pages = _walk(lambda token, n: history.activity(USER, None, token, n), limit)
+    expected = _expected(db, list(history.STREAMS))
+    assert seen == expected
+    assert pages == max(1, -(-len(expected) // limit))
+
+
+@pytest.mark.parametrize('kind', list(history.STREAMS))
+def test_single_stream_pages_match_brute_force(db, kind):
+    seen, _ = _walk(lambda token, n: history.history(USER, kind, token, n), 13)
+    assert seen == _expected(db, [kind])
+
+
+def test_kinds_filter_and_foreign_cursor(db):
+    seen, _ = _walk(lambda token, n: history.activity(USER, ['soil', 'alert'], token, n), 9)
+    assert seen == _expected(db, ['soil', 'alert'])
+
+    token = history.history(USER, 'pest', None, 5)['next_cursor']
+    with pytest.raises(history.InvalidPage):
+        history.history(USER, 'chat', token, 5)
+    with pytest.raises(history.InvalidPage):
+        history.activity(USER, None, 'not-a-cursor', 5)
@@ -0,0 +1,39 @@
+from flask import Flask, jsonify, request
+
+from utils import serialization
+
+
+def make_app():
+    app = Flask(__name__)
+    serialization.init_app(app)
+
+    @app.route('/prices')
+    def prices():
+        resp = jsonify({'prices': ['x' * 50] * 50})
+        resp.set_etag('abc')
+        return resp.make_conditional(request)
+
+    return app
+
+
+def test_compressed_response_has_its_own_etag():
+    client = make_app().test_client()
+    resp = client.get('/prices', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.headers['ETag'] == '"abc-gz"'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+
+    plain = client.get('/prices')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['ETag'] == '"abc"'
+
+
+def test_revalidation_matches_the_encoded_etag():
+    client = make_app().test_client()
+    resp = client.get('/prices', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"abc-gz"'})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == '"abc-gz"'
+
+    # A gzip ETag does not validate the identity body, and vice versa
+    assert client.get('/prices', headers={'If-None-Match': '"abc-gz"'}).status_code == 200
+    assert client.get('/prices', headers={'If-None-Match': '"abc"'}).status_code == 304
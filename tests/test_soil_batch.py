@@ -0,0 +1,27 @@
+import pytest
+
+from utils.soil_batch import parse_sample, problem, to_columns, validity
+
+
+def test_batch_rows_use_the_single_sample_validator():
+    records = [
+        {'sample_id': 'ok', 'ph': '6.5', 'n': '280', 'p': '20', 'k': '150', 'moisture': ''},
+        {'sample_id': 'typo', 'ph': '6.5', 'n': '280', 'p': '20', 'k': '150', 'moisture': '2O'},
+        {'sample_id': 'range', 'ph': '15', 'n': '280', 'p': '20', 'k': '150'},
+        {'sample_id': 'short', 'ph': '6.5', 'n': '280', 'p': '20'},
+    ]
+    ids, columns, errors = to_columns(records, 10)
+    valid, missing, outside = validity(columns, errors)
+
+    assert valid.tolist() == [True, False, False, False]
+    assert errors[1] == 'Not a number: moisture_content'
+    assert errors[2] == 'Out of range: ph (0-14)'
+    assert errors[3] is None and problem(missing, outside, 3) == 'Missing: potassium'
+
+
+def test_single_sample_errors_match_batch_errors():
+    sample = {'ph': 6.5, 'nitrogen': 280, 'phosphorus': 20, 'potassium': 150, 'moisture_content': '2O'}
+    with pytest.raises(ValueError) as single:
+        parse_sample(sample)
+    _, _, errors = to_columns([sample], 1)
+    assert errors == [str(single.value)]
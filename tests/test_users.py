@@ -0,0 +1,82 @@
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+from routes.auth import auth_bp
+from utils import users
+from utils.users import cached_store
+
+
+class FakeStore:
+    """In-memory user backend that counts lookups."""
+
+    def __init__(self):
+        self.rows = {1: {'id': 1, 'name': 'Asha', 'email': 'asha@example.com', 'mobile': '',
+                         'password': 'hash', 'preferred_language': 'en',
+                         'latitude': None, 'longitude': None}}
+        self.lookups = 0
+
+    def by_id(self, user_id):
+        self.lookups += 1
+        row = self.rows.get(user_id)
+        return dict(row) if row else None
+
+    def by_email(self, email):
+        self.lookups += 1
+        row = next((r for r in self.rows.values() if r['email'] == email), None)
+        return dict(row) if row else None
+
+    def update(self, user_id, fields):
+        self.rows[user_id].update(fields)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(JWT_SECRET_KEY='test-secret-key-of-sufficient-length', JWT_VERIFY_SUB=False,
+                      CACHE_STAMP_DIR=str(tmp_path))
+    JWTManager(app)
+    app.register_blueprint(auth_bp, url_prefix='/api')
+    with app.app_context():
+        yield app
+
+
+def worker(app, store):
+    """A user store as one gunicorn worker builds it; no CACHE_REDIS_URL."""
+    return cached_store(store, 'users_test', app.config)
+
+
+def test_second_profile_read_skips_the_store(app, monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(users, '_store', worker(app, store))
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + create_access_token(identity={'id': 1, 'email': 'x'})}
+
+    for _ in range(2):
+        resp = client.get('/api/profile', headers=headers)
+        assert resp.status_code == 200
+        assert resp.get_json()['data']['user']['name'] == 'Asha'
+    assert store.lookups == 1
+    assert 'password' not in users._store.cache.get(('id', 1))
+
+
+def test_update_reaches_other_workers_on_the_host(app):
+    store = FakeStore()
+    a, b = worker(app, store), worker(app, store)
+    assert b.get_by_id(1)['preferred_language'] == 'en'
+
+    a.update(1, {'preferred_language': 'ta'})
+    assert b.get_by_id(1)['preferred_language'] == 'ta'
+
+
+def test_unknown_email_is_cached_until_registration(app):
+    store = FakeStore()
+    a, b = worker(app, store), worker(app, store)
+    assert b.get_credentials('new@example.com') is None
+    assert b.get_credentials('new@example.com') is None
+    assert store.lookups == 1
+
+    store.rows[2] = dict(store.rows[1], id=2, email='new@example.com')
+    a.invalidate(email='new@example.com')  # what /register and the signup form do
+    assert b.get_credentials('new@example.com')['password'] == 'hash'
+    assert store.lookups == 2
@@ -0,0 +1,200 @@
+import json
+import os
+
+import pytest
+from flask import Flask
+from mysql.connector import errors as db_errors
+
+from utils import writebehind
+from utils.writebehind import WriteBehind
+
+
+class FakeDB:
+    """Stores inserted rows; rejects rows whose first value is 'bad' like MySQL
+    rejects out-of-range DECIMALs, and fails every call while ``down``."""
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+        self.missing_table = False  # migration not applied yet
+        self.fail_after = None  # go down after this many more single-row inserts
+
+    def connect(self):
+        if self.down:
+            raise db_errors.InterfaceError('Connection refused')
+        return FakeConn(self)
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+        self.pending = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.db.rows.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _check(self, row):
+        db = self.conn.db
+        if db.down:
+            raise db_errors.OperationalError('Lost connection')
+        if db.missing_table:
+            raise db_errors.ProgrammingError("Table 'agri_db.chat_history' doesn't exist", errno=1146)
+        if row[0] == 'bad':
+            raise db_errors.DataError("Out of range value for column 'ph_level'")
+        if row[0] == 'orphan':
+            raise db_errors.IntegrityError('Cannot add or update a child row: a foreign key '
+                                           'constraint fails', errno=1452)
+
+    def executemany(self, sql, rows):
+        for row in rows:
+            self._check(row)
+            self.conn.pending.append(tuple(row))
+
+    def execute(self, sql, row):
+        db = self.conn.db
+        if db.fail_after is not None:
+            if db.fail_after == 0:
+                db.down = True
+            db.fail_after -= 1
+        self._check(row)
+        self.conn.pending.append(tuple(row))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(writebehind, 'get_conn', fake.connect)
+    return fake
+
+
+@pytest.fixture
+def writer(tmp_path, db):
+    # A long flush interval keeps the background thread out of the way
+    wb = WriteBehind(Flask(__name__), str(tmp_path), flush_rows=10**6, flush_ms=60 * 1000)
+    yield wb
+    wb._db_down_until = float('inf')  # close() must not touch the fake any more
+    wb._stopped = True
+
+
+def chat(i):
+    return (f'u{i}', f'q{i}', f'a{i}')
+
+
+def journal_rows(path):
+    rows = []
+    for name in os.listdir(path):
+        if name.endswith('.jsonl'):
+            with open(os.path.join(path, name)) as fh:
+                rows += [tuple(json.loads(line)) for line in fh]
+    return rows
+
+
+def dead_letters(path, table):
+    with open(os.path.join(path, 'dead', f'{table}.jsonl')) as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_bad_row_is_dead_lettered_and_the_rest_written(writer, db, tmp_path):
+    writer.record_many('chat_history', [chat(1), ('bad', 'q', 'a'), chat(2)])
+    writer.flush()
+
+    assert db.rows == [chat(1), chat(2)]
+    assert [d['row'] for d in dead_letters(tmp_path, 'chat_history')] == [['bad', 'q', 'a']]
+    assert journal_rows(tmp_path) == []
+    assert writer._db_down_until == 0.0  # a bad row is not an outage
+    assert writer.stats()['dead_lettered'] == 1
+
+
+def test_outage_spills_to_journal_and_replay_drains_it(writer, db, tmp_path):
+    db.down = True
+    writer.record_many('chat_history', [chat(1), chat(2)])
+    writer.flush()
+    assert db.rows == []
+    assert journal_rows(tmp_path) == [chat(1), chat(2)]
+    assert writer._db_down_until > 0
+
+    # Still backing off: new rows go straight to the journal
+    writer.record('chat_history', chat(3))
+    writer.flush()
+    assert journal_rows(tmp_path) == [chat(1), chat(2), chat(3)]
+
+    db.down = False
+    writer._db_down_until = 0.0
+    writer.record('chat_history', chat(4))
+    writer.flush()
+    assert sorted(db.rows) == [chat(1), chat(2), chat(3), chat(4)]
+    assert journal_rows(tmp_path) == []
+    assert writer.stats()['replayed'] == 3
+
+
+def test_replay_dead_letters_bad_journaled_rows(writer, db, tmp_path):
+    writer._spill('chat_history', [chat(1), ('bad', 'q', 'a'), chat(2)])
+    writer.flush()
+
+    assert db.rows == [chat(1), chat(2)]
+    assert len(dead_letters(tmp_path, 'chat_history')) == 1
+    assert journal_rows(tmp_path) == []
+
+    writer.flush()  # nothing left to replay
+    assert db.rows == [chat(1), chat(2)]
+
+
+def test_outage_during_row_retry_respills_only_unwritten_rows(writer, db, tmp_path):
+    rows = [chat(1), ('bad', 'q', 'a'), chat(2), chat(3)]
+    db.fail_after = 2  # chat(1) and the bad row are settled, then the database goes away
+    writer.record_many('chat_history', rows)
+    writer.flush()
+
+    assert db.rows == [chat(1)]
+    assert len(dead_letters(tmp_path, 'chat_history')) == 1
+    assert journal_rows(tmp_path) == [chat(2), chat(3)]
+
+    db.down, db.fail_after = False, None
+    writer._db_down_until = 0.0
+    writer.flush()
+    assert db.rows == [chat(1), chat(2), chat(3)]
+    assert journal_rows(tmp_path) == []
+
+
+def test_unknown_user_is_dead_lettered(writer, db, tmp_path):
+    writer.record_many('chat_history', [chat(1), ('orphan', 'q', 'a')])
+    writer.flush()
+
+    assert db.rows == [chat(1)]
+    assert [d['row'] for d in dead_letters(tmp_path, 'chat_history')] == [['orphan', 'q', 'a']]
+
+
+def test_missing_table_is_an_outage_not_bad_rows(writer, db, tmp_path):
+    db.missing_table = True
+    writer.record_many('chat_history', [chat(1), chat(2)])
+    writer.flush()
+
+    assert db.rows == []
+    assert not os.path.exists(os.path.join(tmp_path, 'dead'))
+    assert journal_rows(tmp_path) == [chat(1), chat(2)]
+    assert writer._db_down_until > 0
+
+    # Once the migration is applied the journal is replayed
+    db.missing_table = False
+    writer._db_down_until = 0.0
+    writer.flush()
+    assert db.rows == [chat(1), chat(2)]
+    assert journal_rows(tmp_path) == []
@@ -0,0 +1,128 @@
+"""Batch weather alert fan-out.
+
+Rules are evaluated once per weather tile that has at least one user, and the
+resulting tile alerts are joined against ``users`` inside MySQL, so a storm
+over a district costs one INSERT ... SELECT rather than a loop over users.
+"""
+import logging
+import time
+
+from utils.db import db_cursor
+from utils.weather import get_weather_service, tile_center
+
+log = logging.getLogger(__name__)
+
+# (alert_type, forecast field, [(threshold, severity), ...] highest first, message)
+ALERT_RULES = (
+    ('heavy_rain', 'precipitation', [(115.6, 'severe'), (64.5, 'high')],
+     'Heavy rain of {value} mm expected on {date}. Clear field drainage and delay spraying.'),
+    ('heat', 'temperature', [(45, 'severe'), (40, 'high')],
+     'Temperature up to {value}°C expected on {date}. Irrigate in the evening and shade nurseries.'),
+    ('high_wind', 'wind_speed', [(60, 'severe'), (40, 'high')],
+     'Winds up to {value} km/h expected on {date}. Stake young plants and postpone spraying.'),
+)
+
+
+def evaluate_forecast(forecast, horizon_days=2):
+    """Return ``[(alert_type, severity, description)]`` for the next days.
+
+    Only the worst day per alert type is reported.
+    """
+    alerts = []
+    days = forecast[:horizon_days]
+    for alert_type, field, levels, message in ALERT_RULES:
+        worst = None
+        for day in days:
+            value = day.get(field)
+            if value is None:
+                continue
+            for threshold, severity in levels:
+                if value >= threshold:
+                    if worst is None or value > worst[0]:
+                        worst = (value, severity, day['date'])
+                    break
+        if worst:
+            value, severity, date = worst
+            alerts.append((alert_type, severity, message.format(value=value, date=date)))
+    return alerts
+
+
+FAN_OUT_SQL = '''
+    INSERT INTO weather_alerts (user_id, alert_type, description, severity)
+    SELECT u.id, t.alert_type, t.description, t.severity
+    FROM tile_alerts t
+    JOIN users u ON u.tile_row = t.tile_row AND u.tile_col = t.tile_col
+    WHERE NOT EXISTS (
+        SELECT 1 FROM weather_alerts w
+        WHERE w.user_id = u.id
+          AND w.alert_date >= NOW() - INTERVAL %s HOUR
+          AND w.alert_type = t.alert_type
+    )
+'''
+
+
+def run_alert_fanout(cfg, dedupe_hours=12, horizon_days=2):
+    """Evaluate every populated tile and write alerts for its users."""
+    started = time.perf_counter()
+    service = get_weather_service(cfg)
+    deg = cfg.get('WEATHER_TILE_DEG', 0.1)
+
+    with db_cursor() as cursor:
+        cursor.execute('SELECT DISTINCT tile_row, tile_col FROM users WHERE tile_row IS NOT NULL')
+        tiles = cursor.fetchall()
+
+    tile_alerts = []
+    failed = 0
+    for tile in tiles:
+        lat, lon = tile_center(tile, deg)
+        try:
+            forecast, _, _ = service.get('forecast', lat, lon)
+        except Exception:
+            failed += 1
+            log.exception('Forecast failed for tile %s', tile)
+            continue
+        for alert_type, severity, description in evaluate_forecast(forecast, horizon_days):
+            tile_alerts.append((tile[0], tile[1], alert_type, severity, description))
+
+    inserted = 0
+    if tile_alerts:
+        # Temporary tables are per-connection, so stage and fan out on one cursor
+        with db_cursor(commit=True) as cursor:
+            cursor.execute('''
+                CREATE TEMPORARY TABLE IF NOT EXISTS tile_alerts (
+                    tile_row INT NOT NULL,
+                    tile_col INT NOT NULL,
+                    alert_type VARCHAR(50) NOT NULL,
+                    severity VARCHAR(20),
+                    description TEXT NOT NULL,
+                    PRIMARY KEY (tile_row, tile_col, alert_type)
+                )
+            ''')
+            cursor.execute('TRUNCATE TABLE tile_alerts')
+            cursor.executemany(
+                'INSERT INTO tile_alerts (tile_row, tile_col, alert_type, severity, description) '
+                'VALUES (%s, %s, %s, %s, %s)', tile_alerts)
+            cursor.execute(FAN_OUT_SQL, (dedupe_hours,))
+            inserted = cursor.rowcount
+            cursor.execute('DROP TEMPORARY TABLE tile_alerts')
+
+    return {
+        'tiles': len(tiles),
+        'tiles_failed': failed,
+        'tile_alerts': len(tile_alerts),
+        'alerts_inserted': inserted,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def recent_alerts(user_id, hours=24, limit=10):
+    """Latest alerts for one user via the (user_id, alert_date) index."""
+    with db_cursor(dictionary=True) as cursor:
+        cursor.execute('''
+            SELECT alert_type, description, severity, alert_date
+            FROM weather_alerts
+            WHERE user_id = %s AND alert_date >= NOW() - INTERVAL %s HOUR
+            ORDER BY alert_date DESC
+            LIMIT %s
+        ''', (user_id, hours, limit))
+        return cursor.fetchall()
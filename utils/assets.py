@@ -0,0 +1,276 @@
+"""Static asset build: minified, content-hashed, precompressed files.
+
+``python manage.py build-assets`` writes ``static/dist/``:
+
+* CSS and JS, minified with ``rcssmin``/``rjsmin`` (if either is missing, a
+  warning is logged once and a small built-in CSS minifier is used, or JS is
+  written as-is) and named ``<name>.<hash>.<ext>``;
+* ``.gz`` and, with the ``brotli`` package, ``.br`` siblings of each text file;
+* images as hashed originals plus WebP and AVIF copies at a few widths;
+* ``manifest.json``, mapping source names to built files.
+
+Templates keep calling ``url_for('static', filename=...)``; ``routes/assets.py``
+swaps in the hashed URL when the manifest has the file. Without a build, the
+plain ``/static`` URLs are used, so development needs no extra step.
+Images whose source did not change are not re-encoded on the next build.
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are written without it
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:  # in requirements.txt; the built-in CSS minifier is a fallback
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:  # in requirements.txt; JS is shipped unminified without it
+    rjsmin = None
+
+log = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+TEXT_TYPES = ('.css', '.js')
+IMAGE_TYPES = ('.jpg', '.jpeg', '.png')
+IMAGE_WIDTHS = (480, 960, 1600)
+IMAGE_FORMATS = {'avif': {'quality': 50}, 'webp': {'quality': 80, 'method': 6}}
+HASH_LENGTH = 10
+
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_RE = re.compile(r'\s*([{};,>])\s*|(:)\s+')
+_INCLUDE_RE = re.compile(
+    r'<(?:script[^>]*\ssrc|link[^>]*\shref)\s*=\s*"([^"]+)"', re.I)
+_STATIC_URL_RE = re.compile(r"""url_for\(\s*['"]static['"]\s*,\s*filename\s*=\s*['"]([^'"]+)['"]\s*\)""")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+_fallbacks_logged = set()
+
+
+def _log_fallback(package, effect):
+    """Warn once per build process that ``package`` is missing."""
+    if package not in _fallbacks_logged:
+        _fallbacks_logged.add(package)
+        log.warning('%s is not installed; %s (pip install -r requirements.txt)', package, effect)
+
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    _log_fallback('rcssmin', 'using the built-in CSS minifier')
+    text = _CSS_COMMENT_RE.sub('', text)
+    text = _CSS_SPACE_RE.sub(r'\1\2', ' '.join(text.split()))
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    _log_fallback('rjsmin', 'JavaScript is written unminified')
+    return text  # gzip/brotli recover most of the difference
+
+
+def _hashed_name(name, data, suffix=''):
+    stem, ext = os.path.splitext(name)
+    return f'{stem}{suffix}.{_digest(data)}{ext}'
+
+
+def _write(out_dir, name, data, compress=False):
+    path = os.path.join(out_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as fh:
+        fh.write(data)
+    encodings = []
+    if compress:
+        if brotli is not None:
+            with open(path + '.br', 'wb') as fh:
+                fh.write(brotli.compress(data, quality=11))
+            encodings.append('br')
+        with open(path + '.gz', 'wb') as fh:
+            fh.write(gzip.compress(data, compresslevel=9, mtime=0))
+        encodings.append('gzip')
+    return encodings
+
+
+def _image_variants(src, name, out_dir, previous):
+    """Hashed original plus resized WebP/AVIF copies; reuses the last build's
+    output when the source is unchanged."""
+    from PIL import Image, features
+
+    with open(src, 'rb') as fh:
+        data = fh.read()
+    source_hash = _digest(data)
+    if previous and previous.get('source') == source_hash and all(
+            os.path.exists(os.path.join(out_dir, f)) for f in _image_files(previous)):
+        return previous
+
+    entry = {'source': source_hash, 'file': _hashed_name(name, data), 'variants': {}}
+    _write(out_dir, entry['file'], data)
+    with Image.open(src) as image:
+        image.load()
+        entry['width'], entry['height'] = image.size
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        widths = sorted({min(w, image.width) for w in IMAGE_WIDTHS})
+        stem = os.path.splitext(name)[0]
+        for fmt, options in IMAGE_FORMATS.items():
+            if not features.check(fmt):
+                log.info('Pillow has no %s support; skipping %s variants', fmt, fmt)
+                continue
+            entry['variants'][fmt] = []
+            for width in widths:
+                height = round(image.height * width / image.width)
+                resized = image if width == image.width else image.resize(
+                    (width, height), Image.Resampling.LANCZOS)
+                out = _encode_image(resized, fmt, options)
+                filename = _hashed_name(f'{stem}.{fmt}', out, suffix=f'-{width}')
+                _write(out_dir, filename, out)
+                entry['variants'][fmt].append([width, filename])
+    return entry
+
+
+def _encode_image(image, fmt, options):
+    buf = io.BytesIO()
+    image.save(buf, format=fmt.upper(), **options)
+    return buf.getvalue()
+
+
+def _image_files(entry):
+    yield entry['file']
+    for variants in entry.get('variants', {}).values():
+        for _, filename in variants:
+            yield filename
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def build(static_dir, out_dir):
+    """Build every asset under ``static_dir`` into ``out_dir``; returns the manifest."""
+    previous = load_manifest(out_dir) or {}
+    manifest = {'files': {}, 'encodings': {}, 'images': {}}
+    os.makedirs(out_dir, exist_ok=True)
+    out_real = os.path.realpath(out_dir)
+
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        dirnames[:] = [d for d in dirnames if os.path.realpath(os.path.join(dirpath, d)) != out_real]
+        for filename in sorted(filenames):
+            src = os.path.join(dirpath, filename)
+            name = os.path.relpath(src, static_dir).replace(os.sep, '/')
+            ext = os.path.splitext(filename)[1].lower()
+            if ext in TEXT_TYPES:
+                with open(src, encoding='utf-8') as fh:
+                    text = fh.read()
+                data = (minify_css(text) if ext == '.css' else minify_js(text)).encode('utf-8')
+                built = _hashed_name(name, data)
+                manifest['encodings'][built] = _write(out_dir, built, data, compress=True)
+                manifest['files'][name] = built
+            elif ext in IMAGE_TYPES:
+                entry = _image_variants(src, name, out_dir, previous.get('images', {}).get(name))
+                manifest['images'][name] = entry
+                manifest['files'][name] = entry['file']
+
+    # Drop outputs of earlier builds that nothing references any more
+    keep = {MANIFEST}
+    for built, encodings in manifest['encodings'].items():
+        keep.add(built)
+        keep.update(f'{built}.{"gz" if e == "gzip" else e}' for e in encodings)
+    for entry in manifest['images'].values():
+        keep.update(_image_files(entry))
+    for dirpath, _, filenames in os.walk(out_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.relpath(path, out_dir).replace(os.sep, '/') not in keep:
+                os.remove(path)
+
+    tmp = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+def duplicate_includes(template_dir):
+    """``{template: [asset, ...]}`` for scripts/stylesheets included more than once."""
+    found = {}
+    for name in sorted(os.listdir(template_dir)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(template_dir, name), encoding='utf-8') as fh:
+            html = re.sub(r'<!--.*?-->', '', fh.read(), flags=re.S)
+        seen, dupes = set(), []
+        for ref in _INCLUDE_RE.findall(html):
+            static = _STATIC_URL_RE.search(ref)
+            ref = static.group(1) if static else ref
+            if ref in seen and ref not in dupes:
+                dupes.append(ref)
+            seen.add(ref)
+        if dupes:
+            found[name] = dupes
+    return found
+
+
+class Assets:
+    """The built manifest, as seen by the request path."""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.manifest = load_manifest(out_dir)
+        self._served = set()
+        if self.manifest is None:
+            log.info('No asset manifest in %s; serving unhashed /static files', out_dir)
+        else:
+            self._served.update(self.manifest['encodings'])
+            for entry in self.manifest['images'].values():
+                self._served.update(_image_files(entry))
+
+    def built(self, name):
+        """Hashed file name for a source asset, or None."""
+        return self.manifest['files'].get(name) if self.manifest else None
+
+    def encodings(self, built):
+        return self.manifest['encodings'].get(built, ()) if self.manifest else ()
+
+    def is_served(self, built):
+        return built in self._served
+
+    def variants(self, name, fmt):
+        """``[(width, built name)]`` for an image in ``fmt`` ('webp', 'avif')."""
+        entry = self.manifest['images'].get(name) if self.manifest else None
+        return [tuple(v) for v in entry['variants'].get(fmt, ())] if entry else []
+
+
+_assets = None
+_assets_lock = threading.Lock()
+
+
+def default_out_dir(root):
+    return os.path.join(root, 'static', 'dist')
+
+
+def get_assets(cfg, root):
+    global _assets
+    if _assets is None:
+        with _assets_lock:
+            if _assets is None:
+                _assets = Assets(cfg.get('ASSETS_DIR') or default_out_dir(root))
+    return _assets
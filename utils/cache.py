@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+# All caches created through TTLCache register here so their counters can be
+# reported from a single place.
+_registry = {}
+
+
+class RedisBackend:
+    """Shared cache store so several gunicorn workers see the same entries."""
+
+    def __init__(self, url, namespace):
+        if redis is None:
+            raise RuntimeError('redis package not installed')
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+
+    def _key(self, key):
+        return f'{self.namespace}:{json.dumps(key, default=str)}'
+
+    def generation(self):
+        return int(self.client.get(f'{self.namespace}:__gen__') or 0)
+
+    def bump_generation(self):
+        return int(self.client.incr(f'{self.namespace}:__gen__'))
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, entry, ttl):
+        self.client.set(self._key(key), pickle.dumps(entry), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+
+class FileStamp:
+    """Generation counter shared by every process on the host through a file.
+
+    Each bump appends one byte, so the file size is the generation: reading it
+    is a single ``stat``, and bumps from several processes never collide.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def generation(self):
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def bump_generation(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'ab') as fh:
+            fh.write(b'.')
+        return self.generation()
+
+
+class KeyStamps:
+    """One :class:`FileStamp` per key under ``directory``.
+
+    For caches whose single keys change (user rows): a per-key ``invalidate``
+    bumps that key's stamp, and every process on the host sees it with one
+    ``stat`` on its next lookup of the key. Files only exist for keys that
+    were ever invalidated.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _stamp(self, key):
+        name = hashlib.sha1(json.dumps(key, default=str).encode('utf-8')).hexdigest()
+        return FileStamp(os.path.join(self.directory, name[:2], name))
+
+    def generation(self, key):
+        return self._stamp(key).generation()
+
+    def bump_generation(self, key):
+        return self._stamp(key).bump_generation()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and hit/miss counters.
+
+    Entries are stored as ``(value, stored_at, expires_at, generation)``. When a
+    shared backend is configured, local entries from an older generation are
+    dropped, so an invalidation in any process reaches every worker. With
+    ``maxbytes`` set, least recently used entries are also evicted once the
+    values' total ``sizeof`` exceeds it. Without a backend, a ``stamp``
+    (:class:`FileStamp`) plays the same role for the processes of one host,
+    e.g. a manage.py command and the gunicorn workers.
+
+    Generations only carry whole-cache invalidations. For data whose single
+    keys change (user rows), ``key_stamps`` (:class:`KeyStamps`) also tags
+    local entries with their key's stamp, so a per-key ``invalidate`` reaches
+    the other workers on the host; ``local_ttl`` caps how long a local entry
+    is kept, which bounds staleness across hosts sharing a backend. A
+    ``local_ttl`` of 0 keeps entries in the backend only.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=300, backend=None, maxbytes=None, sizeof=None,
+                 local_ttl=None, stamp=None, key_stamps=None):
+        self.name = name
+        self.local_ttl = local_ttl
+        self.stamp = stamp
+        self.key_stamps = key_stamps
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof or _pickled_size
+        self._sizes = {}
+        self._bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _registry[name] = self
+
+    def _current_generation(self):
+        source = self.backend if self.backend is not None else self.stamp
+        if source is None:
+            return self._generation
+        try:
+            return source.generation()
+        except Exception:
+            return self._generation
+
+    def _local_generation(self, key, gen):
+        # Key stamps are per host, so they only tag local entries
+        if self.key_stamps is None:
+            return gen
+        try:
+            return gen, self.key_stamps.generation(key)
+        except OSError:
+            return gen, None
+
+    def _local_entry(self, key, entry, gen, now):
+        """``entry`` as kept locally: tagged with the key's stamp, ``local_ttl`` applied."""
+        value, stored_at, expires_at, _ = entry
+        if self.local_ttl is not None:
+            expires_at = min(expires_at, now + self.local_ttl)
+        return value, stored_at, expires_at, self._local_generation(key, gen)
+
+    def get_entry(self, key):
+        """Return ``(value, stored_at)`` or ``None`` on a miss."""
+        now = time.time()
+        gen = self._current_generation()
+        local_gen = self._local_generation(key, gen)
+        with self._lock:
+            entry = self._data.get(key) if self.local_ttl != 0 else None
+            if entry is not None:
+                value, stored_at, expires_at, entry_gen = entry
+                if expires_at > now and entry_gen == local_gen:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value, stored_at
+                self._discard(key)
+
+        if self.backend is not None:
+            try:
+                entry = self.backend.get(key)
+            except Exception:
+                entry = None
+            if entry is not None and entry[2] > now and entry[3] == gen:
+                if self.local_ttl != 0:
+                    self._store(key, self._local_entry(key, entry, gen, now))
+                with self._lock:
+                    self.hits += 1
+                return entry[0], entry[1]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        gen = self._current_generation()
+        entry = (value, now, now + ttl, gen)
+        if self.local_ttl != 0:
+            self._store(key, self._local_entry(key, entry, gen, now))
+        if self.backend is not None:
+            try:
+                self.backend.set(key, entry, ttl)
+            except Exception:
+                pass
+        return value
+
+    def _discard(self, key):
+        # Caller holds the lock
+        self._data.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def _store(self, key, entry):
+        size = self.sizeof(entry[0]) if self.maxbytes else 0
+        with self._lock:
+            if self.maxbytes:
+                self._bytes += size - self._sizes.get(key, 0)
+                self._sizes[key] = size
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while self._data and (len(self._data) > self.maxsize or
+                                  (self.maxbytes and self._bytes > self.maxbytes)):
+                self._discard(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when ``key`` is None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+                self._sizes.clear()
+                self._bytes = 0
+                self._generation += 1
+            else:
+                self._discard(key)
+        if key is not None and self.key_stamps is not None:
+            try:
+                self.key_stamps.bump_generation(key)
+            except OSError:
+                pass
+        if self.backend is not None:
+            try:
+                if key is None:
+                    self.backend.bump_generation()
+                else:
+                    self.backend.delete(key)
+            except Exception:
+                pass
+        elif key is None and self.stamp is not None:
+            try:
+                self.stamp.bump_generation()
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'shared': self.backend is not None,
+                'local_ttl': self.local_ttl,
+                **({'bytes': self._bytes, 'maxbytes': self.maxbytes} if self.maxbytes else {}),
+            }
+
+    def save(self, path):
+        """Write unexpired local entries to ``path`` (atomically); returns the count."""
+        now = time.time()
+        with self._lock:
+            entries = [(key, entry[:3]) for key, entry in self._data.items() if entry[2] > now]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as fh:
+            pickle.dump(entries, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return len(entries)
+
+    def load(self, path):
+        """Restore entries written by :meth:`save`, skipping expired ones."""
+        try:
+            with open(path, 'rb') as fh:
+                entries = pickle.load(fh)
+        except FileNotFoundError:
+            return 0
+        now = time.time()
+        gen = self._current_generation()
+        loaded = 0
+        for key, (value, stored_at, expires_at) in entries:
+            if expires_at > now:
+                self._store(key, self._local_entry(key, (value, stored_at, expires_at, gen), gen, now))
+                loaded += 1
+        return loaded
+
+
+def _pickled_size(value):
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def make_cache(name, cfg, maxsize_key, ttl_key, maxsize=1024, ttl=300,
+               maxbytes_key=None, maxbytes=None, local_ttl_key=None, local_ttl=None,
+               stamp_path=None, key_stamp_dir=None):
+    """Build a cache from app config, attaching the shared backend if set.
+
+    ``stamp_path`` names the :class:`FileStamp` used when there is no backend;
+    ``key_stamp_dir`` holds per-key stamps (:class:`KeyStamps`).
+    """
+    backend = None
+    url = cfg.get('CACHE_REDIS_URL')
+    if url:
+        try:
+            backend = RedisBackend(url, f'agri:{name}')
+        except Exception:
+            backend = None
+    return TTLCache(
+        name,
+        maxsize=cfg.get(maxsize_key, maxsize),
+        ttl=cfg.get(ttl_key, ttl),
+        backend=backend,
+        maxbytes=cfg.get(maxbytes_key, maxbytes) if maxbytes_key else maxbytes,
+        local_ttl=cfg.get(local_ttl_key, local_ttl) if local_ttl_key else local_ttl,
+        stamp=FileStamp(stamp_path) if stamp_path and backend is None else None,
+        key_stamps=KeyStamps(key_stamp_dir) if key_stamp_dir else None,
+    )
+
+
+def all_cache_stats():
+    return {name: cache.stats() for name, cache in _registry.items()}
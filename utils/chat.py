@@ -0,0 +1,207 @@
+"""Chat reply generation, returned whole or streamed as Server-Sent Events.
+
+Models expose ``stream(prompt)``, a generator of text chunks. The JSON
+endpoints join it; streaming clients get each chunk as an SSE ``token`` event
+as soon as it is produced. When the client disconnects the WSGI server closes
+the response iterator, which closes the model generator, so generation stops
+instead of running to completion for nobody.
+"""
+import json
+import logging
+import re
+import threading
+import time
+
+from flask import Response, request, stream_with_context
+
+log = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\S+\s*')
+
+
+def _tokens(text, delay):
+    for token in _TOKEN_RE.findall(text):
+        if delay:
+            time.sleep(delay)
+        yield token
+
+
+class PlaceholderModel:
+    """Canned reply emitted word by word, standing in for a real LLM."""
+
+    name = 'placeholder'
+    # Replies echo the prompt, which must not reach other users via the cache
+    cacheable = False
+
+    def __init__(self, template, delay_ms=0):
+        self.template = template
+        self.delay = delay_ms / 1000.0
+
+    def stream(self, prompt):
+        return _tokens(self.template.format(prompt=prompt), self.delay)
+
+    def reply(self, prompt):
+        return ''.join(self.stream(prompt))
+
+
+class LocalAnswer:
+    """Reply assembled from knowledge-base passages, with no model call."""
+
+    name = 'local'
+
+    def __init__(self, hits, delay_ms=0):
+        self.hits = hits
+        self.text = ' '.join(hit['text'] for hit in hits)
+        self.sources = [hit['id'] for hit in hits]
+        self.delay = delay_ms / 1000.0
+
+    def stream(self, prompt):
+        return _tokens(self.text, self.delay)
+
+    def reply(self, prompt):
+        return self.text
+
+
+class CachedReply:
+    """A reply served from the response cache."""
+
+    name = 'cache'
+    cached = True
+
+    def __init__(self, entry):
+        self.text = entry['reply']
+        self.sources = entry['sources']
+
+    def stream(self, prompt):
+        return _tokens(self.text, 0)
+
+    def reply(self, prompt):
+        return self.text
+
+
+def choose_model(query, cfg, root, fallback, scope):
+    """Cached reply, else a local knowledge answer, else ``fallback()`` (the model).
+
+    ``scope`` names the endpoint and model (``'chatbot:placeholder'``); cached
+    replies are only shared within it.
+    """
+    from utils.chat_cache import get_response_cache
+
+    entry = get_response_cache(cfg, root).get(query, scope)
+    if entry is not None:
+        return CachedReply(entry)
+    return local_answer(query, cfg, root) or fallback()
+
+
+def remember(query, model, reply, cfg, root, scope):
+    """Cache a finished reply unless it came from the cache or echoes the prompt."""
+    from utils.chat_cache import get_response_cache
+
+    if not getattr(model, 'cached', False) and getattr(model, 'cacheable', True):
+        get_response_cache(cfg, root).put(query, reply, getattr(model, 'sources', ()), scope)
+
+
+def local_answer(query, cfg, root):
+    """A :class:`LocalAnswer` when the knowledge index matches ``query`` well, else None.
+
+    The best passage must clear ``KNOWLEDGE_MIN_SCORE`` and match at least
+    ``KNOWLEDGE_MIN_COVERAGE`` of the query terms; runners-up from the same
+    source with a close score are appended. UI phrase catalogues are searchable
+    but never used as an answer.
+    """
+    from utils.knowledge import get_knowledge_base
+
+    try:
+        hits = get_knowledge_base(cfg, root).search(query, cfg.get('KNOWLEDGE_TOP_K', 3))
+    except Exception:
+        log.exception('Knowledge search failed')
+        return None
+    hits = [h for h in hits if not h['source'].startswith('lang/')]
+    if not hits:
+        return None
+    best = hits[0]
+    if best['score'] < cfg.get('KNOWLEDGE_MIN_SCORE', 2.0) or \
+            best['coverage'] < cfg.get('KNOWLEDGE_MIN_COVERAGE', 0.5):
+        return None
+    chosen = [best] + [h for h in hits[1:]
+                       if h['source'] == best['source'] and h['score'] >= 0.8 * best['score']]
+    return LocalAnswer(chosen, cfg.get('CHAT_STREAM_DELAY_MS', 0))
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {'streams': 0, 'completed': 0, 'cancelled': 0, 'errors': 0}
+        self.first_token_ms = []
+
+    def incr(self, name):
+        with self._lock:
+            self.values[name] += 1
+
+    def first_token(self, ms):
+        with self._lock:
+            self.first_token_ms.append(ms)
+            del self.first_token_ms[:-1000]
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.values)
+            samples = sorted(self.first_token_ms)
+        if samples:
+            out['first_token_ms_p50'] = samples[len(samples) // 2]
+            out['first_token_ms_p95'] = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return out
+
+
+counters = _Counters()
+
+
+def wants_stream(payload):
+    """Streaming is opt-in: ``"stream": true``, ``?stream=1`` or an SSE Accept header."""
+    if payload.get('stream') or request.args.get('stream') in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+def stream_events(tokens, on_done=None, extra=None):
+    """Yield SSE events for a token generator, ending with ``done`` or ``error``.
+
+    ``on_done(reply)`` runs only when generation finished; a cancelled stream
+    is not saved. ``extra`` is merged into the ``done`` event.
+    """
+    counters.incr('streams')
+    started = time.perf_counter()
+    parts = []
+    try:
+        # Sent before the first token so proxies and clients see headers at once
+        yield ': stream open\n\n'
+        for token in tokens:
+            if not parts:
+                counters.first_token(round((time.perf_counter() - started) * 1000, 2))
+            parts.append(token)
+            yield _event('token', {'text': token})
+        reply = ''.join(parts)
+        if on_done:
+            on_done(reply)
+        counters.incr('completed')
+        yield _event('done', dict(extra or {}, reply=reply))
+    except GeneratorExit:
+        counters.incr('cancelled')
+        log.info('Chat stream cancelled after %d tokens', len(parts))
+        raise
+    except Exception as e:
+        counters.incr('errors')
+        log.exception('Chat stream failed')
+        yield _event('error', {'message': str(e)})
+    finally:
+        tokens.close()
+
+
+def sse_response(tokens, on_done=None, extra=None):
+    return Response(stream_with_context(stream_events(tokens, on_done, extra)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,215 @@
+"""Response cache for chatbot questions, keyed on a normalized query.
+
+Keys are order-insensitive sets of folded words. Queries in Devanagari,
+Tamil, Telugu, Kannada or Malayalam are transliterated to Latin first, using
+the shared layout of those Unicode blocks. Then both native and romanized
+spellings go through the same folding (long vowels, aspirates, doubled
+letters, final schwa), so "नीम का तेल" and "neem ka tel" hit the same entry.
+The folding is only used to build keys; replies are stored verbatim.
+
+Every key is also scoped to the endpoint and model that produced the reply,
+so one endpoint never serves another's answers. Replies that echo the
+prompt (the placeholder models) are never cached, since the prompt could
+contain another user's personal details.
+
+Price and weather questions get short TTLs; everything else lives for days.
+The local LRU is bounded by entry count and by reply bytes, and it is saved
+to disk periodically and at exit so a restart does not start cold.
+"""
+import atexit
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from utils.cache import make_cache
+from utils.knowledge import STOPWORDS
+
+log = logging.getLogger(__name__)
+
+# Devanagari, Tamil, Telugu, Kannada, Malayalam: same offsets for the same sounds
+_INDIC_BLOCKS = (0x0900, 0x0B80, 0x0C00, 0x0C80, 0x0D00)
+_CONSONANTS = dict(zip(range(0x15, 0x3A), '''
+    k kh g gh ng c ch j jh ny t th d dh n t th d dh n n p ph b bh m y r r l l l v sh s s h
+'''.split()))
+_VOWELS = {0x05: 'a', 0x06: 'aa', 0x07: 'i', 0x08: 'ii', 0x09: 'u', 0x0A: 'uu', 0x0B: 'ri',
+           0x0E: 'e', 0x0F: 'e', 0x10: 'ai', 0x12: 'o', 0x13: 'o', 0x14: 'au'}
+_SIGNS = {0x3E: 'aa', 0x3F: 'i', 0x40: 'ii', 0x41: 'u', 0x42: 'uu', 0x43: 'ri', 0x46: 'e',
+          0x47: 'e', 0x48: 'ai', 0x4A: 'o', 0x4B: 'o', 0x4C: 'au', 0x57: 'au'}
+_OTHER = {0x01: 'n', 0x02: 'n', 0x03: 'h',
+          # Malayalam chillu (final) consonants
+          0x7A: 'n', 0x7B: 'n', 0x7C: 'r', 0x7D: 'l', 0x7E: 'l', 0x7F: 'k',
+          **{0x66 + d: str(d) for d in range(10)}}
+_VIRAMA, _NUKTA = 0x4D, 0x3C
+
+
+def _indic_offset(cp):
+    for base in _INDIC_BLOCKS:
+        if base <= cp < base + 0x80:
+            return cp - base
+    return None
+
+
+def transliterate(text):
+    """Rough ISO 15919-style romanization of the supported Indic scripts."""
+    out = []
+    pending = False  # consonant still carrying its inherent 'a'
+    for ch in text:
+        off = _indic_offset(ord(ch))
+        if off is None:
+            if pending:
+                out.append('a')
+                pending = False
+            out.append(ch)
+        elif off in _CONSONANTS:
+            if pending:
+                out.append('a')
+            out.append(_CONSONANTS[off])
+            pending = True
+        elif off in _SIGNS:
+            out.append(_SIGNS[off])
+            pending = False
+        elif off == _VIRAMA:
+            pending = False
+        elif off != _NUKTA:
+            if pending:
+                out.append('a')
+                pending = False
+            out.append(_OTHER.get(off) or _VOWELS.get(off, ' '))
+    if pending:
+        out.append('a')
+    return ''.join(out)
+
+
+_ASPIRATE_RE = re.compile(r'([kgcjtdpb])h')
+_REPEAT_RE = re.compile(r'(.)\1+')
+
+
+def _fold(word):
+    # Spelling variants only occur in letters; "100" and "10" are different doses
+    if any(ch.isdigit() for ch in word):
+        return word
+    word = _ASPIRATE_RE.sub(r'\1', word)
+    word = word.replace('ee', 'i').replace('oo', 'u').replace('w', 'v')
+    word = _REPEAT_RE.sub(r'\1', word)
+    if len(word) > 3 and word.endswith('a'):
+        word = word[:-1]
+    return word
+
+
+# Question filler in romanized Indian languages, compared after folding;
+# English stopwords are dropped before folding so they cannot hide real words
+_INDIC_STOP = {_fold(w) for w in '''
+    aaj batao bataiye hai hain kaisa kaise kaisi kab kaun kitna kitni kya ke ki ka ko liye main
+    mein me mujhe par se aur ye yah wo enna eppadi evvalavu enge yenna emi ela enti
+    enu hege yavaga entha engane
+'''.split()}
+
+INTENT_WORDS = {
+    'price': {_fold(w) for w in '''
+        price prices rate rates cost mandi market bhav bhaav daam dam keemat kimat
+        vilai vila dhara dhar bele
+    '''.split()},
+    'weather': {_fold(w) for w in '''
+        weather rain rainfall forecast temperature humidity wind storm cyclone
+        mausam barish baarish varsha mazhai vaana male havamana
+    '''.split()},
+}
+
+
+def normalize_query(text):
+    """``(key, intent)`` for a free-text question; key is '' when nothing is left."""
+    text = unicodedata.normalize('NFC', text or '').lower()
+    words = {_fold(w) for w in re.findall(r'\w+', transliterate(text)) if w not in STOPWORDS}
+    words = sorted(w for w in words if w and w not in _INDIC_STOP)
+    intent = 'general'
+    for name, vocab in INTENT_WORDS.items():
+        if vocab.intersection(words):
+            intent = name
+            break
+    return ' '.join(words), intent
+
+
+class ResponseCache:
+    def __init__(self, cache, ttls, path=None, save_interval=300):
+        self.cache = cache
+        self.ttls = ttls
+        self.path = path
+        self.save_interval = save_interval
+        self._saved_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.by_intent = {}
+        if path:
+            try:
+                loaded = cache.load(path)
+                if loaded:
+                    log.info('Loaded %d cached chat replies from %s', loaded, path)
+            except Exception:
+                log.exception('Could not load chat cache from %s', path)
+            atexit.register(self.save)
+
+    def _count(self, intent, hit):
+        with self._lock:
+            counts = self.by_intent.setdefault(intent, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += 1
+
+    def get(self, query, scope=''):
+        """Cached ``{'reply', 'sources'}`` for ``query`` within ``scope``, or None."""
+        key, intent = normalize_query(query)
+        if not key:
+            return None
+        value = self.cache.get(f'{scope}|{key}')
+        self._count(intent, value is not None)
+        return value
+
+    def put(self, query, reply, sources=(), scope=''):
+        key, intent = normalize_query(query)
+        if not key or not reply:
+            return
+        self.cache.set(f'{scope}|{key}', {'reply': reply, 'sources': list(sources)},
+                       ttl=self.ttls.get(intent, self.ttls['general']))
+        if self.path and time.monotonic() - self._saved_at > self.save_interval:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return 0
+        self._saved_at = time.monotonic()
+        try:
+            return self.cache.save(self.path)
+        except Exception:
+            log.exception('Could not save chat cache to %s', self.path)
+            return 0
+
+    def stats(self):
+        with self._lock:
+            by_intent = {name: dict(c) for name, c in self.by_intent.items()}
+        return dict(self.cache.stats(), by_intent=by_intent)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(cfg, root):
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                general = cfg.get('CHAT_CACHE_TTL', 7 * 86400)
+                path = cfg.get('CHAT_CACHE_FILE')
+                if path is None:
+                    path = os.path.join(root, 'cache', 'chat_responses.pickle')
+                _cache = ResponseCache(
+                    make_cache('chat_responses', cfg, 'CHAT_CACHE_SIZE', 'CHAT_CACHE_TTL',
+                               maxsize=5000, ttl=general,
+                               maxbytes_key='CHAT_CACHE_MAX_BYTES', maxbytes=16 * 1024 * 1024),
+                    ttls={'general': general,
+                          'price': cfg.get('CHAT_CACHE_PRICE_TTL', 900),
+                          'weather': cfg.get('CHAT_CACHE_WEATHER_TTL', 1800)},
+                    path=path or None,
+                    save_interval=cfg.get('CHAT_CACHE_SAVE_INTERVAL', 300),
+                )
+    return _cache
@@ -1,29 +1,299 @@
+import importlib
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
 import mysql.connector
-from mysql.connector import pooling
 from flask import current_app
 
+from utils.metrics import POOL_WAIT, observe_query
+
 _pool = None
+_pool_lock = threading.Lock()
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class TimedCursor:
+    """Cursor proxy that reports each statement's time to ``utils.metrics``."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def execute(self, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._raw.execute(operation, *args, **kwargs)
+        finally:
+            observe_query(operation, time.perf_counter() - started)
+
+    def executemany(self, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._raw.executemany(operation, *args, **kwargs)
+        finally:
+            observe_query(operation, time.perf_counter() - started)
+
+
+class PooledConnection:
+    """Proxy for a pooled connection; ``close()`` hands it back to the pool."""
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = created_at
+        self.released_at = time.monotonic()
+        self.autocommit_off = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        if name in ('_pool', '_raw', 'created_at', 'released_at', 'autocommit_off'):
+            object.__setattr__(self, name, value)
+        else:
+            if name == 'autocommit':
+                # Tracked here so release() need not ask the server
+                object.__setattr__(self, 'autocommit_off', not value)
+            setattr(self._raw, name, value)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._raw.cursor(*args, **kwargs))
+
+    def close(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.release(self)
+
+
+class ConnectionPool:
+    """Thread-safe pool with bounded waits, overflow, pre-ping and recycling.
+
+    ``size`` connections are kept idle between requests; up to ``max_overflow``
+    more are opened under load and closed again when returned. A checkout
+    waits at most ``timeout`` seconds for a free slot.
+    """
+
+    def __init__(self, connect_args, size=5, max_overflow=5, timeout=5.0,
+                 recycle=3600, pre_ping_after=30, connect=None):
+        self.connect_args = connect_args
+        self.connect = connect or mysql.connector.connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping_after = pre_ping_after
+        self.pid = os.getpid()
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._waits = deque(maxlen=1000)
+        self.counters = {'checkouts': 0, 'timeouts': 0, 'errors': 0,
+                         'connects': 0, 'recycled': 0, 'wait_seconds_total': 0.0}
+
+    def _connect(self):
+        try:
+            raw = self.connect(autocommit=True, **self.connect_args)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self.counters['errors'] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.counters['connects'] += 1
+        return PooledConnection(self, raw, time.monotonic())
+
+    def _usable(self, conn):
+        now = time.monotonic()
+        if now - conn.created_at > self.recycle:
+            return False
+        if now - conn.released_at > self.pre_ping_after:
+            try:
+                conn._raw.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._open >= self.size + self.max_overflow:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(f'No DB connection free after {timeout:.1f}s')
+
+        if conn is not None and not self._usable(conn):
+            self._discard(conn._raw)
+            with self._cond:
+                self.counters['recycled'] += 1
+            conn = None
+        if conn is None:
+            conn = self._connect()
+        else:
+            conn._pool = self
+
+        waited = time.monotonic() - started
+        POOL_WAIT.observe(waited)
+        with self._cond:
+            self.counters['checkouts'] += 1
+            self.counters['wait_seconds_total'] += waited
+            self._waits.append(waited)
+        return conn
+
+    def release(self, conn):
+        if os.getpid() != self.pid:
+            return
+        try:
+            # Leave no half-finished transaction behind for the next user
+            if conn.autocommit_off:
+                conn._raw.rollback()
+                conn.autocommit = True
+        except Exception:
+            self._drop(conn)
+            return
+        conn.released_at = time.monotonic()
+        with self._cond:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+        self._drop(conn)
+
+    def _drop(self, conn):
+        self._discard(conn._raw)
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            p95 = waits[int(len(waits) * 0.95)] if waits else 0.0
+            return dict(
+                self.counters,
+                size=self.size,
+                max_overflow=self.max_overflow,
+                open=self._open,
+                idle=len(self._idle),
+                in_use=self._open - len(self._idle),
+                wait_ms_p95=round(p95 * 1000, 3),
+                wait_ms_max=round((waits[-1] if waits else 0.0) * 1000, 3),
+            )
+
+
+def _default_pool_size():
+    # One connection per request thread plus one for background writers
+    threads = int(os.environ.get('GUNICORN_THREADS') or os.environ.get('WEB_THREADS') or 4)
+    return threads + 1
+
+
+def _connector(path):
+    """``module:function`` from MYSQL_CONNECTOR, or None for mysql.connector."""
+    if not path:
+        return None
+    module, _, attr = path.partition(':')
+    return getattr(importlib.import_module(module), attr or 'connect')
+
 
 def init_pool(app=None):
     global _pool
     cfg = app.config if app is not None else current_app.config
-    if _pool is None:
-        _pool = pooling.MySQLConnectionPool(
-            pool_name=cfg.get('MYSQL_POOL_NAME', 'agri_pool'),
-            pool_size=cfg.get('MYSQL_POOL_SIZE', 5),
-            host=cfg.get('MYSQL_HOST'),
-            user=cfg.get('MYSQL_USER'),
-            password=cfg.get('MYSQL_PASSWORD'),
-            database=cfg.get('MYSQL_DB'),
-            autocommit=True,
-        )
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(
+                {
+                    'host': cfg.get('MYSQL_HOST'),
+                    'user': cfg.get('MYSQL_USER'),
+                    'password': cfg.get('MYSQL_PASSWORD'),
+                    'database': cfg.get('MYSQL_DB'),
+                    'connection_timeout': cfg.get('MYSQL_CONNECT_TIMEOUT', 5),
+                },
+                size=cfg.get('MYSQL_POOL_SIZE') or _default_pool_size(),
+                max_overflow=cfg.get('MYSQL_POOL_OVERFLOW', 5),
+                timeout=cfg.get('MYSQL_POOL_TIMEOUT', 5.0),
+                recycle=cfg.get('MYSQL_POOL_RECYCLE', 3600),
+                pre_ping_after=cfg.get('MYSQL_POOL_PRE_PING', 30),
+                connect=_connector(cfg.get('MYSQL_CONNECTOR')),
+            )
+
+
+def _reset_after_fork():
+    # The parent's sockets must not be shared; children build their own pool
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 
 def get_conn():
-    global _pool
-    if _pool is None:
+    if _pool is None or _pool.pid != os.getpid():
         # attempt to initialize from current_app if available
         try:
             init_pool()
         except Exception:
             raise RuntimeError('DB pool not initialized')
-    return _pool.get_connection()
+    return _pool.acquire()
+
+
+@contextmanager
+def db_cursor(dictionary=False, commit=False):
+    """Yield a cursor on a pooled connection and always give both back."""
+    conn = get_conn()
+    try:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield cursor
+            if commit:
+                conn.commit()
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def with_cursor(dictionary=False, commit=False):
+    """Decorator form of ``db_cursor``; the cursor is passed as ``cursor=``."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with db_cursor(dictionary=dictionary, commit=commit) as cursor:
+                return fn(*args, cursor=cursor, **kwargs)
+        return wrapper
+    return decorator
+
+
+def pool_stats():
+    return _pool.stats() if _pool is not None else {}
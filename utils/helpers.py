@@ -1,11 +1,47 @@
-from flask import jsonify
+from functools import lru_cache
+
+from flask import has_request_context, jsonify, request
 
 def json_response(status: str, message: str, data=None, code=200):
     if data is None:
         data = {}
+    if status == 'success' and has_request_context():
+        fields = request.args.get('fields')
+        if fields:
+            data = project(data, parse_fields(fields))
     payload = {"status": status, "message": message, "data": data}
     return jsonify(payload), code
 
 def validate_required_fields(payload: dict, fields: list):
     missing = [f for f in fields if f not in payload or payload.get(f) in (None, '')]
     return missing
+
+@lru_cache(maxsize=256)
+def parse_fields(text: str):
+    """``'prices.market,prices.modal_price,count'`` -> ``{'prices': {'market': {}, 'modal_price': {}}, 'count': {}}``.
+
+    An empty dict keeps the whole value under that key.
+    """
+    tree = {}
+    for path in text.split(','):
+        parts = [p for p in path.strip().split('.') if p]
+        if not parts:
+            continue
+        node = tree
+        for part in parts[:-1]:
+            if part in node and not node[part]:
+                break  # a shorter path already keeps the whole value
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = {}
+    return tree
+
+def project(value, tree):
+    """Keep only the paths in ``tree`` (from ``parse_fields``); lists are projected item by item."""
+    if not tree:
+        return value
+    if isinstance(value, dict):
+        return {key: project(value[key], sub) for key, sub in tree.items() if key in value}
+    if isinstance(value, (list, tuple)):
+        return [project(item, tree) for item in value]
+    return value
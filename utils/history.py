@@ -0,0 +1,151 @@
+"""Per-user history of pest detections, soil tests, chats and weather alerts.
+
+Pages use keyset pagination on ``(timestamp DESC, id DESC)``, never OFFSET.
+Each page is read in two steps:
+
+1. The page keys ``(id, timestamp)`` come from the ``(user_id, timestamp)``
+   index alone, since the primary key is stored in every secondary index. It
+   is a range scan that starts at the cursor and stops after ``limit + 1``
+   entries, so page 500 costs the same as page 1.
+2. The displayed columns are then fetched by primary key for just those ids.
+
+The activity feed runs step 1 against every stream and merges the already
+sorted key lists with ``heapq.merge`` (a k-way merge). It fetches details
+only for the rows that made the page. A UNION over the tables would have to
+sort every candidate row, TEXT columns included, before the LIMIT.
+
+Rows written through ``utils.writebehind`` appear once they are flushed,
+usually within WRITE_BEHIND_FLUSH_MS.
+"""
+import base64
+import collections
+import datetime
+import heapq
+import json
+
+from utils.db import db_cursor
+
+# kind: table, timestamp column and the columns an item shows. Kinds are
+# listed in feed order for rows that share a timestamp.
+Stream = collections.namedtuple('Stream', 'table ts columns')
+STREAMS = collections.OrderedDict([
+    ('pest', Stream('pest_detections', 'detected_at',
+                    ('pest_name', 'confidence_score', 'recommendations'))),
+    ('soil', Stream('soil_tests', 'test_date',
+                    ('ph_level', 'nitrogen_level', 'phosphorus_level', 'potassium_level',
+                     'organic_matter', 'moisture_content', 'recommendations'))),
+    ('chat', Stream('chat_history', 'created_at', ('message', 'response'))),
+    ('alert', Stream('weather_alerts', 'alert_date', ('alert_type', 'description', 'severity'))),
+])
+_RANK = {kind: i for i, kind in enumerate(STREAMS)}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+Key = collections.namedtuple('Key', 'at rank id kind')
+
+
+class InvalidPage(ValueError):
+    """A malformed ``cursor`` or ``limit``."""
+
+
+def encode_cursor(key):
+    raw = json.dumps([key.at.isoformat(sep=' '), key.kind, key.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token):
+    """Opaque ``next_cursor`` -> Key; raises InvalidPage."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        at, kind, row_id = json.loads(raw)
+        return Key(datetime.datetime.fromisoformat(at), _RANK[kind], int(row_id), kind)
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidPage(f'Invalid cursor: {token!r}') from e
+
+
+def _keyset(kind, after):
+    """WHERE clause and params for the rows of ``kind`` strictly after ``after``
+    in (timestamp DESC, kind rank, id DESC) order."""
+    ts = STREAMS[kind].ts
+    if after is None:
+        return '', ()
+    rank = _RANK[kind]
+    if rank < after.rank:
+        return f' AND {ts} < %s', (after.at,)
+    if rank > after.rank:
+        return f' AND {ts} <= %s', (after.at,)
+    # Spelled out rather than as a row comparison so MySQL plans it as index ranges
+    return f' AND ({ts} < %s OR ({ts} = %s AND id < %s))', (after.at, after.at, after.id)
+
+
+def _keys(cursor, kind, user_id, after, limit):
+    stream = STREAMS[kind]
+    where, params = _keyset(kind, after)
+    cursor.execute(
+        f'SELECT id, {stream.ts} FROM {stream.table} WHERE user_id = %s{where} '
+        f'ORDER BY {stream.ts} DESC, id DESC LIMIT %s',
+        (user_id,) + params + (limit,))
+    rank = _RANK[kind]
+    return [Key(at, rank, row_id, kind) for row_id, at in cursor.fetchall()]
+
+
+def _details(cursor, kind, user_id, ids):
+    if not ids:
+        return {}
+    stream = STREAMS[kind]
+    cursor.execute(
+        f"SELECT id, {', '.join(stream.columns)} FROM {stream.table} "
+        f"WHERE user_id = %s AND id IN ({', '.join(['%s'] * len(ids))})",
+        (user_id,) + tuple(ids))
+    rows = {}
+    for row in cursor.fetchall():
+        item = dict(zip(stream.columns, row[1:]))
+        if 'recommendations' in item:
+            item['recommendations'] = [line for line in (item['recommendations'] or '').split('\n') if line]
+        rows[row[0]] = item
+    return rows
+
+
+def _page(cursor, user_id, keys, limit):
+    """Items for the first ``limit`` keys, and the cursor for the next page."""
+    more = len(keys) > limit
+    keys = keys[:limit]
+    by_kind = collections.defaultdict(list)
+    for key in keys:
+        by_kind[key.kind].append(key.id)
+    details = {kind: _details(cursor, kind, user_id, ids) for kind, ids in by_kind.items()}
+    items = []
+    for key in keys:
+        row = details[key.kind].get(key.id)
+        if row is not None:  # deleted between the two reads
+            items.append(dict(row, kind=key.kind, id=key.id, at=key.at.isoformat()))
+    return {'items': items, 'next_cursor': encode_cursor(keys[-1]) if more and keys else None}
+
+
+def clamp_limit(value):
+    try:
+        return max(1, min(int(value), MAX_LIMIT))
+    except (TypeError, ValueError):
+        raise InvalidPage('limit must be a number')
+
+
+def history(user_id, kind, cursor_token=None, limit=DEFAULT_LIMIT):
+    """One page of ``kind`` for ``user_id``, newest first."""
+    after = decode_cursor(cursor_token) if cursor_token else None
+    if after is not None and after.kind != kind:
+        raise InvalidPage('Cursor belongs to a different history')
+    with db_cursor() as cursor:
+        return _page(cursor, user_id, _keys(cursor, kind, user_id, after, limit + 1), limit)
+
+
+def activity(user_id, kinds=None, cursor_token=None, limit=DEFAULT_LIMIT):
+    """One page of all streams (or ``kinds``) merged newest first."""
+    after = decode_cursor(cursor_token) if cursor_token else None
+    kinds = [k for k in STREAMS if kinds is None or k in kinds]
+    with db_cursor() as cursor:
+        # Each stream's page is already sorted; no stream can contribute more than limit + 1
+        streams = [_keys(cursor, kind, user_id, after, limit + 1) for kind in kinds]
+        merged = heapq.merge(*streams, key=lambda k: (k.at, -k.rank, k.id), reverse=True)
+        keys = [key for _, key in zip(range(limit + 1), merged)]
+        return _page(cursor, user_id, keys, limit)
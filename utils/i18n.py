@@ -0,0 +1,272 @@
+"""Server-side access to the phrase catalogues in ``lang/*.json``.
+
+Catalogues are loaded on first use and reloaded when their file changes, so
+edited translations show up without a restart. Keys are dotted paths
+(``soil_advice.ph_acidic``); a key missing from a language falls back to
+English, then to the key itself.
+
+For the browser, each catalogue is also cut into per-page bundles (the
+sections a page uses plus the shared ones, with English filled in for missing
+keys). Bundles are serialized once, named by a hash of their content, and
+pre-compressed with gzip, plus brotli when the ``brotli`` package is
+installed. Requests then only pick the stored bytes.
+"""
+import collections
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # optional: bundles are served gzip-only without it
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LANGUAGE = 'en'
+# Standard codes mapped to the file names used by the front end
+LANGUAGE_ALIASES = {'ml': 'ma'}
+
+
+class Catalogues:
+    def __init__(self, lang_dir):
+        self.lang_dir = lang_dir
+        self._loaded = {}  # lang -> (mtime_ns, data)
+        self._lock = threading.Lock()
+
+    def available(self):
+        try:
+            return sorted(f[:-5] for f in os.listdir(self.lang_dir) if f.endswith('.json'))
+        except FileNotFoundError:
+            return []
+
+    def resolve(self, lang):
+        """Normalize ``lang`` ('hi-IN', 'ml', ...) to an available catalogue."""
+        code = (lang or '').strip().lower().replace('_', '-').split('-')[0]
+        code = LANGUAGE_ALIASES.get(code, code)
+        if code and os.path.exists(os.path.join(self.lang_dir, f'{code}.json')):
+            return code
+        return DEFAULT_LANGUAGE
+
+    def negotiate(self, accept_languages):
+        """First ``Accept-Language`` entry with a catalogue, or None."""
+        available = set(self.available())
+        return next((value for value, _ in accept_languages
+                     if self.resolve(value) in available), None)
+
+    def get(self, lang):
+        """The catalogue dict for ``lang`` ({} if it does not exist)."""
+        path = os.path.join(self.lang_dir, f'{lang}.json')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        loaded = self._loaded.get(lang)
+        if loaded is None or loaded[0] != mtime:
+            with open(path, encoding='utf-8') as fh:
+                data = json.load(fh)
+            with self._lock:
+                self._loaded[lang] = loaded = (mtime, data)
+        return loaded[1]
+
+    def _lookup(self, lang, key):
+        node = self.get(lang)
+        for part in key.split('.'):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node if isinstance(node, str) else None
+
+    def translate(self, key, lang=DEFAULT_LANGUAGE):
+        return self._lookup(lang, key) or self._lookup(DEFAULT_LANGUAGE, key) or key
+
+
+# Catalogue sections each page translates; COMMON_SECTIONS go to every page
+COMMON_SECTIONS = ('lang', 'settings')
+PAGE_SECTIONS = {
+    'index': ('index',),
+    'home': ('home',),
+    'login': ('login',),
+    'signup': ('signup',),
+    'soil': ('soil', 'soil_advice'),
+    'pest': ('pest',),
+    'voice': ('voice', 'chatbot'),
+    'chatbot': ('chatbot',),
+    'weather': ('weather',),
+    'market': ('market',),
+}
+ALL_PAGES = 'all'  # the whole catalogue, for pages without an entry above
+
+_DATA_KEY_RE = re.compile(r'data-key="([\w.]+)"')
+
+Bundle = collections.namedtuple('Bundle', 'data body etag gzip br')
+
+
+def page_for_endpoint(endpoint):
+    """Bundle name for a page view ('soil_page' -> 'soil')."""
+    page = (endpoint or '').rsplit('.', 1)[-1]
+    page = page[:-5] if page.endswith('_page') else page
+    return page if page in PAGE_SECTIONS else ALL_PAGES
+
+
+def _merge(base, over):
+    out = dict(base)
+    for key, value in over.items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            value = _merge(out[key], value)
+        out[key] = value
+    return out
+
+
+def _flat_keys(node, prefix=''):
+    keys = set()
+    for key, value in node.items():
+        if isinstance(value, dict):
+            keys |= _flat_keys(value, f'{prefix}{key}.')
+        else:
+            keys.add(prefix + key)
+    return keys
+
+
+def _encode(data):
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return Bundle(
+        data=data,
+        body=body,
+        etag=hashlib.sha256(body).hexdigest()[:16],
+        gzip=gzip.compress(body, compresslevel=9, mtime=0),
+        br=brotli.compress(body, quality=11) if brotli is not None else None,
+    )
+
+
+def template_keys(template_dir):
+    """``data-key`` values used by the templates under ``template_dir``."""
+    keys = set()
+    for name in sorted(os.listdir(template_dir)) if os.path.isdir(template_dir) else ():
+        if name.endswith('.html'):
+            with open(os.path.join(template_dir, name), encoding='utf-8') as fh:
+                keys.update(_DATA_KEY_RE.findall(fh.read()))
+    return keys
+
+
+def build_bundles(catalogues, template_dir=None):
+    """``({(lang, page): Bundle}, report)`` for every catalogue and page.
+
+    Raises ValueError when English is missing or lacks a section a page needs.
+    Missing translations are reported (and filled from English), not fatal.
+    """
+    en = catalogues.get(DEFAULT_LANGUAGE)
+    if not en:
+        raise ValueError(f'{DEFAULT_LANGUAGE}.json is missing or empty')
+    needed = set(COMMON_SECTIONS).union(*PAGE_SECTIONS.values())
+    absent = sorted(needed - set(en))
+    if absent:
+        raise ValueError(f'{DEFAULT_LANGUAGE}.json has no section(s): {", ".join(absent)}')
+
+    en_keys = _flat_keys(en)
+    report = {'missing': {}, 'unknown_template_keys': []}
+    if template_dir:
+        report['unknown_template_keys'] = sorted(template_keys(template_dir) - en_keys)
+
+    bundles = {}
+    for lang in catalogues.available():
+        data = catalogues.get(lang)
+        report['missing'][lang] = len(en_keys - _flat_keys(data))
+        full = _merge(en, data)
+        for page, sections in PAGE_SECTIONS.items():
+            bundles[lang, page] = _encode({s: full[s] for s in COMMON_SECTIONS + sections})
+        bundles[lang, ALL_PAGES] = _encode(full)
+    return bundles, report
+
+
+class Bundles:
+    """Built bundles, rebuilt when a catalogue changes.
+
+    A rebuild that fails keeps the previous bundles in service, like
+    ``utils.soil_rules.SoilRules``.
+    """
+
+    def __init__(self, catalogues, template_dir=None, check_interval=5.0):
+        self.catalogues = catalogues
+        self.template_dir = template_dir
+        self.check_interval = check_interval
+        self._bundles = None
+        self._signature = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.report = {}
+        self.builds = 0
+
+    def _signature_now(self):
+        lang_dir = self.catalogues.lang_dir
+        return tuple((lang, os.stat(os.path.join(lang_dir, f'{lang}.json')).st_mtime_ns)
+                     for lang in self.catalogues.available())
+
+    def _build(self):
+        signature = self._signature_now()
+        if signature == self._signature:
+            return
+        started = time.perf_counter()
+        try:
+            bundles, report = build_bundles(self.catalogues, self.template_dir)
+        except (OSError, ValueError):
+            if self._bundles is None:
+                raise
+            log.exception('Could not rebuild i18n bundles; keeping the previous ones')
+        else:
+            for lang, count in report['missing'].items():
+                if count:
+                    log.info('i18n: %s is missing %d key(s); English is used for them', lang, count)
+            if report['unknown_template_keys']:
+                log.warning('i18n: templates use keys not in %s.json: %s', DEFAULT_LANGUAGE,
+                            ', '.join(report['unknown_template_keys']))
+            report['build_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            self._bundles, self.report = bundles, report
+            self.builds += 1
+        self._signature = signature
+
+    def current(self):
+        now = time.monotonic()
+        if self._bundles is None or now - self._checked >= self.check_interval:
+            with self._lock:
+                if self._bundles is None or now - self._checked >= self.check_interval:
+                    self._checked = now
+                    self._build()
+        return self._bundles
+
+    def get(self, lang, page):
+        """The bundle for an exact catalogue code and page, or None."""
+        return self.current().get((lang, page))
+
+    def versions(self, page):
+        """``{lang: etag}`` for ``page``, for building cache-busting URLs."""
+        return {lang: bundle.etag for (lang, name), bundle in self.current().items() if name == page}
+
+
+_catalogues = {}
+_catalogues_lock = threading.Lock()
+_bundles = None
+_bundles_lock = threading.Lock()
+
+
+def get_catalogues(root):
+    lang_dir = os.path.join(root, 'lang')
+    if lang_dir not in _catalogues:
+        with _catalogues_lock:
+            _catalogues.setdefault(lang_dir, Catalogues(lang_dir))
+    return _catalogues[lang_dir]
+
+
+def get_bundles(cfg, root):
+    global _bundles
+    if _bundles is None:
+        with _bundles_lock:
+            if _bundles is None:
+                _bundles = Bundles(get_catalogues(root), os.path.join(root, 'templates'),
+                                   check_interval=cfg.get('I18N_RELOAD_INTERVAL', 5))
+    return _bundles
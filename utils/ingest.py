@@ -0,0 +1,276 @@
+"""Streaming bulk loader for Agmarknet-style mandi price dumps.
+
+Rows flow through a chain of generators (read -> parse -> dedupe -> batch) so
+memory stays flat regardless of file size, and each batch is upserted with a
+single ``executemany`` inside its own transaction.
+
+Each run is recorded in ``ingest_runs`` before its first write and marked
+finished after its last commit, with a heartbeat after every batch. Rows are
+stamped (``last_updated``) when their batch runs but only visible once it
+commits, so the sync API reads no further than the start of the oldest run
+still in flight (``utils.sync.price_watermark``).
+"""
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from functools import lru_cache
+
+from utils.db import get_conn
+
+log = logging.getLogger(__name__)
+
+# Agmarknet publishes full state names; the API and MOCK_DATA use short codes.
+STATE_CODES = {
+    'andhra pradesh': 'AP', 'arunachal pradesh': 'AR', 'assam': 'AS',
+    'bihar': 'BR', 'chattisgarh': 'CG', 'chhattisgarh': 'CG', 'goa': 'GA',
+    'gujarat': 'GJ', 'haryana': 'HR', 'himachal pradesh': 'HP',
+    'jammu and kashmir': 'JK', 'jharkhand': 'JH', 'karnataka': 'KA',
+    'kerala': 'KL', 'madhya pradesh': 'MP', 'maharashtra': 'MH',
+    'manipur': 'MN', 'meghalaya': 'ML', 'mizoram': 'MZ', 'nagaland': 'NL',
+    'odisha': 'OD', 'orissa': 'OD', 'punjab': 'PB', 'rajasthan': 'RJ',
+    'sikkim': 'SK', 'tamil nadu': 'TN', 'telangana': 'TS', 'tripura': 'TR',
+    'uttar pradesh': 'UP', 'uttarakhand': 'UK', 'uttrakhand': 'UK',
+    'west bengal': 'WB', 'nct of delhi': 'DL', 'delhi': 'DL',
+    'chandigarh': 'CH', 'puducherry': 'PY', 'pondicherry': 'PY',
+}
+
+# Header spellings seen in Agmarknet CSV exports and the data.gov.in JSON API
+FIELD_ALIASES = {
+    'state': ('state',),
+    'market': ('market', 'market_name', 'apmc'),
+    'crop_name': ('commodity', 'crop', 'crop_name'),
+    'variety': ('variety',),
+    'arrival_date': ('arrival_date', 'date', 'price_date', 'reported_date'),
+    'min_price': ('min_price', 'min_x0020_price', 'min price', 'minimum_price'),
+    'max_price': ('max_price', 'max_x0020_price', 'max price', 'maximum_price'),
+    'modal_price': ('modal_price', 'modal_x0020_price', 'modal price'),
+}
+
+DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d-%b-%Y')
+
+UPSERT_SQL = '''
+    INSERT INTO market_prices
+    (state, crop_name, market, variety, min_price, max_price, modal_price, arrival_date)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        min_price = VALUES(min_price),
+        max_price = VALUES(max_price),
+        modal_price = VALUES(modal_price)
+'''
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def read_records(path):
+    """Yield raw dict records from a CSV, JSON Lines or JSON dump."""
+    name = path[:-3] if path.endswith('.gz') else path
+    with _open_text(path) as fh:
+        if name.endswith('.csv'):
+            yield from csv.DictReader(fh)
+        elif name.endswith('.jsonl') or name.endswith('.ndjson'):
+            for line in fh:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            # Plain JSON has to be parsed whole; prefer .jsonl for big dumps
+            doc = json.load(fh)
+            yield from doc.get('records', []) if isinstance(doc, dict) else doc
+
+
+def _normalize_keys(record):
+    lowered = {str(k).strip().lower(): v for k, v in record.items()}
+    out = {}
+    for field, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            if alias in lowered:
+                out[field] = lowered[alias]
+                break
+    return out
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(value):
+    # A dump covers few distinct dates, so memoizing skips most strptime calls
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f'unrecognized date {value!r}')
+
+
+def parse_records(records, stats):
+    """Map raw records onto market_prices rows, dropping invalid ones."""
+    for record in records:
+        try:
+            rec = _normalize_keys(record)
+            state = str(rec['state']).strip()
+            state = STATE_CODES.get(state.lower(), state.upper())
+            crop = str(rec['crop_name']).strip().lower()
+            market = str(rec['market']).strip()
+            variety = str(rec.get('variety') or '').strip()
+            min_price = float(rec['min_price'])
+            max_price = float(rec['max_price'])
+            modal_price = float(rec['modal_price'])
+            arrival = _parse_date(str(rec['arrival_date']))
+        except (KeyError, TypeError, ValueError):
+            stats['invalid'] += 1
+            continue
+
+        if not (state and crop and market) or min_price < 0 or min_price > max_price:
+            stats['invalid'] += 1
+            continue
+        # Some markets report a modal price outside their own range; clamp it
+        modal_price = min(max(modal_price, min_price), max_price)
+        yield (state, crop, market, variety, min_price, max_price, modal_price, arrival)
+
+
+def dedupe_rows(rows, stats):
+    """Drop repeated (state, crop, market, variety, date) keys within a run.
+
+    Only an 8-byte digest of each key is kept so millions of rows fit easily.
+    """
+    seen = set()
+    for row in rows:
+        key = '\x1f'.join((row[0], row[1], row[2], row[3], row[7].isoformat()))
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        if digest in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(digest)
+        yield row
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _skip(records, count, stats):
+    for i, record in enumerate(records):
+        stats['read'] += 1
+        if i >= count:
+            yield record
+
+
+def _load_checkpoint(path, source):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as fh:
+        state = json.load(fh)
+    return state.get('offset', 0) if state.get('source') == os.path.abspath(source) else 0
+
+
+def _save_checkpoint(path, source, offset):
+    if not path:
+        return
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump({'source': os.path.abspath(source), 'offset': offset,
+                   'saved_at': datetime.utcnow().isoformat() + 'Z'}, fh)
+    os.replace(tmp, path)
+
+
+def _start_run(conn, cursor, source):
+    """Record the run, committed before any price row is written."""
+    cursor.execute('INSERT INTO ingest_runs (source) VALUES (%s)', (os.path.abspath(source)[-255:],))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def _touch_run(conn, cursor, run_id, column='heartbeat_at'):
+    cursor.execute(f'UPDATE ingest_runs SET {column} = NOW() WHERE id = %s', (run_id,))
+    conn.commit()
+
+
+def _upsert(conn, cursor, batch):
+    try:
+        cursor.executemany(UPSERT_SQL, batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class _Counting:
+    """Counts how many source records have been pulled through the pipeline."""
+
+    def __init__(self, records, start):
+        self.records = records
+        self.offset = start
+
+    def __iter__(self):
+        for record in self.records:
+            self.offset += 1
+            yield record
+
+
+def ingest_file(path, batch_size=5000, checkpoint=None, dry_run=False):
+    """Stream ``path`` into market_prices and return run statistics.
+
+    With ``checkpoint`` set, the source offset is saved after each committed
+    batch and a rerun on the same file resumes from there.
+    """
+    stats = {'read': 0, 'invalid': 0, 'duplicates': 0, 'upserted': 0, 'batches': 0}
+    start = _load_checkpoint(checkpoint, path)
+    if start:
+        log.info('Resuming %s from record %d', path, start)
+
+    source = _Counting(_skip(read_records(path), start, stats), start)
+    rows = dedupe_rows(parse_records(source, stats), stats)
+
+    if dry_run:
+        checkpoint = None
+    conn = None if dry_run else get_conn()
+    cursor = run_id = None
+    began = time.perf_counter()
+    try:
+        if conn is not None:
+            conn.autocommit = False
+            cursor = conn.cursor()
+            run_id = _start_run(conn, cursor, path)
+        for batch in batched(rows, batch_size):
+            if conn is not None:
+                _upsert(conn, cursor, batch)
+                _touch_run(conn, cursor, run_id)
+            stats['upserted'] += len(batch)
+            stats['batches'] += 1
+            _save_checkpoint(checkpoint, path, source.offset)
+            elapsed = time.perf_counter() - began
+            log.info('%d rows upserted (%.0f rows/s)', stats['upserted'],
+                     stats['upserted'] / elapsed if elapsed else 0)
+        _save_checkpoint(checkpoint, path, source.offset)
+    finally:
+        if conn is not None:
+            if run_id is not None:
+                try:
+                    _touch_run(conn, cursor, run_id, 'finished_at')
+                except Exception:
+                    # Left open, the run stops holding sync back once its
+                    # heartbeat is INGEST_RUN_STALE_MINUTES old
+                    log.exception('Could not mark ingest run %s finished', run_id)
+            if cursor is not None:
+                cursor.close()
+            conn.autocommit = True
+            conn.close()
+
+    stats['seconds'] = round(time.perf_counter() - began, 3)
+    stats['rows_per_sec'] = round(stats['upserted'] / stats['seconds']) if stats['seconds'] else 0
+    return stats
@@ -0,0 +1,175 @@
+"""Background job runner backed by a process pool.
+
+Heavy work (image decoding, resizing) runs in pool processes so a slow photo
+does not hold a request thread. Job state is kept as small JSON files, which
+every gunicorn worker on the instance can read, so a client can poll any
+worker for a job submitted to another. A job is ``queued`` until a pool
+process picks it up, then ``running``, then ``done`` or ``failed``.
+"""
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _write_job(path, job):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(job, fh)
+    os.replace(tmp, path)
+
+
+def _run_job(path, fn, args):
+    """Mark the job running, then run it; executes in the pool process."""
+    try:
+        with open(path) as fh:
+            job = json.load(fh)
+        job.update(status='running', started_at=time.time())
+        _write_job(path, job)
+    except (OSError, ValueError):
+        pass  # status is informational; never fail the job over it
+    return fn(*args)
+
+
+def then(future, fn):
+    """Future for ``fn(future.result())``, without a thread waiting on it."""
+    out = Future()
+
+    def done(f):
+        try:
+            out.set_result(fn(f.result()))
+        except Exception as e:
+            out.set_exception(e)
+
+    future.add_done_callback(done)
+    return out
+
+
+class JobQueue:
+    def __init__(self, job_dir, max_workers=2, max_pending=32, ttl=3600, max_streams=2):
+        self.job_dir = job_dir
+        self.max_pending = max_pending
+        self.ttl = ttl
+        os.makedirs(job_dir, exist_ok=True)
+        # spawn keeps children clear of the parent's threads and works on Windows
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._submitted = 0
+        # Each event stream holds a request thread, so only a few may be open
+        self._streams = threading.BoundedSemaphore(max_streams)
+
+    def _path(self, job_id):
+        return os.path.join(self.job_dir, f'{job_id}.json')
+
+    def _write(self, job):
+        _write_job(self._path(job['id']), job)
+
+    def get(self, job_id):
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id)) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def open_stream(self):
+        """Reserve an event-stream slot; False when all are taken."""
+        return self._streams.acquire(blocking=False)
+
+    def close_stream(self):
+        self._streams.release()
+
+    def submit(self, fn, args, owner=None, on_done=None):
+        """Run ``fn(*args)`` in the pool and return the new job record.
+
+        ``on_done(result)`` runs in this process once ``fn`` succeeds. Its
+        return value becomes the job's result; if it is a Future, the job
+        finishes when that resolves. Raises QueueFull when ``max_pending`` jobs
+        are already waiting.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull()
+            self._pending += 1
+            self._submitted += 1
+            prune = self._submitted % 100 == 0
+
+        job = {'id': uuid.uuid4().hex, 'owner': owner, 'status': 'queued',
+               'created_at': time.time(), 'started_at': None, 'finished_at': None,
+               'result': None, 'error': None}
+        self._write(job)
+        try:
+            future = self._pool.submit(_run_job, self._path(job['id']), fn, args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(lambda f: self._finish(job, f, on_done))
+        if prune:
+            self._prune()
+        return job
+
+    def _finish(self, job, future, on_done):
+        try:
+            result = future.result()
+            if on_done is not None:
+                result = on_done(result)
+        except Exception as e:
+            job.update(status='failed', error=str(e) or type(e).__name__)
+        else:
+            if isinstance(result, Future):
+                result.add_done_callback(lambda f: self._finish(job, f, None))
+                return
+            job.update(status='done', result=result)
+        # started_at was set by the pool process, in the file
+        job['started_at'] = (self.get(job['id']) or job).get('started_at')
+        job['finished_at'] = time.time()
+        with self._lock:
+            self._pending -= 1
+        self._write(job)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.job_dir):
+            path = os.path.join(self.job_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue(cfg, default_dir):
+    """Return this process's job queue, creating it lazily after a fork."""
+    global _queue, _queue_pid
+    if _queue is None or _queue_pid != os.getpid():
+        with _queue_lock:
+            if _queue is None or _queue_pid != os.getpid():
+                _queue = JobQueue(
+                    cfg.get('PEST_JOB_DIR') or default_dir,
+                    max_workers=cfg.get('PEST_JOB_WORKERS', 2),
+                    max_pending=cfg.get('PEST_JOB_MAX_PENDING', 32),
+                    ttl=cfg.get('PEST_JOB_TTL', 3600),
+                    max_streams=cfg.get('PEST_JOB_MAX_STREAMS', 2),
+                )
+                _queue_pid = os.getpid()
+    return _queue
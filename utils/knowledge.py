@@ -0,0 +1,374 @@
+"""BM25 retrieval over the app's own agronomy content.
+
+Passages come from the pest catalogue, the soil rules, the phrase catalogues in
+``lang/*.json`` and any ``.md``/``.txt`` file in the knowledge folder. The
+index is written as flat NumPy arrays (postings sorted by term, plus per-term
+offsets and document lengths) in a versioned directory. Each worker
+memory-maps the current version and scores queries with vectorized BM25.
+
+Rebuilds are incremental: every source has a fingerprint, and only sources
+whose fingerprint changed are re-read and re-tokenized. A new version is
+published by atomically replacing the ``CURRENT`` pointer, and workers notice
+it on their next check.
+"""
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Latin letters/digits plus the Indic blocks (Devanagari .. Malayalam), whose
+# vowel signs \w does not match
+_WORD_RE = re.compile(r'[0-9a-z\u0900-\u0dff]+')
+
+# Includes filler common in questions ("how do I get rid of ...")
+STOPWORDS = frozenset('''
+    a about an and any are as at be best by can do does for from get give has
+    have help how i if in is it its me my of on or please rid should so tell
+    that the their there this to was way what when where which why will with
+    you your
+'''.split())
+
+_CURRENT = 'CURRENT'
+_KEEP_VERSIONS = 2
+
+
+def _stem(token):
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [_stem(t) for t in _WORD_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+# --------- Sources ---------
+
+def _digest(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _file_fingerprint(path):
+    st = os.stat(path)
+    return f'{st.st_mtime_ns}:{st.st_size}'
+
+
+def _pest_passages():
+    from routes.pest import MOCK_PESTS
+
+    for key, info in MOCK_PESTS.items():
+        yield {
+            'id': f'pest:{key}',
+            'title': info['name'],
+            'text': f"{info['name']}: " + '. '.join(info['recommendations']) + '.',
+        }
+
+
+_SOIL_NAMES = {'ph': 'pH', 'nitrogen': 'Nitrogen (N)', 'phosphorus': 'Phosphorus (P)',
+               'potassium': 'Potassium (K)', 'organic_matter': 'Organic matter (%)',
+               'moisture_content': 'Moisture (%)'}
+
+
+def _soil_passages(rules_file, lang_dir):
+    from utils.i18n import Catalogues
+
+    with open(rules_file, encoding='utf-8') as fh:
+        rules = json.load(fh)['rules']
+    catalogues = Catalogues(lang_dir)
+    for rule in rules:
+        name = _SOIL_NAMES.get(rule['field'], rule['field'])
+        bounds = [f'{word} {rule[op]}' for op, word in
+                  (('gt', 'above'), ('gte', 'at least'), ('lt', 'below'), ('lte', 'at most'))
+                  if op in rule]
+        scope = ' '.join(filter(None, [rule.get('crop'), rule.get('state')]))
+        advice = catalogues.translate(rule['advice'])
+        yield {
+            'id': f"soil:{rule['id']}",
+            'title': advice.split(':')[0],
+            'text': f"Soil test{' for ' + scope if scope else ''}: {name} {' and '.join(bounds)}. {advice}.",
+        }
+
+
+def _strings(value):
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+    elif isinstance(value, str):
+        yield value
+
+
+def _lang_passages(path):
+    code = os.path.splitext(os.path.basename(path))[0]
+    with open(path, encoding='utf-8') as fh:
+        catalogue = json.load(fh)
+    for section, value in catalogue.items():
+        text = '. '.join(s.strip() for s in _strings(value) if s.strip())
+        if text:
+            yield {'id': f'lang:{code}:{section}', 'title': f'{section} ({code})', 'text': text}
+
+
+def _doc_passages(path, rel):
+    """One passage per paragraph, titled by the nearest Markdown heading."""
+    with open(path, encoding='utf-8') as fh:
+        blocks = re.split(r'\n\s*\n', fh.read())
+    title = os.path.splitext(os.path.basename(rel))[0].replace('_', ' ').replace('-', ' ')
+    n = 0
+    for block in blocks:
+        lines = [line.strip() for line in block.strip().splitlines() if line.strip()]
+        while lines and lines[0].startswith('#'):
+            title = lines.pop(0).lstrip('#').strip()
+        if not lines:
+            continue
+        n += 1
+        yield {'id': f'doc:{rel}#{n}', 'title': title, 'text': ' '.join(lines)}
+
+
+def collect_sources(lang_dir=None, docs_dir=None, rules_file=None):
+    """``[(key, fingerprint, loader)]`` for every indexable source."""
+    from routes.pest import MOCK_PESTS
+
+    sources = [('pests', _digest(MOCK_PESTS), _pest_passages)]
+    if rules_file and os.path.exists(rules_file):
+        # Advice text comes from en.json, so either file changing rebuilds it
+        en = os.path.join(lang_dir or '', 'en.json')
+        fingerprint = _file_fingerprint(rules_file)
+        if os.path.exists(en):
+            fingerprint += '|' + _file_fingerprint(en)
+        sources.append(('soil', fingerprint, lambda: _soil_passages(rules_file, lang_dir)))
+    if lang_dir and os.path.isdir(lang_dir):
+        for path in sorted(glob.glob(os.path.join(lang_dir, '*.json'))):
+            sources.append((f'lang/{os.path.basename(path)}', _file_fingerprint(path),
+                            lambda path=path: _lang_passages(path)))
+    if docs_dir and os.path.isdir(docs_dir):
+        for dirpath, _, files in os.walk(docs_dir):
+            for name in sorted(files):
+                if not name.endswith(('.md', '.txt')):
+                    continue
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, docs_dir).replace(os.sep, '/')
+                sources.append((f'docs/{rel}', _file_fingerprint(path),
+                                lambda path=path, rel=rel: _doc_passages(path, rel)))
+    return sources
+
+
+# --------- Build ---------
+
+def _read_current(index_dir):
+    try:
+        with open(os.path.join(index_dir, _CURRENT)) as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def build_index(index_dir, sources):
+    """Write a new index version and make it current; returns build stats."""
+    started = time.perf_counter()
+    os.makedirs(index_dir, exist_ok=True)
+
+    previous = {}
+    current = _read_current(index_dir)
+    if current:
+        try:
+            with open(os.path.join(index_dir, current, 'units.json'), encoding='utf-8') as fh:
+                previous = json.load(fh)
+        except (OSError, ValueError):
+            log.warning('Could not read previous knowledge index %s; rebuilding fully', current)
+
+    units, rebuilt = {}, 0
+    for key, fingerprint, load in sources:
+        old = previous.get(key)
+        if old and old['fingerprint'] == fingerprint:
+            units[key] = old
+            continue
+        rebuilt += 1
+        docs = []
+        for doc in load():
+            tf = Counter(tokenize(f"{doc['title']} {doc['text']}"))
+            if tf:
+                docs.append(dict(doc, source=key, tf=tf))
+        units[key] = {'fingerprint': fingerprint, 'docs': docs}
+
+    docs = [doc for unit in units.values() for doc in unit['docs']]
+    vocab = {term: i for i, term in enumerate(sorted({t for d in docs for t in d['tf']}))}
+
+    terms, doc_ids, freqs = [], [], []
+    for i, doc in enumerate(docs):
+        for term, count in doc['tf'].items():
+            terms.append(vocab[term])
+            doc_ids.append(i)
+            freqs.append(count)
+    terms = np.asarray(terms, dtype=np.int32)
+    order = np.argsort(terms, kind='stable')
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=len(vocab)), out=offsets[1:])
+    lengths = np.asarray([sum(d['tf'].values()) for d in docs], dtype=np.float32)
+
+    version = f'v{time.time_ns()}'
+    path = os.path.join(index_dir, version)
+    os.makedirs(path)
+    np.save(os.path.join(path, 'postings_doc.npy'), np.asarray(doc_ids, dtype=np.int32)[order])
+    np.save(os.path.join(path, 'postings_tf.npy'), np.asarray(freqs, dtype=np.float32)[order])
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+    np.save(os.path.join(path, 'lengths.npy'), lengths)
+    with open(os.path.join(path, 'vocab.json'), 'w', encoding='utf-8') as fh:
+        json.dump(vocab, fh, ensure_ascii=False)
+    with open(os.path.join(path, 'docs.json'), 'w', encoding='utf-8') as fh:
+        json.dump([{k: d[k] for k in ('id', 'title', 'text', 'source')} for d in docs], fh,
+                  ensure_ascii=False)
+    with open(os.path.join(path, 'units.json'), 'w', encoding='utf-8') as fh:
+        json.dump(units, fh, ensure_ascii=False)
+
+    tmp = os.path.join(index_dir, f'{_CURRENT}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as fh:
+        fh.write(version)
+    os.replace(tmp, os.path.join(index_dir, _CURRENT))
+
+    # Open mmaps keep unlinked files alive, so old versions can go right away
+    versions = sorted(d for d in os.listdir(index_dir) if d.startswith('v'))
+    for old in versions[:-_KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(index_dir, old), ignore_errors=True)
+
+    return {
+        'version': version,
+        'documents': len(docs),
+        'terms': len(vocab),
+        'sources': len(units),
+        'sources_rebuilt': rebuilt,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+# --------- Search ---------
+
+class KnowledgeIndex:
+    """One memory-mapped index version, scored with Okapi BM25."""
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.version = os.path.basename(path)
+        self.k1, self.b = k1, b
+        self.postings_doc = np.load(os.path.join(path, 'postings_doc.npy'), mmap_mode='r')
+        self.postings_tf = np.load(os.path.join(path, 'postings_tf.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.lengths = np.load(os.path.join(path, 'lengths.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'vocab.json'), encoding='utf-8') as fh:
+            self.vocab = json.load(fh)
+        with open(os.path.join(path, 'docs.json'), encoding='utf-8') as fh:
+            self.docs = json.load(fh)
+        self.avgdl = float(self.lengths.mean()) if len(self.lengths) else 1.0
+
+    def search(self, query, k=3):
+        """Top ``k`` passages with their BM25 score and matched-term coverage."""
+        terms = set(tokenize(query))
+        n = len(self.docs)
+        if not terms or not n:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        matched = np.zeros(n, dtype=np.int32)
+        for term in terms:
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            start, end = int(self.offsets[tid]), int(self.offsets[tid + 1])
+            docs = self.postings_doc[start:end]
+            tf = self.postings_tf[start:end]
+            idf = math.log(1 + (n - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[docs] / self.avgdl)
+            scores[docs] += idf * tf * (self.k1 + 1) / norm
+            matched[docs] += 1
+
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            dict(self.docs[i], score=round(float(scores[i]), 4),
+                 coverage=round(int(matched[i]) / len(terms), 3))
+            for i in top if scores[i] > 0
+        ]
+
+
+class KnowledgeBase:
+    """Per-process handle that follows the current index version."""
+
+    def __init__(self, index_dir, lang_dir=None, docs_dir=None, rules_file=None, check_interval=5.0):
+        self.index_dir = index_dir
+        self.lang_dir = lang_dir
+        self.docs_dir = docs_dir
+        self.rules_file = rules_file
+        self.check_interval = check_interval
+        self._index = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def reindex(self):
+        stats = build_index(self.index_dir,
+                            collect_sources(self.lang_dir, self.docs_dir, self.rules_file))
+        log.info('Knowledge index %s: %d documents, %d/%d sources rebuilt in %.3fs',
+                 stats['version'], stats['documents'], stats['sources_rebuilt'],
+                 stats['sources'], stats['seconds'])
+        with self._lock:
+            self._index = KnowledgeIndex(os.path.join(self.index_dir, stats['version']))
+            self._checked = time.monotonic()
+        return stats
+
+    def index(self):
+        now = time.monotonic()
+        if self._index is not None and now - self._checked < self.check_interval:
+            return self._index
+        with self._lock:
+            self._checked = now
+            version = _read_current(self.index_dir)
+            if version and (self._index is None or self._index.version != version):
+                self._index = KnowledgeIndex(os.path.join(self.index_dir, version))
+            index = self._index
+        if index is None:
+            self.reindex()
+            index = self._index
+        return index
+
+    def search(self, query, k=3):
+        return self.index().search(query, k)
+
+    def stats(self):
+        index = self._index
+        return {
+            'version': index.version if index else None,
+            'documents': len(index.docs) if index else 0,
+            'terms': len(index.vocab) if index else 0,
+        }
+
+
+_kb = None
+_kb_lock = threading.Lock()
+
+
+def get_knowledge_base(cfg, root):
+    from utils.soil_rules import default_rules_path
+
+    global _kb
+    if _kb is None:
+        with _kb_lock:
+            if _kb is None:
+                _kb = KnowledgeBase(
+                    cfg.get('KNOWLEDGE_INDEX_DIR') or os.path.join(root, 'index', 'knowledge'),
+                    lang_dir=os.path.join(root, 'lang'),
+                    docs_dir=cfg.get('KNOWLEDGE_DOCS_DIR') or os.path.join(root, 'knowledge'),
+                    rules_file=cfg.get('SOIL_RULES_FILE') or default_rules_path(root),
+                )
+    return _kb
@@ -0,0 +1,282 @@
+"""In-process metrics in the Prometheus text format, plus an opt-in profiler.
+
+Requests are timed by hooks installed with ``init_app``. Each one costs two
+``perf_counter`` calls, one lock and a few ``bisect`` calls. Histograms are
+fixed bucket arrays keyed by label tuple. The DB pool reports checkout waits,
+and pooled cursors report per-statement timings under a normalized statement
+shape (literals replaced, whitespace collapsed), so label cardinality stays
+bounded. Component ``stats()`` dicts (caches, pool, hasher, engine, weather,
+chat) are read only when ``/metrics`` is scraped.
+
+Each gunicorn worker keeps its own numbers. Scrape workers individually or
+put a scrape-side aggregator in front.
+
+With ``PROFILE_TOKEN`` set, a request sent with ``X-Profile: <token>`` is
+sampled by a background thread reading ``sys._current_frames()``. The folded
+stacks (flamegraph.pl / speedscope input) are written to ``PROFILE_DIR``, and
+the file name is returned in ``X-Profile-File``.
+"""
+import bisect
+import hmac
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+MAX_SHAPES = 200  # distinct statement shapes before new ones count as 'other'
+
+
+class Histogram:
+    def __init__(self, name, doc, labels, buckets):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def collect(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        for key, series in sorted(items):
+            base = _labels(self.labels, key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labels + ("le",), key + (le,))} {cumulative}')
+            lines.append(f'{self.name}_sum{base} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{base} {cumulative}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, doc, labels):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def add(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} gauge'] + [
+            f'{self.name}{_labels(self.labels, key)} {value}' for key, value in items
+        ]
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+# --------- Statement shapes ---------
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST_RE = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)')
+_shapes = {}
+_shapes_lock = threading.Lock()
+
+
+def statement_shape(sql):
+    """``SELECT ... WHERE id = ?``-style shape of a statement, at most 160 chars."""
+    shape = _shapes.get(sql)
+    if shape is None:
+        text = sql.decode() if isinstance(sql, bytes) else str(sql)
+        text = _NUMBER_RE.sub('?', _STRING_RE.sub('?', text))
+        text = _LIST_RE.sub('(...)', ' '.join(text.split()))
+        shape = text[:160]
+        with _shapes_lock:
+            if len(_shapes) >= 4 * MAX_SHAPES:
+                _shapes.clear()  # ad-hoc SQL with inlined values; start over
+            _shapes[sql] = shape
+    return shape
+
+
+# --------- Registry ---------
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time to produce the response',
+                            ('endpoint', 'method', 'status'), LATENCY_BUCKETS)
+REQUEST_SIZE = Histogram('http_request_size_bytes', 'Request body size',
+                         ('endpoint', 'method'), SIZE_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size (when known up front)',
+                          ('endpoint', 'method', 'status'), SIZE_BUCKETS)
+IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests being handled', ('endpoint',))
+POOL_WAIT = Histogram('db_pool_checkout_wait_seconds', 'Time to get a pooled DB connection',
+                      (), LATENCY_BUCKETS)
+QUERY_LATENCY = Histogram('db_query_duration_seconds', 'Statement execution time by shape',
+                          ('statement',), LATENCY_BUCKETS)
+METRICS = (REQUEST_LATENCY, REQUEST_SIZE, RESPONSE_SIZE, IN_FLIGHT, POOL_WAIT, QUERY_LATENCY)
+
+
+def observe_query(sql, seconds):
+    shape = statement_shape(sql)
+    if (shape,) not in QUERY_LATENCY._series and len(QUERY_LATENCY._series) >= MAX_SHAPES:
+        shape = 'other'
+    QUERY_LATENCY.observe(seconds, shape)
+
+
+def _component_stats():
+    """``{component: stats dict}`` for the singletons that already exist.
+
+    Read through module globals so a scrape never builds an engine, pool or
+    index that the worker has not needed yet.
+    """
+    from utils import cache, chat, chat_cache, db, inference, knowledge, passwords, weather, writebehind
+
+    found = {'db_pool': db.pool_stats(), 'chat_streams': chat.counters.stats()}
+    for name, holder in (('password_hasher', passwords._hasher), ('inference', inference._engine),
+                         ('weather', weather._service), ('write_behind', writebehind._writer),
+                         ('chat_response_cache', chat_cache._cache), ('knowledge', knowledge._kb)):
+        if holder is not None:
+            try:
+                found[name] = holder.stats()
+            except Exception:
+                log.exception('Could not read %s stats for /metrics', name)
+    for name, stats in cache.all_cache_stats().items():
+        found[f'cache_{name}'] = stats
+    return found
+
+
+def _numeric(stats, prefix=''):
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            yield prefix + key, int(value)
+        elif isinstance(value, (int, float)):
+            yield prefix + key, value
+        elif isinstance(value, dict):
+            yield from _numeric(value, f'{prefix}{key}_')
+
+
+_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def render():
+    """Everything, in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.collect())
+    components = _component_stats()
+    grouped = {}
+    for component, stats in components.items():
+        for key, value in _numeric(stats):
+            grouped.setdefault(_NAME_RE.sub('_', key), []).append((component, value))
+    for key, values in sorted(grouped.items()):
+        name = f'component_{key}'
+        lines.append(f'# TYPE {name} gauge')
+        lines.extend(f'{name}{{component="{_escape(c)}"}} {v}' for c, v in values)
+    return '\n'.join(lines) + '\n'
+
+
+# --------- Sampling profiler ---------
+class StackSampler:
+    """Counts the stacks of one thread every ``interval`` seconds."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if names:
+                key = ';'.join(reversed(names))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def write(self, directory, label):
+        os.makedirs(directory, exist_ok=True)
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{_NAME_RE.sub("_", label)}.folded'
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as fh:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                fh.write(f'{stack} {count}\n')
+        return name
+
+
+# --------- Flask hooks ---------
+def init_app(app):
+    from flask import g, request
+
+    token = app.config.get('PROFILE_TOKEN')
+    profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.root_path, 'profiles')
+    interval = app.config.get('PROFILE_INTERVAL_MS', 5) / 1000
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        g._metrics_endpoint = endpoint = request.endpoint or 'unmatched'
+        IN_FLIGHT.add(1, endpoint)
+        if token and hmac.compare_digest(request.headers.get('X-Profile', '').encode(),
+                                         token.encode()):
+            g._sampler = StackSampler(threading.get_ident(), interval).start()
+
+    @app.after_request
+    def _record(response):
+        started = g.get('_metrics_start')
+        if started is None:
+            return response
+        endpoint, method, status = g._metrics_endpoint, request.method, str(response.status_code)
+        REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint, method, status)
+        if request.content_length:
+            REQUEST_SIZE.observe(request.content_length, endpoint, method)
+        if response.content_length is not None:
+            RESPONSE_SIZE.observe(response.content_length, endpoint, method, status)
+        sampler = g.pop('_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+            try:
+                response.headers['X-Profile-File'] = sampler.write(profile_dir, endpoint)
+            except OSError:
+                app.logger.exception('Could not write profile')
+        return response
+
+    @app.teardown_request
+    def _finish(exc):
+        endpoint = g.pop('_metrics_endpoint', None)
+        if endpoint is not None:
+            IN_FLIGHT.add(-1, endpoint)
+        sampler = g.pop('_sampler', None)
+        if sampler is not None:
+            sampler.stop()
@@ -0,0 +1,168 @@
+"""Password hashing off the request threads.
+
+bcrypt is CPU-bound by design, so hashing and verification run in a small
+process pool instead of blocking web workers. The cost factor is
+``BCRYPT_ROUNDS``, or else tuned to ``BCRYPT_TARGET_MS`` once in the gunicorn
+master (``tune_once``) so every worker hashes at the same cost. Hashes with a
+lower cost are upgraded on login; higher ones are left alone.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+# bcrypt only reads the first 72 bytes; newer releases raise instead of truncating
+_MAX_BYTES = 72
+
+
+def _encode(password):
+    return password.encode('utf-8')[:_MAX_BYTES]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    try:
+        return bcrypt.checkpw(_encode(password), pw_hash.encode('utf-8'))
+    except ValueError:
+        return False
+
+
+def hash_cost(pw_hash):
+    """Cost factor of a ``$2b$12$...`` hash, or None if it is not bcrypt."""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def tune_rounds(target_ms, min_rounds=10, max_rounds=14):
+    """Highest cost whose hash time stays within ``target_ms`` on this CPU."""
+    rounds = min_rounds
+    elapsed = _timed_hash(rounds)
+    # Each extra round doubles the work, so predict before measuring
+    while rounds < max_rounds and elapsed * 2 <= target_ms:
+        rounds += 1
+        elapsed = _timed_hash(rounds)
+    if elapsed > target_ms and rounds > min_rounds:
+        rounds -= 1
+    return rounds
+
+
+# Set by tune_once in the gunicorn master and inherited by the workers
+TUNED_ROUNDS_ENV = 'BCRYPT_TUNED_ROUNDS'
+
+
+def tune_once(cfg):
+    """Cost for every process started from this one: ``BCRYPT_ROUNDS`` when set,
+    else tuned here and exported through ``TUNED_ROUNDS_ENV``."""
+    rounds = cfg.get('BCRYPT_ROUNDS') or int(os.environ.get(TUNED_ROUNDS_ENV, 0))
+    if not rounds:
+        rounds = tune_rounds(cfg.get('BCRYPT_TARGET_MS', 250),
+                             cfg.get('BCRYPT_MIN_ROUNDS', 10),
+                             cfg.get('BCRYPT_MAX_ROUNDS', 14))
+        os.environ[TUNED_ROUNDS_ENV] = str(rounds)
+    return rounds
+
+
+def _timed_hash(rounds):
+    started = time.perf_counter()
+    _hash('calibration-password', rounds)
+    return (time.perf_counter() - started) * 1000
+
+
+class PasswordHasher:
+    def __init__(self, rounds, workers=2, timeout=10):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._lock = threading.Lock()
+        self._latency = {'hash': deque(maxlen=1000), 'verify': deque(maxlen=1000)}
+        self._counts = {'hash': 0, 'verify': 0, 'rehash': 0, 'errors': 0}
+        # Checked for unknown emails until real verify timings are known
+        self._dummy_hash = _hash(os.urandom(16).hex(), rounds)
+
+    def _run(self, kind, fn, *args):
+        started = time.perf_counter()
+        try:
+            result = self._pool.submit(fn, *args).result(timeout=self.timeout)
+        except Exception:
+            with self._lock:
+                self._counts['errors'] += 1
+            raise
+        with self._lock:
+            self._counts[kind] += 1
+            self._latency[kind].append(time.perf_counter() - started)
+        return result
+
+    def hash(self, password):
+        return self._run('hash', _hash, password, self.rounds)
+
+    def verify(self, pw_hash, password):
+        if not pw_hash:
+            self._reject()
+            return False
+        return self._run('verify', _check, pw_hash, password)
+
+    def _reject(self):
+        """Fail an unknown user in the time a real check takes, without the CPU.
+
+        Sleeps for the median observed verify time; until there are samples it
+        falls back to checking a dummy hash.
+        """
+        with self._lock:
+            samples = sorted(self._latency['verify'])
+        if len(samples) < 10:
+            self._run('verify', _check, self._dummy_hash, 'x')
+        else:
+            time.sleep(samples[len(samples) // 2])
+
+    def needs_rehash(self, pw_hash):
+        # Only ever upgrade, so hosts tuned to different costs cannot flip hashes back
+        cost = hash_cost(pw_hash)
+        return cost is not None and cost < self.rounds
+
+    def upgrade(self, pw_hash, password):
+        """New hash at the current cost if ``pw_hash`` is outdated, else None."""
+        if not self.needs_rehash(pw_hash):
+            return None
+        new_hash = self.hash(password)
+        with self._lock:
+            self._counts['rehash'] += 1
+        return new_hash
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._counts, rounds=self.rounds)
+            for kind, samples in self._latency.items():
+                ordered = sorted(samples)
+                out[f'{kind}_ms_p50'] = round(ordered[len(ordered) // 2] * 1000, 2) if ordered else 0.0
+                out[f'{kind}_ms_p99'] = round(ordered[int(len(ordered) * 0.99)] * 1000, 2) if ordered else 0.0
+            return out
+
+
+_hasher = None
+_hasher_pid = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher(cfg):
+    """Return this process's hasher; outside gunicorn the cost is tuned here."""
+    global _hasher, _hasher_pid
+    if _hasher is None or _hasher_pid != os.getpid():
+        with _hasher_lock:
+            if _hasher is None or _hasher_pid != os.getpid():
+                _hasher = PasswordHasher(
+                    tune_once(cfg),
+                    workers=cfg.get('PASSWORD_HASH_WORKERS', 2),
+                    timeout=cfg.get('PASSWORD_HASH_TIMEOUT', 10),
+                )
+                _hasher_pid = os.getpid()
+    return _hasher
@@ -0,0 +1,100 @@
+"""Vectorized price-history statistics over columnar market_prices data.
+
+Rows are scattered onto a dense (market x day) grid so rolling windows and
+week-over-week changes are plain array operations; Python only loops over
+markets when building the JSON payload.
+"""
+import numpy as np
+
+
+def _rolling_mean(values, counts, width):
+    """Trailing mean over ``width`` days along axis 1, ignoring empty days."""
+    csum = np.cumsum(values, axis=1)
+    ccount = np.cumsum(counts, axis=1)
+    csum[:, width:] = csum[:, width:] - csum[:, :-width]
+    ccount[:, width:] = ccount[:, width:] - ccount[:, :-width]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(ccount > 0, csum / ccount, np.nan)
+
+
+def _round(arr):
+    return np.where(np.isnan(arr), None, np.round(arr, 2)).tolist()
+
+
+# MySQL TO_DAYS('1970-01-01'); lets the query return dates as plain integers
+_TO_DAYS_EPOCH = 719528
+
+
+def price_history(markets, day_numbers, min_prices, max_prices, modal_prices):
+    """Return per-market series plus rolling, spread and week-over-week stats.
+
+    All arguments are equal-length sequences as pulled from one query, with
+    dates given as MySQL ``TO_DAYS`` numbers. Several varieties of a market on
+    the same day are averaged together.
+    """
+    if not len(markets):
+        return {'start': None, 'end': None, 'markets': []}
+
+    dates = (np.asarray(day_numbers, dtype=np.int64) - _TO_DAYS_EPOCH).astype('datetime64[D]')
+    mins = np.asarray(min_prices, dtype=np.float64)
+    maxs = np.asarray(max_prices, dtype=np.float64)
+    modals = np.asarray(modal_prices, dtype=np.float64)
+    names, market_idx = np.unique(np.asarray(markets, dtype=str), return_inverse=True)
+
+    start = dates.min()
+    day_idx = (dates - start).astype(np.int64)
+    shape = (len(names), int(day_idx.max()) + 1)
+
+    counts = np.zeros(shape)
+    modal_sum = np.zeros(shape)
+    min_sum = np.zeros(shape)
+    max_sum = np.zeros(shape)
+    np.add.at(counts, (market_idx, day_idx), 1)
+    np.add.at(modal_sum, (market_idx, day_idx), modals)
+    np.add.at(min_sum, (market_idx, day_idx), mins)
+    np.add.at(max_sum, (market_idx, day_idx), maxs)
+
+    observed = counts > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        modal = np.where(observed, modal_sum / counts, np.nan)
+        low = np.where(observed, min_sum / counts, np.nan)
+        high = np.where(observed, max_sum / counts, np.nan)
+    # Rolling means weight each observed day once, not each variety row
+    day_count = observed.astype(np.float64)
+    day_modal = np.nan_to_num(modal)
+    avg_7 = _rolling_mean(day_modal, day_count, 7)
+    avg_30 = _rolling_mean(day_modal, day_count, 30)
+    spread = high - low
+
+    # Week-over-week: current 7-day mean against the 7-day mean a week earlier
+    wow = np.full(shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        wow[:, 7:] = (avg_7[:, 7:] - avg_7[:, :-7]) / avg_7[:, :-7] * 100.0
+
+    calendar = start + np.arange(shape[1])
+    result = []
+    for m, name in enumerate(names):
+        days = np.flatnonzero(observed[m])
+        last = days[-1]
+        result.append({
+            'market': str(name),
+            'latest': {
+                'date': str(calendar[last]),
+                'modal_price': round(float(modal[m, last]), 2),
+                'avg_7d': round(float(avg_7[m, last]), 2),
+                'avg_30d': round(float(avg_30[m, last]), 2),
+                'wow_change_pct': _round(wow[m, last:last + 1])[0],
+                'mean_spread': round(float(np.nanmean(spread[m])), 2),
+            },
+            'series': {
+                'date': [str(d) for d in calendar[days]],
+                'min_price': _round(low[m, days]),
+                'max_price': _round(high[m, days]),
+                'modal_price': _round(modal[m, days]),
+                'spread': _round(spread[m, days]),
+                'avg_7d': _round(avg_7[m, days]),
+                'avg_30d': _round(avg_30[m, days]),
+                'wow_change_pct': _round(wow[m, days]),
+            },
+        })
+    return {'start': str(calendar[0]), 'end': str(calendar[-1]), 'markets': result}
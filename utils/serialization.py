@@ -0,0 +1,181 @@
+"""JSON serialization and compression for API responses.
+
+``init_app`` installs the JSON provider named by ``JSON_SERIALIZER``, so
+``jsonify`` and ``json_response`` use it unchanged:
+
+* ``orjson``: serializes in C and encodes straight to UTF-8 bytes. Values
+  orjson does not handle natively (``Decimal`` from MySQL ``DECIMAL``
+  columns, dates, UUIDs, dataclasses) go through Flask's ``default``, so
+  the output matches the stdlib provider's (Decimal -> string, dates in
+  HTTP format).
+* ``stdlib``: Flask's ``DefaultJSONProvider``.
+* ``auto`` (default): orjson when installed, else stdlib.
+
+It also registers an ``after_request`` hook. The hook compresses JSON bodies
+of at least ``JSON_COMPRESS_MIN_BYTES`` with brotli (when the optional
+``brotli`` package is installed and the client accepts it) or gzip.
+Compressed responses keep a strong ETag per encoding (``encoded_etag``).
+Responses that already have a ``Content-Encoding``, such as the pre-built
+i18n bundles, and streamed responses are left alone. MessagePack bodies
+(``packb``, with the optional ``msgpack`` package) are compressed the same way.
+"""
+import datetime
+import decimal
+import gzip
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional fast path
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # optional; clients fall back to JSON
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+ETAG_SUFFIXES = {'gzip': 'gz', 'br': 'br'}
+COMPRESSIBLE = ('application/json', MSGPACK_MIMETYPE)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    ensure_ascii = False
+
+    def _options(self):
+        # Dates and dataclasses go through ``default`` to match the stdlib output
+        options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+                   | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps_bytes(self, obj):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options())
+        except TypeError:
+            # e.g. integers beyond 64 bits; json.dumps copes with those
+            return DefaultJSONProvider.dumps(self, obj, separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:  # indent, cls, ... are stdlib json options
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)  # indented for reading
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def _msgpack_default(obj):
+    # The same choices as the JSON providers, with ISO dates
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if hasattr(obj, 'tolist'):  # numpy arrays and scalars
+        return obj.tolist()
+    raise TypeError(f'Object of type {type(obj).__name__} is not MessagePack serializable')
+
+
+def packb(obj):
+    return msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+
+
+def unpackb(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+SERIALIZERS = {
+    'stdlib': DefaultJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def provider_class(name):
+    if name in (None, '', 'auto'):
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_SERIALIZER=orjson but orjson is not installed')
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(f'Unknown JSON_SERIALIZER {name!r}; expected one of {sorted(SERIALIZERS)} or auto')
+
+
+def choose_encoding(accept_encodings):
+    """The best encoding the client accepts: 'br', 'gzip' or None."""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(body, accept_encodings, gzip_level=6, brotli_quality=4):
+    """``(encoding, data)`` for the best encoding the client accepts, else ``(None, body)``."""
+    encoding = choose_encoding(accept_encodings)
+    if encoding == 'br':
+        return 'br', brotli.compress(body, quality=brotli_quality)
+    if encoding == 'gzip':
+        return 'gzip', gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    return None, body
+
+
+def encoded_etag(etag, encoding):
+    """Strong ETag of one encoding of a representation: each encoding is a
+    different byte sequence, so caches must not swap them on revalidation."""
+    return f'{etag}-{ETAG_SUFFIXES[encoding]}' if encoding else etag
+
+
+def init_app(app):
+    from flask import request
+
+    app.json = provider_class(app.config.get('JSON_SERIALIZER'))(app)
+    app.json.sort_keys = app.config.get('JSON_SORT_KEYS', False)
+
+    min_bytes = app.config.get('JSON_COMPRESS_MIN_BYTES', 1024)
+    gzip_level = app.config.get('JSON_GZIP_LEVEL', 6)
+    brotli_quality = app.config.get('JSON_BROTLI_QUALITY', 4)
+    if not min_bytes:
+        return
+
+    @app.after_request
+    def _compress(response):
+        if (response.mimetype not in COMPRESSIBLE or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        if len(body) < min_bytes:
+            return response
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # The route compared If-None-Match with the identity ETag; compare
+            # again with the one this encoding is sent under
+            response.set_etag(encoded_etag(etag, encoding))
+            if response.status_code == 200:
+                response.make_conditional(request)
+                if response.status_code == 304:
+                    return response
+        encoding, data = compress(body, request.accept_encodings, gzip_level, brotli_quality)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        return response
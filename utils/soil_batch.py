@@ -0,0 +1,231 @@
+"""Vectorized soil rule evaluation for lab-sized batches.
+
+Samples are parsed into one float column per field (NaN when missing). Each
+field's compiled interval table (``utils.soil_rules``) is applied to the whole
+column with one ``searchsorted``. The segment indices are packed into one
+integer per sample, so every distinct combination of advice is built once and
+shared, rather than built per sample.
+"""
+import csv
+import io
+
+import numpy as np
+
+from utils.soil_rules import FIELDS
+
+REQUIRED = FIELDS[:4]
+
+# Header spellings used by lab exports and the single-sample API
+FIELD_ALIASES = {
+    'sample_id': ('sample_id', 'sample', 'id', 'sample_no', 'farmer_id'),
+    'ph': ('ph', 'ph_level', 'p_h'),
+    'nitrogen': ('nitrogen', 'n', 'nitrogen_level', 'available_n'),
+    'phosphorus': ('phosphorus', 'p', 'phosphorus_level', 'available_p'),
+    'potassium': ('potassium', 'k', 'potassium_level', 'available_k'),
+    'organic_matter': ('organic_matter', 'om', 'organic_matter_pct'),
+    'moisture_content': ('moisture_content', 'moisture', 'moisture_pct'),
+}
+_ALIAS_LOOKUP = {alias: field for field, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+# Physically possible values that also fit the soil_tests DECIMAL columns
+# (ph DECIMAL(4,2), N/P/K DECIMAL(5,2), percentages 0-100)
+LIMITS = {
+    'ph': (0.0, 14.0),
+    'nitrogen': (0.0, 999.99),
+    'phosphorus': (0.0, 999.99),
+    'potassium': (0.0, 999.99),
+    'organic_matter': (0.0, 100.0),
+    'moisture_content': (0.0, 100.0),
+}
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _canonical(record):
+    out = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        field = _ALIAS_LOOKUP.get(key.strip().lower().replace(' ', '_'))
+        if field:
+            out[field] = value
+    return out
+
+
+def read_csv(stream):
+    """Yield records from a binary CSV stream without reading it all first."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    yield from csv.DictReader(text)
+
+
+def parse_sample(record):
+    """``{field: float or None}`` for one sample, as the single-sample API
+    takes it; raises ValueError naming the fields that are not numbers or are
+    outside ``LIMITS``."""
+    values, not_numbers = {}, []
+    for field in LIMITS:
+        value = record.get(field)
+        if value is None or value == '':
+            values[field] = None
+            continue
+        try:
+            values[field] = float(value)
+        except (TypeError, ValueError):
+            not_numbers.append(field)
+    if not_numbers:
+        raise ValueError(f"Not a number: {', '.join(not_numbers)}")
+    bad = out_of_range(values)
+    if bad:
+        raise ValueError(f'Out of range: {describe_limits(bad)}')
+    return values
+
+
+def to_columns(records, max_samples):
+    """``(sample_ids, {field: float64 array}, errors)`` from an iterable of dicts.
+
+    ``errors[i]`` is the :func:`parse_sample` message for a rejected sample
+    (whose values are all NaN), else None.
+    """
+    ids, errors = [], []
+    cols = {field: [] for field in FIELDS}
+    for i, record in enumerate(records):
+        if i >= max_samples:
+            raise BatchError(f'Batch is limited to {max_samples} samples')
+        if not isinstance(record, dict):
+            raise BatchError(f'Sample {i} is not an object')
+        record = _canonical(record)
+        ids.append(record.get('sample_id', i))
+        try:
+            values = parse_sample(record)
+            errors.append(None)
+        except ValueError as e:
+            values = {}
+            errors.append(str(e))
+        for field in FIELDS:
+            value = values.get(field)
+            cols[field].append(np.nan if value is None else value)
+    return ids, {field: np.asarray(values, dtype=np.float64) for field, values in cols.items()}, errors
+
+
+def out_of_range(values):
+    """Fields of one sample (``{field: float or None}``) outside ``LIMITS``."""
+    return [field for field, value in values.items()
+            if value is not None and not LIMITS[field][0] <= value <= LIMITS[field][1]]
+
+
+def describe_limits(fields):
+    return ', '.join(f'{field} ({LIMITS[field][0]:g}-{LIMITS[field][1]:g})' for field in fields)
+
+
+def validity(columns, errors=None):
+    """``(valid, missing, outside)``: the usable samples, plus per-field masks of
+    required values that are missing and of values outside ``LIMITS``. Samples
+    with an entry in ``errors`` (from :func:`to_columns`) are never valid."""
+    missing = {field: ~np.isfinite(columns[field]) for field in REQUIRED}
+    outside = {}
+    with np.errstate(invalid='ignore'):
+        for field, (low, high) in LIMITS.items():
+            outside[field] = (columns[field] < low) | (columns[field] > high)
+    valid = ~np.logical_or.reduce(list(missing.values()) + list(outside.values()))
+    if errors is not None:
+        valid &= np.array([error is None for error in errors], dtype=bool)
+    return valid, missing, outside
+
+
+def problem(missing, outside, i):
+    """Why sample ``i`` is invalid, for its result entry."""
+    parts = []
+    absent = [field for field in REQUIRED if missing[field][i]]
+    if absent:
+        parts.append(f"Missing: {', '.join(absent)}")
+    bad = [field for field in FIELDS if outside[field][i] and field not in absent]
+    if bad:
+        parts.append(f'Out of range: {describe_limits(bad)}')
+    return '; '.join(parts)
+
+
+def evaluate(columns, ruleset, crop=None, state=None, valid=None):
+    """Return ``(valid, inverse, combos)`` for a batch.
+
+    Sample ``i`` gets the advice keys ``combos[inverse[i]]``; invalid samples
+    (a required value missing, or any value out of range) get none.
+    """
+    if valid is None:
+        valid = validity(columns)[0]
+    n = len(valid)
+
+    codes = np.zeros(n, dtype=np.int64)
+    radix = 1
+    parts = []
+    for field in FIELDS:
+        table = ruleset.table_for(field, crop, state)
+        if table is None:
+            continue
+        size = len(table.segments) + 1  # last slot: value missing
+        idx = table.segment_indices(columns[field])
+        idx[~valid] = size - 1
+        codes += idx * radix
+        parts.append((table, radix, size))
+        radix *= size
+
+    unique, inverse = np.unique(codes, return_inverse=True)
+    combos = []
+    for code in unique.tolist():
+        keys = []
+        for table, base, size in parts:
+            seg = code // base % size
+            if seg < len(table.segments):
+                keys.extend(table.segments[seg])
+        combos.append(tuple(keys))
+    return valid, inverse.reshape(-1), combos
+
+
+def _describe(values):
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return {'count': 0}
+    return {
+        'count': int(len(values)),
+        'mean': round(float(values.mean()), 3),
+        'min': round(float(values.min()), 3),
+        'median': round(float(np.median(values)), 3),
+        'max': round(float(values.max()), 3),
+    }
+
+
+def summarize(columns, valid, inverse, combos, texts):
+    """Batch totals, per-field statistics and how many samples got each advice."""
+    total = len(valid)
+    n_valid = int(valid.sum())
+    per_combo = np.bincount(inverse[valid], minlength=len(combos)).tolist()
+    advice = {}
+    for keys, count in zip(combos, per_combo):
+        for key in keys:
+            advice[key] = advice.get(key, 0) + count
+    return {
+        'samples': total,
+        'valid': n_valid,
+        'invalid': total - n_valid,
+        'fields': {field: _describe(columns[field][valid]) for field in FIELDS},
+        'advice': [
+            {'key': key, 'text': texts[key], 'samples': count,
+             'share': round(count / n_valid, 4) if n_valid else 0.0}
+            for key, count in advice.items()
+        ],
+    }
+
+
+def rows_for_storage(user_id, columns, valid, inverse, stored_text):
+    """``soil_tests`` rows (write-behind column order) for the valid samples.
+
+    ``stored_text[j]`` is the recommendations column for combination ``j``.
+    """
+    idx = np.flatnonzero(valid)
+    data = np.stack([columns[field][idx] for field in FIELDS], axis=1).round(2)
+    rows = []
+    for combo, values in zip(inverse[idx].tolist(), data.tolist()):
+        values = [None if v != v else v for v in values]  # NaN -> NULL
+        rows.append((user_id, *values, stored_text[combo]))
+    return rows
@@ -0,0 +1,169 @@
+"""Versioned soil recommendation rules, compiled into interval tables.
+
+``rules/soil_rules.json`` lists threshold rules per field, optionally scoped
+to a crop and/or state. At load time the rules for each (crop, state, field)
+are turned into a sorted list of breakpoints, with the advice keys that apply
+between each pair of them. A lookup is then a dict hit plus one ``bisect``,
+O(log n), instead of a scan over every rule. The same breakpoints feed
+``numpy.searchsorted`` for batches.
+
+The file is re-checked every few seconds and recompiled when it changes. A
+file that fails validation is logged and ignored, and the previous table stays
+in service.
+"""
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+FIELDS = ('ph', 'nitrogen', 'phosphorus', 'potassium', 'organic_matter', 'moisture_content')
+ANY = '*'
+
+
+def _bounds(rule):
+    """The rule's range as half-open ``[low, high)``."""
+    low, high = -math.inf, math.inf
+    if 'gte' in rule:
+        low = float(rule['gte'])
+    if 'gt' in rule:
+        low = math.nextafter(float(rule['gt']), math.inf)
+    if 'lt' in rule:
+        high = float(rule['lt'])
+    if 'lte' in rule:
+        high = math.nextafter(float(rule['lte']), math.inf)
+    if not low < high:
+        raise ValueError(f"rule {rule.get('id')}: empty range")
+    return low, high
+
+
+class IntervalTable:
+    """Breakpoints for one field and the advice keys for each segment."""
+
+    def __init__(self, rules):
+        bounds = [_bounds(rule) for rule in rules]
+        self.edges = sorted({b for pair in bounds for b in pair if math.isfinite(b)})
+        points = [-math.inf] + self.edges + [math.inf]
+        self.segments = []
+        for lo, hi in zip(points, points[1:]):
+            self.segments.append(tuple(
+                rule['advice'] for rule, (low, high) in zip(rules, bounds) if low <= lo and hi <= high
+            ))
+        self.edges_array = np.asarray(self.edges, dtype=np.float64)
+
+    def lookup(self, value):
+        return self.segments[bisect.bisect_right(self.edges, value)]
+
+    def segment_indices(self, values):
+        """Vectorized ``lookup``: segment index per value, ``len(segments)`` for NaN."""
+        idx = np.searchsorted(self.edges_array, values, side='right')
+        idx[~np.isfinite(values)] = len(self.segments)
+        return idx
+
+
+class RuleSet:
+    def __init__(self, doc):
+        self.version = str(doc.get('version', 'unversioned'))
+        grouped = {}
+        for rule in doc['rules']:
+            if rule.get('field') not in FIELDS:
+                raise ValueError(f"rule {rule.get('id')}: unknown field {rule.get('field')!r}")
+            if not rule.get('advice'):
+                raise ValueError(f"rule {rule.get('id')}: missing advice key")
+            scope = (str(rule.get('crop', ANY)).lower(), str(rule.get('state', ANY)).upper())
+            grouped.setdefault(scope, {}).setdefault(rule['field'], []).append(rule)
+        self.tables = {
+            scope: {field: IntervalTable(rules) for field, rules in fields.items()}
+            for scope, fields in grouped.items()
+        }
+        self.advice_keys = sorted({rule['advice'] for rule in doc['rules']})
+        self.rules = doc['rules']
+
+    def table_for(self, field, crop=None, state=None):
+        """Most specific table defining ``field``: crop+state, crop, state, default."""
+        crop = (crop or ANY).lower()
+        state = (state or ANY).upper()
+        for scope in ((crop, state), (crop, ANY), (ANY, state), (ANY, ANY)):
+            table = self.tables.get(scope, {}).get(field)
+            if table is not None:
+                return table
+        return None
+
+    def evaluate(self, values, crop=None, state=None):
+        """Advice keys for one sample; missing values are skipped."""
+        keys = []
+        for field in FIELDS:
+            value = values.get(field)
+            if value is None or value != value:
+                continue
+            table = self.table_for(field, crop, state)
+            if table is not None:
+                keys.extend(table.lookup(value))
+        return keys
+
+
+class SoilRules:
+    """Holds the compiled rule set and recompiles it when the file changes."""
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._ruleset = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as fh:
+                ruleset = RuleSet(json.load(fh))
+        except (OSError, ValueError, KeyError, TypeError):
+            self.reload_errors += 1
+            if self._ruleset is None:
+                raise
+            log.exception('Invalid soil rules in %s; keeping version %s', self.path,
+                          self._ruleset.version)
+        else:
+            if self._ruleset is not None:
+                log.info('Soil rules reloaded: %s -> %s', self._ruleset.version, ruleset.version)
+            self._ruleset = ruleset
+            self.reloads += 1
+        self._mtime = mtime
+
+    def current(self):
+        now = time.monotonic()
+        if self._ruleset is None or now - self._checked >= self.check_interval:
+            with self._lock:
+                if self._ruleset is None or now - self._checked >= self.check_interval:
+                    self._checked = now
+                    self._load()
+        return self._ruleset
+
+
+_rules = None
+_rules_lock = threading.Lock()
+
+
+def default_rules_path(root):
+    return os.path.join(root, 'rules', 'soil_rules.json')
+
+
+def get_soil_rules(cfg, root):
+    global _rules
+    if _rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = SoilRules(cfg.get('SOIL_RULES_FILE') or default_rules_path(root),
+                                   check_interval=cfg.get('SOIL_RULES_RELOAD_INTERVAL', 5))
+    return _rules
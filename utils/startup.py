@@ -0,0 +1,55 @@
+"""Cold-start timing: where import and initialization time goes.
+
+Phases are recorded with ``startup.phase(name)`` while the app is built, and
+lazily created components record their first-use cost the same way, so the
+report covers everything a cold instance pays before it is warm.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - began) * 1000
+            with self._lock:
+                self.phases.append((name, round(ms, 2)))
+
+    def report(self, budget_ms=None):
+        with self._lock:
+            phases = list(self.phases)
+        total = round(sum(ms for _, ms in phases), 2)
+        out = {
+            'total_ms': total,
+            'since_first_import_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'phases': [{'name': name, 'ms': ms} for name, ms in phases],
+        }
+        if budget_ms:
+            out['budget_ms'] = budget_ms
+            out['over_budget'] = total > budget_ms
+        return out
+
+    def log_report(self, budget_ms=None):
+        report = self.report(budget_ms)
+        slowest = sorted(report['phases'], key=lambda p: -p['ms'])[:5]
+        log.info('Startup took %.1f ms; slowest: %s', report['total_ms'],
+                 ', '.join(f"{p['name']}={p['ms']}ms" for p in slowest))
+        if report.get('over_budget'):
+            log.warning('Startup exceeded budget of %s ms', budget_ms)
+        return report
+
+
+startup = StartupTimer()
@@ -0,0 +1,166 @@
+"""Content-addressed storage for uploaded images.
+
+Files are hashed while they are written, so the body is never held in memory,
+raw or multipart, and land at ``<root>/<aa>/<bb>/<sha256><ext>``. Identical photos resolve to the
+same path and are stored once.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the image formats phones and browsers actually send
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'RIFF', '.webp'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+
+
+class UploadError(Exception):
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def sniff_extension(head):
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            if ext == '.webp' and head[8:12] != b'WEBP':
+                continue
+            return ext
+    return None
+
+
+def shard_path(digest, ext):
+    return os.path.join(digest[:2], digest[2:4], digest + ext)
+
+
+def store_stream(stream, root, max_bytes):
+    """Hash and spool ``stream`` into ``root``; return the stored file's info.
+
+    Raises UploadError (413) as soon as more than ``max_bytes`` arrive and
+    (415) when the leading bytes are not a known image format.
+    """
+    return store_chunks(iter(lambda: stream.read(CHUNK_SIZE), b''), root, max_bytes)
+
+
+def multipart_chunks(stream, boundary, field):
+    """Yield the bytes of file part ``field`` of a multipart body as they arrive.
+
+    Unlike ``request.files``, nothing is buffered or spooled first; other
+    parts are skipped, and reading stops once the part has ended.
+    """
+    # Non-file fields are small; anything bigger is not a form we sent
+    decoder = MultipartDecoder(boundary.encode('latin-1'), 64 * 1024)
+    in_part = False
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    in_part = event.name == field
+                elif isinstance(event, Data) and in_part:
+                    if event.data:
+                        yield event.data
+                    if not event.more_data:
+                        return
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    except (ValueError, RequestEntityTooLarge):  # truncated body, bad headers, huge plain field
+        raise UploadError('Malformed multipart body')
+    raise UploadError('No image provided')
+
+
+def store_chunks(chunks, root, max_bytes):
+    """Like :func:`store_stream`, for an iterable of byte chunks."""
+    tmp_dir = os.path.join(root, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    head = b''
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError(f'Image exceeds {max_bytes // 1024} KB limit', 413)
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                hasher.update(chunk)
+                out.write(chunk)
+
+        if size == 0:
+            raise UploadError('No image provided')
+        ext = sniff_extension(head)
+        if ext is None:
+            raise UploadError('Unsupported image type', 415)
+
+        digest = hasher.hexdigest()
+        rel_path = shard_path(digest, ext)
+        final_path = os.path.join(root, rel_path)
+        duplicate = os.path.exists(final_path)
+        if duplicate:
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {
+        'sha256': digest,
+        'path': rel_path,
+        'size': size,
+        'duplicate': duplicate,
+    }
+
+
+def store_bytes(data, root, max_bytes):
+    return store_stream(io.BytesIO(data), root, max_bytes)
+
+
+def normalized_copy(root, rel_path, max_side=512):
+    """Write (once) a downscaled RGB JPEG next to the original for inference.
+
+    Returns the relative path of the copy, or None when Pillow is missing or
+    the image cannot be decoded.
+    """
+    if Image is None:
+        return None
+    base, _ = os.path.splitext(rel_path)
+    norm_rel = f'{base}_{max_side}.jpg'
+    norm_path = os.path.join(root, norm_rel)
+    if os.path.exists(norm_path):
+        return norm_rel
+    try:
+        with Image.open(os.path.join(root, rel_path)) as img:
+            # draft() lets the JPEG decoder skip detail we are about to discard
+            img.draft('RGB', (max_side, max_side))
+            img = img.convert('RGB')
+            img.thumbnail((max_side, max_side))
+            tmp_path = norm_path + '.tmp'
+            img.save(tmp_path, 'JPEG', quality=90)
+            os.replace(tmp_path, norm_path)
+    except Exception:
+        return None
+    return norm_rel
@@ -0,0 +1,149 @@
+"""Delta sync for offline-first clients.
+
+The client keeps one opaque cursor per resource and sends them all in one
+request. The reply holds only what changed since those cursors, plus the
+cursors to send next time:
+
+* ``prices`` - per ``STATE:crop`` subscription, the ``market_prices`` rows
+  whose ``last_updated`` is past the cursor. They are read by a keyset range
+  scan on the ``(state, crop_name, last_updated)`` changelog index. Rows are
+  sent column-wise (``columns`` + ``rows``) and at most SYNC_MAX_ROWS per
+  subscription; ``more`` says to sync again. ``last_updated`` is set when an
+  ingest batch's upsert runs, but the row only becomes visible when the batch
+  commits. Every ingest run is recorded in ``ingest_runs`` before it writes,
+  so only rows stamped before the oldest unfinished run started (or before
+  now, with none) are sent (``price_watermark``); a cursor can never move past
+  a row that is still to appear. Ingest never deletes, so there are no
+  tombstones.
+* ``forecast`` - the forecast for the client's weather tile, unless the tile
+  and the forecast content (and so its hash) are unchanged.
+* ``i18n`` - the per-page bundles whose hash differs from the client's copy.
+"""
+import base64
+import datetime
+import hashlib
+import json
+
+from utils.db import db_cursor
+
+PRICE_COLUMNS = ('market', 'variety', 'arrival_date', 'min_price', 'max_price', 'modal_price')
+
+
+class InvalidSync(ValueError):
+    """A malformed sync request or cursor."""
+
+
+def encode_cursor(value):
+    raw = json.dumps(value, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError) as e:
+        raise InvalidSync(f'Invalid cursor: {token!r}') from e
+
+
+# --------- Prices ---------
+def price_watermark(cursor, stale_minutes=60):
+    """Rows stamped before this are committed or never will be.
+
+    Ingest stamps its run's ``started_at`` (committed) before writing any row,
+    and rows are stamped by the same database clock, so no clock margin is
+    needed. A run whose heartbeat is ``stale_minutes`` old is a crashed
+    process: its open transaction went with its connection.
+    """
+    cursor.execute(
+        'SELECT COALESCE(MIN(started_at), NOW()) FROM ingest_runs WHERE finished_at IS NULL '
+        'AND heartbeat_at > NOW() - INTERVAL %s MINUTE', (stale_minutes,))
+    return cursor.fetchone()[0]
+
+
+def _price_after(token):
+    if not token:
+        return None
+    try:
+        at, row_id = decode_cursor(token)
+        return datetime.datetime.fromisoformat(at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidSync(f'Invalid prices cursor: {token!r}') from e
+
+
+def _price_changes(cursor, state, crop, after, max_rows, watermark):
+    where, params = '', ()
+    if after is not None:
+        where = ' AND (last_updated > %s OR (last_updated = %s AND id > %s))'
+        params = (after[0], after[0], after[1])
+    cursor.execute(
+        f"SELECT id, last_updated, {', '.join(PRICE_COLUMNS)} FROM market_prices "
+        f'WHERE state = %s AND crop_name = %s{where} '
+        'AND last_updated < %s ORDER BY last_updated, id LIMIT %s',
+        (state, crop) + params + (watermark, max_rows + 1))
+    return cursor.fetchall()
+
+
+def sync_prices(subscriptions, max_rows=5000, stale_minutes=60):
+    """``{'TN:rice': cursor or None}`` -> ``{'TN:rice': {columns, rows, cursor, more}}``."""
+    out = {}
+    with db_cursor() as cursor:
+        # One watermark for every subscription, read before any of them
+        watermark = price_watermark(cursor, stale_minutes)
+        for name, token in subscriptions.items():
+            state, sep, crop = name.partition(':')
+            if not (sep and state and crop):
+                raise InvalidSync(f'Price subscriptions look like STATE:crop, not {name!r}')
+            after = _price_after(token)
+            found = _price_changes(cursor, state, crop, after, max_rows, watermark)
+            more = len(found) > max_rows
+            found = found[:max_rows]
+            if found:
+                row_id, at = found[-1][0], found[-1][1]
+                token = encode_cursor([at.isoformat(sep=' '), row_id])
+            out[name] = {
+                'columns': PRICE_COLUMNS,
+                'rows': [[_plain(v) for v in row[2:]] for row in found],
+                'cursor': token,
+                'more': more,
+            }
+    return out
+
+
+def _plain(value):
+    # Dates as ISO strings so JSON and MessagePack replies read the same
+    return value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+
+
+# --------- Forecast ---------
+def forecast_version(tile, forecast):
+    body = json.dumps(forecast, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    return encode_cursor([list(tile), hashlib.sha1(body).hexdigest()[:16]])
+
+
+def sync_forecast(service, lat, lon, token=None):
+    forecast, fetched_at, tile = service.get('forecast', lat, lon)
+    version = forecast_version(tile, forecast)
+    if version == token:
+        return {'cursor': version, 'changed': False}
+    return {
+        'cursor': version,
+        'changed': True,
+        'tile': list(tile),
+        'generated_at': datetime.datetime.fromtimestamp(fetched_at, datetime.timezone.utc).isoformat(),
+        'forecast': forecast,
+    }
+
+
+# --------- Translations ---------
+def sync_i18n(catalogues, bundles, lang, pages):
+    """Changed bundles among ``pages`` (``{page: etag or None}``); pages that no
+    longer exist are listed under ``removed``."""
+    lang = catalogues.resolve(lang)
+    changed, removed = {}, []
+    for page, etag in pages.items():
+        bundle = bundles.get(lang, page)
+        if bundle is None:
+            removed.append(page)
+        elif bundle.etag != etag:
+            changed[page] = {'etag': bundle.etag, 'data': bundle.data}
+    return {'lang': lang, 'pages': changed, 'removed': removed}
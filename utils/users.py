@@ -0,0 +1,161 @@
+"""User record lookups with a shared read cache.
+
+MySQL (the API blueprints) and Supabase (the form pages in app.py) expose the
+same ``by_id``/``by_email``/``update`` interface, and ``CachedUserStore`` puts
+a TTL cache keyed by id and by email in front of either one. Unknown emails
+are cached briefly as well so repeated bad logins do not reach the backend.
+
+Each worker keeps its own copy for up to USER_CACHE_LOCAL_TTL seconds. Writes
+through the store, and registrations, bump per-key stamp files, so the other
+workers on the host drop their copy on the next lookup (see ``KeyStamps``).
+Password hashes stay out of the shared backend: logins read them through
+``get_credentials``, from a cache that lives in the worker only.
+"""
+import os
+import threading
+
+from flask import current_app
+
+from utils.cache import KeyStamps, TTLCache, make_cache
+from utils.db import db_cursor
+
+# Cached in place of a record for lookups that found nothing
+_MISSING = False
+
+# Only kept in the worker's own credentials cache
+SECRET_FIELDS = ('password', 'password_hash')
+
+_UPDATABLE = ('name', 'mobile', 'preferred_language', 'password', 'password_hash',
+              'latitude', 'longitude', 'tile_row', 'tile_col')
+
+
+class MySQLUserStore:
+    columns = 'id, name, email, mobile, password, preferred_language, latitude, longitude'
+
+    def by_id(self, user_id):
+        with db_cursor(dictionary=True) as cursor:
+            cursor.execute(f'SELECT {self.columns} FROM users WHERE id = %s', (user_id,))
+            return cursor.fetchone()
+
+    def by_email(self, email):
+        with db_cursor(dictionary=True) as cursor:
+            cursor.execute(f'SELECT {self.columns} FROM users WHERE email = %s', (email,))
+            return cursor.fetchone()
+
+    def update(self, user_id, fields):
+        assignments = ', '.join(f'{name} = %s' for name in fields)
+        with db_cursor(commit=True) as cursor:
+            cursor.execute(f'UPDATE users SET {assignments} WHERE id = %s',
+                           (*fields.values(), user_id))
+
+
+class SupabaseUserStore:
+    def __init__(self, client):
+        self.client = client
+
+    def _first(self, column, value):
+        resp = self.client.table('users').select('*').eq(column, value).limit(1).execute()
+        if resp and resp.data:
+            return resp.data[0]
+        return None
+
+    def by_id(self, user_id):
+        return self._first('id', user_id)
+
+    def by_email(self, email):
+        return self._first('email', email)
+
+    def update(self, user_id, fields):
+        self.client.table('users').update(fields).eq('id', user_id).execute()
+
+
+class CachedUserStore:
+    def __init__(self, store, cache, credentials=None, negative_ttl=60):
+        self.store = store
+        self.cache = cache
+        self.credentials = credentials
+        self.negative_ttl = negative_ttl
+
+    def _remember(self, user, *keys):
+        """Cache ``user`` without its secrets (or a miss under ``keys``) and
+        return the cached copy."""
+        if not user:
+            for key in keys:
+                self.cache.set(key, _MISSING, ttl=self.negative_ttl)
+            return None
+        user = {k: v for k, v in user.items() if k not in SECRET_FIELDS}
+        if user.get('id') is not None:
+            self.cache.set(('id', user['id']), user)
+        if user.get('email'):
+            self.cache.set(('email', user['email']), user)
+        return user
+
+    def get_by_id(self, user_id):
+        user = self.cache.get(('id', user_id))
+        if user is None:
+            return self._remember(self.store.by_id(user_id), ('id', user_id))
+        return user or None
+
+    def get_by_email(self, email):
+        user = self.cache.get(('email', email))
+        if user is None:
+            return self._remember(self.store.by_email(email), ('email', email))
+        return user or None
+
+    def get_credentials(self, email):
+        """Full row, password hash included, for checking a login."""
+        key = ('email', email)
+        user = self.credentials.get(key) if self.credentials is not None else None
+        if user is None:
+            user = self.store.by_email(email)
+            self._remember(user, key)
+            if self.credentials is not None:
+                self.credentials.set(key, user or _MISSING, ttl=None if user else self.negative_ttl)
+        return user or None
+
+    def update(self, user_id, fields):
+        """Write allowed ``fields`` through to the backend and drop stale copies."""
+        fields = {k: v for k, v in fields.items() if k in _UPDATABLE}
+        if not fields:
+            return
+        old = self.get_by_id(user_id)
+        self.store.update(user_id, fields)
+        self.invalidate(user_id=user_id, email=old['email'] if old else None)
+
+    def invalidate(self, user_id=None, email=None):
+        if user_id is not None:
+            self.cache.invalidate(('id', user_id))
+        if email is not None:
+            self.cache.invalidate(('email', email))
+            if self.credentials is not None:
+                self.credentials.invalidate(('email', email))
+
+
+def cached_store(store, name, cfg):
+    """Wrap ``store`` in the user caches described in the module docstring."""
+    stamp_dir = os.path.join(cfg.get('CACHE_STAMP_DIR') or os.path.join(current_app.root_path, 'cache'),
+                             name)
+    local_ttl = cfg.get('USER_CACHE_LOCAL_TTL', 60)
+    return CachedUserStore(
+        store,
+        make_cache(name, cfg, 'USER_CACHE_SIZE', 'USER_CACHE_TTL', maxsize=10000, ttl=300,
+                   local_ttl_key='USER_CACHE_LOCAL_TTL', local_ttl=60, key_stamp_dir=stamp_dir),
+        # Never given a backend, so hashes stay in this process
+        TTLCache(f'{name}_credentials', maxsize=cfg.get('USER_CACHE_SIZE', 10000),
+                 ttl=local_ttl, local_ttl=local_ttl, key_stamps=KeyStamps(stamp_dir)),
+        negative_ttl=cfg.get('USER_NEGATIVE_TTL', 60),
+    )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_user_store(cfg):
+    """Cached MySQL user store used by the API blueprints."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = cached_store(MySQLUserStore(), 'users', cfg)
+    return _store
@@ -0,0 +1,237 @@
+"""Weather provider client with per-tile caching.
+
+Farms are snapped to a coarse grid (``WEATHER_TILE_DEG``, 0.1 degrees by
+default, roughly 11 km) so neighbouring users share one upstream call. Fresh
+entries are served directly; stale ones are served at once while a background
+refresh runs; and concurrent misses on one tile wait on a single fetch.
+"""
+import datetime
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.cache import make_cache
+
+CONDITIONS = ['Sunny', 'Partly Cloudy', 'Cloudy', 'Rainy', 'Thunderstorms']
+
+
+def tile_for(lat, lon, deg=0.1):
+    """Grid cell ``(row, col)`` containing the point."""
+    return (int(round(lat / deg)), int(round(lon / deg)))
+
+
+def tile_center(tile, deg=0.1):
+    return (round(tile[0] * deg, 4), round(tile[1] * deg, 4))
+
+
+class StubProvider:
+    """Offline provider: stable pseudo-weather derived from the tile and hour."""
+
+    name = 'stub'
+
+    def _seed(self, lat, lon, salt):
+        digest = hashlib.sha256(f'{lat:.2f},{lon:.2f},{salt}'.encode()).digest()
+        return int.from_bytes(digest[:4], 'big')
+
+    def current(self, lat, lon):
+        seed = self._seed(lat, lon, datetime.datetime.utcnow().strftime('%Y%m%d%H'))
+        return {
+            'temperature': 24 + seed % 12,
+            'humidity': 50 + (seed >> 4) % 40,
+            'wind_speed': 3 + (seed >> 8) % 20,
+            'precipitation': round(((seed >> 12) % 30) / 2, 1),
+            'conditions': CONDITIONS[(seed >> 16) % len(CONDITIONS)],
+        }
+
+    def forecast(self, lat, lon, days=5):
+        base = datetime.date.today()
+        out = []
+        for i in range(days):
+            day = base + datetime.timedelta(days=i)
+            seed = self._seed(lat, lon, day.isoformat())
+            out.append({
+                'date': day.isoformat(),
+                'temperature': 25 + seed % 14,
+                'humidity': 55 + (seed >> 4) % 40,
+                'wind_speed': 4 + (seed >> 8) % 40,
+                'precipitation': round(((seed >> 12) % 140) / 2, 1),
+                'conditions': CONDITIONS[(seed >> 16) % len(CONDITIONS)],
+            })
+        return out
+
+
+def _conditions(code):
+    # WMO weather interpretation codes used by Open-Meteo
+    if code is None:
+        return 'Unknown'
+    if code == 0:
+        return 'Sunny'
+    if code in (1, 2):
+        return 'Partly Cloudy'
+    if code in (3, 45, 48):
+        return 'Cloudy'
+    if code >= 95:
+        return 'Thunderstorms'
+    return 'Rainy'
+
+
+class OpenMeteoProvider:
+    """Open-Meteo over one pooled keep-alive HTTP session."""
+
+    name = 'open-meteo'
+    url = 'https://api.open-meteo.com/v1/forecast'
+
+    def __init__(self, timeout=5, pool_size=8):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=1)
+        self.session.mount('https://', adapter)
+
+    def _get(self, params):
+        resp = self.session.get(self.url, params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def current(self, lat, lon):
+        data = self._get({
+            'latitude': lat, 'longitude': lon,
+            'current': 'temperature_2m,relative_humidity_2m,wind_speed_10m,precipitation,weather_code',
+        })['current']
+        return {
+            'temperature': data.get('temperature_2m'),
+            'humidity': data.get('relative_humidity_2m'),
+            'wind_speed': data.get('wind_speed_10m'),
+            'precipitation': data.get('precipitation'),
+            'conditions': _conditions(data.get('weather_code')),
+        }
+
+    def forecast(self, lat, lon, days=5):
+        daily = self._get({
+            'latitude': lat, 'longitude': lon, 'forecast_days': days, 'timezone': 'auto',
+            'daily': 'temperature_2m_max,relative_humidity_2m_mean,wind_speed_10m_max,'
+                     'precipitation_sum,weather_code',
+        })['daily']
+        return [
+            {
+                'date': daily['time'][i],
+                'temperature': daily['temperature_2m_max'][i],
+                'humidity': daily['relative_humidity_2m_mean'][i],
+                'wind_speed': daily['wind_speed_10m_max'][i],
+                'precipitation': daily['precipitation_sum'][i],
+                'conditions': _conditions(daily['weather_code'][i]),
+            }
+            for i in range(len(daily['time']))
+        ]
+
+
+PROVIDERS = {'stub': StubProvider, 'open-meteo': OpenMeteoProvider}
+
+
+class WeatherService:
+    def __init__(self, provider, cache, tile_deg=0.1, fresh_ttl=None):
+        self.provider = provider
+        self.cache = cache
+        self.tile_deg = tile_deg
+        # Seconds an entry counts as fresh, per kind; the cache TTL is the stale limit
+        self.fresh_ttl = fresh_ttl or {'current': 600, 'forecast': 3600}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix='weather-refresh')
+        self._upstream_times = deque(maxlen=10000)
+        self.counters = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0,
+                         'upstream_calls': 0, 'upstream_errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, kind, lat, lon):
+        """Return ``(data, fetched_at, tile)`` for ``kind`` 'current' or 'forecast'."""
+        tile = tile_for(lat, lon, self.tile_deg)
+        key = (kind, tile)
+        entry = self.cache.get_entry(key)
+        if entry is not None:
+            data, fetched_at = entry
+            if time.time() - fetched_at <= self.fresh_ttl[kind]:
+                self._count('fresh_hits')
+            else:
+                self._count('stale_hits')
+                self._fetch(key, background=True)
+            return data, fetched_at, tile
+
+        self._count('misses')
+        data = self._fetch(key).result()
+        return data, time.time(), tile
+
+    def _fetch(self, key, background=False):
+        """Start (or join) the single upstream fetch for ``key``."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                if not background:
+                    self.counters['coalesced'] += 1
+                return future
+            future = Future()
+            self._inflight[key] = future
+
+        if background:
+            self._refresher.submit(self._load, key, future)
+        else:
+            self._load(key, future)
+        return future
+
+    def _load(self, key, future):
+        kind, tile = key
+        lat, lon = tile_center(tile, self.tile_deg)
+        try:
+            with self._lock:
+                self.counters['upstream_calls'] += 1
+                self._upstream_times.append(time.time())
+            data = getattr(self.provider, kind)(lat, lon)
+            self.cache.set(key, data)
+            future.set_result(data)
+        except Exception as e:
+            self._count('upstream_errors')
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            out = dict(self.counters)
+            recent = sum(1 for t in self._upstream_times if now - t <= 60)
+        served = out['fresh_hits'] + out['stale_hits'] + out['misses']
+        out['provider'] = self.provider.name
+        out['upstream_calls_per_min'] = recent
+        out['hit_ratio'] = round((out['fresh_hits'] + out['stale_hits']) / served, 4) if served else 0.0
+        return out
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_weather_service(cfg):
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                name = cfg.get('WEATHER_PROVIDER', 'stub')
+                provider = PROVIDERS[name]() if name == 'stub' else PROVIDERS[name](
+                    timeout=cfg.get('WEATHER_HTTP_TIMEOUT', 5))
+                _service = WeatherService(
+                    provider,
+                    make_cache('weather', cfg, 'WEATHER_CACHE_SIZE', 'WEATHER_STALE_TTL',
+                               maxsize=20000, ttl=6 * 3600),
+                    tile_deg=cfg.get('WEATHER_TILE_DEG', 0.1),
+                    fresh_ttl={'current': cfg.get('WEATHER_CURRENT_TTL', 600),
+                               'forecast': cfg.get('WEATHER_FORECAST_TTL', 3600)},
+                )
+    return _service
@@ -0,0 +1,286 @@
+"""Write-behind buffer for append-only history tables.
+
+Request handlers call ``record(table, row)`` which only appends to an
+in-memory queue. A background thread turns each queue into one multi-row
+INSERT every ``flush_rows`` rows or ``flush_ms`` milliseconds. If MySQL is
+unreachable, or a queue is full, rows go to a per-process JSON Lines journal
+that is replayed once the database is back.
+
+A batch the database rejects for its content (a value out of range for a
+DECIMAL column, a missing user id, ...; see ``ROW_ERRNOS``) is retried row by
+row. Rows that still
+fail go to ``<journal dir>/dead/<table>.jsonl`` with the error, so one bad row
+neither blocks the rest of the batch nor gets replayed forever.
+"""
+import atexit
+import collections
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+from mysql.connector import errorcode, errors as db_errors
+
+from utils.db import get_conn
+
+log = logging.getLogger(__name__)
+
+TABLES = {
+    'pest_detections': ('user_id', 'image_path', 'pest_name', 'confidence_score',
+                        'recommendations'),
+    'soil_tests': ('user_id', 'ph_level', 'nitrogen_level', 'phosphorus_level',
+                   'potassium_level', 'organic_matter', 'moisture_content',
+                   'recommendations'),
+    'chat_history': ('user_id', 'message', 'response'),
+}
+
+
+# Errors about the rows themselves. Anything else, including ProgrammingError
+# for a missing table or column after a bad deploy, means the database cannot
+# take these rows yet: they are journaled and replayed rather than dead-lettered
+ROW_ERRNOS = frozenset((
+    errorcode.ER_NO_REFERENCED_ROW, errorcode.ER_NO_REFERENCED_ROW_2,  # unknown user id
+    errorcode.ER_BAD_NULL_ERROR, errorcode.ER_DUP_ENTRY, errorcode.ER_CHECK_CONSTRAINT_VIOLATED,
+    errorcode.ER_DATA_TOO_LONG, errorcode.ER_WARN_DATA_OUT_OF_RANGE, errorcode.ER_DATA_OUT_OF_RANGE,
+    errorcode.WARN_DATA_TRUNCATED, errorcode.ER_TRUNCATED_WRONG_VALUE,
+    errorcode.ER_TRUNCATED_WRONG_VALUE_FOR_FIELD, errorcode.ER_INVALID_CHARACTER_STRING,
+))
+
+
+def is_row_error(error):
+    return isinstance(error, db_errors.DataError) or getattr(error, 'errno', None) in ROW_ERRNOS
+
+
+def _insert_sql(table):
+    cols = TABLES[table]
+    return (f"INSERT INTO {table} ({', '.join(cols)}) "
+            f"VALUES ({', '.join(['%s'] * len(cols))})")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class WriteBehind:
+    def __init__(self, app, journal_dir, flush_rows=200, flush_ms=500, max_queue=10000):
+        self.app = app
+        self.journal_dir = journal_dir
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_ms / 1000.0
+        self.max_queue = max_queue
+        self._queues = {table: [] for table in TABLES}
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._stopped = False
+        self._db_down_until = 0.0
+        self.stats_counters = {'queued': 0, 'written': 0, 'flushes': 0,
+                               'spilled': 0, 'replayed': 0, 'errors': 0, 'dead_lettered': 0}
+        os.makedirs(journal_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, table, row):
+        """Queue one row (a tuple in ``TABLES[table]`` column order)."""
+        row = tuple(row)
+        with self._cond:
+            queue = self._queues[table]
+            if len(queue) >= self.max_queue:
+                spill = True
+            else:
+                spill = False
+                queue.append(row)
+                self.stats_counters['queued'] += 1
+                if len(queue) >= self.flush_rows:
+                    self._cond.notify()
+        if spill:
+            self._spill(table, [row])
+
+    def record_many(self, table, rows):
+        """Queue many rows at once; whatever does not fit goes to the journal."""
+        rows = [tuple(row) for row in rows]
+        with self._cond:
+            queue = self._queues[table]
+            room = max(0, self.max_queue - len(queue))
+            queue.extend(rows[:room])
+            self.stats_counters['queued'] += min(room, len(rows))
+            self._cond.notify()
+        if len(rows) > room:
+            self._spill(table, rows[room:])
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+                if self._stopped:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far; safe to call from any thread."""
+        with self._io_lock:
+            with self._cond:
+                batches = {t: q for t, q in self._queues.items() if q}
+                for table in batches:
+                    self._queues[table] = []
+            if time.monotonic() < self._db_down_until:
+                for table, rows in batches.items():
+                    self._spill(table, rows)
+                return
+            try:
+                with self.app.app_context():
+                    self._write(batches)
+                    self._replay()
+            except Exception:
+                log.exception('Write-behind flush failed; spilling to journal')
+                self.stats_counters['errors'] += 1
+                # Back off so a dead database is not retried on every tick
+                self._db_down_until = time.monotonic() + 5.0
+                for table, rows in batches.items():
+                    self._spill(table, rows)
+
+    def _write(self, batches):
+        """Insert each table's rows, removing them from ``batches`` once stored
+        (or dead-lettered). Raises only when the database is unavailable."""
+        if not batches:
+            return
+        conn = get_conn()
+        try:
+            cursor = conn.cursor()
+            try:
+                for table in list(batches):
+                    rows = batches[table]
+                    try:
+                        cursor.executemany(_insert_sql(table), rows)
+                        conn.commit()
+                    except db_errors.Error as e:
+                        if not is_row_error(e):
+                            raise
+                        conn.rollback()
+                        self._write_rows(conn, cursor, table, batches)
+                    else:
+                        self.stats_counters['written'] += len(rows)
+                    del batches[table]
+                self.stats_counters['flushes'] += 1
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+    def _write_rows(self, conn, cursor, table, batches):
+        """Row-by-row fallback for a rejected batch. ``batches[table]`` shrinks as
+        rows are settled, so a connection error part way re-spills only the rest."""
+        sql = _insert_sql(table)
+        pending = batches[table] = collections.deque(batches[table])
+        while pending:
+            row = pending[0]
+            try:
+                cursor.execute(sql, row)
+                conn.commit()
+                self.stats_counters['written'] += 1
+            except db_errors.Error as e:
+                if not is_row_error(e):
+                    raise
+                conn.rollback()
+                self._dead_letter(table, row, e)
+            pending.popleft()
+
+    def _dead_letter(self, table, row, error):
+        log.warning('Write-behind: %s row rejected (%s); moved to dead letters', table, error)
+        dead_dir = os.path.join(self.journal_dir, 'dead')
+        os.makedirs(dead_dir, exist_ok=True)
+        entry = {'row': row, 'error': str(error), 'at': time.time(), 'pid': os.getpid()}
+        with open(os.path.join(dead_dir, f'{table}.jsonl'), 'a', encoding='utf-8') as fh:
+            fh.write(json.dumps(entry, default=str) + '\n')
+        self.stats_counters['dead_lettered'] += 1
+
+    def _journal_path(self, table, pid=None):
+        return os.path.join(self.journal_dir, f'{table}.{pid or os.getpid()}.jsonl')
+
+    def _spill(self, table, rows):
+        with open(self._journal_path(table), 'a', encoding='utf-8') as fh:
+            for row in rows:
+                fh.write(json.dumps(row, default=str) + '\n')
+        self.stats_counters['spilled'] += len(rows)
+
+    def _replay(self):
+        """Insert journaled rows from this process or from dead workers."""
+        for path in glob.glob(os.path.join(self.journal_dir, '*.jsonl')):
+            table, pid, _ = os.path.basename(path).rsplit('.', 2)
+            if table not in TABLES or not pid.isdigit():
+                continue
+            if int(pid) != os.getpid() and _pid_alive(int(pid)):
+                continue
+            claimed = f'{path}.{os.getpid()}.replay'
+            try:
+                os.replace(path, claimed)
+            except OSError:
+                continue
+            with open(claimed, encoding='utf-8') as fh:
+                rows = [tuple(json.loads(line)) for line in fh if line.strip()]
+            batch = {table: rows}
+            try:
+                self._write(batch)
+            except Exception:
+                # Journal only what was not stored, so nothing is inserted twice
+                self._spill(table, batch.get(table, []))
+                os.remove(claimed)
+                raise
+            os.remove(claimed)
+            self.stats_counters['replayed'] += len(rows)
+
+    def close(self):
+        """Stop the flusher and drain what is left (runs at worker exit)."""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify()
+        self._db_down_until = 0.0
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            depth = {t: len(q) for t, q in self._queues.items()}
+        return dict(self.stats_counters, queue_depth=depth)
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_write_behind():
+    """Return this process's writer, started lazily after a fork."""
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer_pid != os.getpid():
+                app = current_app._get_current_object()
+                cfg = app.config
+                _writer = WriteBehind(
+                    app,
+                    cfg.get('WRITE_BEHIND_JOURNAL_DIR') or os.path.join(app.root_path, 'journal'),
+                    flush_rows=cfg.get('WRITE_BEHIND_FLUSH_ROWS', 200),
+                    flush_ms=cfg.get('WRITE_BEHIND_FLUSH_MS', 500),
+                    max_queue=cfg.get('WRITE_BEHIND_MAX_QUEUE', 10000),
+                )
+                _writer_pid = os.getpid()
+    return _writer
+
+
+def record(table, row):
+    get_write_behind().record(table, row)
+
+
+def record_many(table, rows):
+    get_write_behind().record_many(table, rows)